@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 import sys
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config, Csv
 from datetime import timedelta
 from decimal import Decimal
@@ -81,6 +82,9 @@ CORS_ALLOWED_ORIGINS = config(
     cast=Csv(),
 )
 CORS_ALLOW_CREDENTIALS = True
+# Let the app revalidate API reads with If-None-Match and see the ETag.
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag', 'Content-Disposition']
 DEFAULT_VAT_RATE = config("DEFAULT_VAT_RATE", default="0", cast=Decimal)
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 SECURE_SSL_REDIRECT = config("SECURE_SSL_REDIRECT", default=not DEBUG, cast=bool)
@@ -141,6 +145,25 @@ else:
         'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
     }
 
+# Changes committed within this many seconds of each other are sent to the
+# activity websocket as one event, so bursts such as imports make clients
+# refetch once. 0 sends each committed change straight away.
+REALTIME_DEBOUNCE_SECONDS = 0 if 'test' in sys.argv else config(
+    'REALTIME_DEBOUNCE_SECONDS', default=0, cast=float
+)
+
+# Change journal sequences and updated_at stamps are taken before their
+# transaction commits. The change feed only skips a missing sequence once the
+# entries after it are this old, and ?updated_since= pulls hand back a
+# watermark this far behind the query, so it must exceed the longest write
+# transaction.
+#
+# Journal entries and delete tombstones older than the retention are pruned
+# by prune_change_journal; clients whose cursor or updated_since predates
+# them are told to reload.
+CHANGE_FEED_SETTLE_SECONDS = config('CHANGE_FEED_SETTLE_SECONDS', default=60, cast=int)
+CHANGE_JOURNAL_RETENTION_DAYS = config('CHANGE_JOURNAL_RETENTION_DAYS', default=30, cast=int)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -264,6 +287,30 @@ ADMIN_SIGNUP_CODE = config('ADMIN_SIGNUP_CODE', default='')
 STOCK_RESERVATION_SECONDS = config('STOCK_RESERVATION_SECONDS', default=120, cast=int)
 OFFLINE_STOCK_SAFETY_THRESHOLD = config('OFFLINE_STOCK_SAFETY_THRESHOLD', default=2, cast=int)
 
+# The reorder forecast averages the last REORDER_RECENT_DAYS of sales, shapes
+# it by weekday over REORDER_FORECAST_WINDOW_DAYS, and suggests a reorder point
+# that covers the supplier lead time plus a few safety days.
+REORDER_FORECAST_WINDOW_DAYS = config('REORDER_FORECAST_WINDOW_DAYS', default=56, cast=int)
+REORDER_RECENT_DAYS = config('REORDER_RECENT_DAYS', default=28, cast=int)
+REORDER_LEAD_TIME_DAYS = config('REORDER_LEAD_TIME_DAYS', default=7, cast=int)
+REORDER_SAFETY_DAYS = config('REORDER_SAFETY_DAYS', default=3, cast=int)
+
+# The operations summary is served from a cached snapshot that committed
+# writes patch in place. The lifetime bounds how long a snapshot that missed
+# a delta can stay wrong. Tests read the database directly because their
+# transactions never commit. Set to 0 to disable the snapshot.
+OPERATIONS_SUMMARY_CACHE_SECONDS = 0 if 'test' in sys.argv else config(
+    'OPERATIONS_SUMMARY_CACHE_SECONDS', default=300, cast=int
+)
+
+# Product and customer list responses are cached under the current version
+# of their resource, so a committed write retires them at once; the timeout
+# only bounds how long unused entries linger. Disabled in tests for the same
+# reason as the operations snapshot. Set to 0 to disable.
+API_RESPONSE_CACHE_SECONDS = 0 if 'test' in sys.argv else config(
+    'API_RESPONSE_CACHE_SECONDS', default=600, cast=int
+)
+
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('JWT',),
    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -0,0 +1,158 @@
+"""Durable change journal behind ``/api/changes/`` and websocket catch-up.
+
+The realtime signal handlers pass the rows they publish to ``record``
+before the transaction commits, so the journal and the data can never
+disagree. A client remembers the highest ``sequence`` it applied and, after
+a reconnect, reads only the entries after it.
+
+Sequences are handed out when an entry is inserted, not when its
+transaction commits, so a higher sequence can become visible while a lower
+one is still in flight. ``changes_since`` therefore never moves a cursor
+past a gap until the entries after it are older than
+``CHANGE_FEED_SETTLE_SECONDS``, by which time the missing sequence has either
+committed or been rolled back for good.
+
+``prune`` drops entries and tombstones older than
+``CHANGE_JOURNAL_RETENTION_DAYS``. A cursor from before the oldest retained
+entry gets ``resync`` instead of a page, and the client reloads its data
+before resuming from ``next_since``.
+"""
+
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import ChangeEntry, Tombstone
+from .realtime import collect_change
+
+
+JOURNALED_RESOURCES = ("products", "sales", "customers")
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+_batch = threading.local()
+
+
+def record(rows):
+    """Journal ``{resource: [row, ...]}``; return the last sequence written.
+
+    Inside ``batched()`` nothing is written yet and None is returned.
+    """
+    entries = [
+        ChangeEntry(
+            resource=resource,
+            object_id=row["id"],
+            deleted=bool(row.get("deleted")),
+            data={key: value for key, value in row.items() if key not in ("id", "deleted")},
+        )
+        for resource, resource_rows in (rows or {}).items()
+        if resource in JOURNALED_RESOURCES
+        for row in resource_rows
+    ]
+    pending = getattr(_batch, "entries", None)
+    if pending is not None:
+        pending.extend(entries)
+        return None
+    return write(entries)
+
+
+def write(entries):
+    if not entries:
+        return None
+    return max(entry.id for entry in ChangeEntry.objects.bulk_create(entries))
+
+
+@contextmanager
+def batched():
+    """Write every entry recorded inside the block with one INSERT.
+
+    Used where many rows are saved together, such as the per-product saves
+    of a checkout, so journaling stays one statement per operation. The
+    block must run inside ``transaction.atomic``: if it fails, the rows it
+    saved are rolled back along with the entries that are never written.
+    """
+    if getattr(_batch, "entries", None) is not None:
+        yield
+        return
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("changes.batched() must be used inside transaction.atomic.")
+    entries = _batch.entries = []
+    try:
+        yield
+    finally:
+        _batch.entries = None
+    sequence = write(entries)
+    if sequence is not None:
+        collect_change((), None, journal_sequence=sequence)
+
+
+def entry_payload(entry):
+    row = {"id": entry.object_id, **entry.data}
+    if entry.deleted:
+        row["deleted"] = True
+    return {"sequence": entry.id, "resource": entry.resource, "row": row}
+
+
+def _settled_before():
+    return now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+
+def settled_head():
+    """The highest sequence no open transaction can still fall below."""
+    entries = ChangeEntry.objects.order_by("-id").values_list("id", flat=True)
+    head = entries.filter(created_at__lte=_settled_before()).first()
+    if head is None:
+        oldest = ChangeEntry.objects.order_by("id").values_list("id", flat=True).first()
+        head = oldest - 1 if oldest is not None else 0
+    return head
+
+
+def changes_since(since, limit=DEFAULT_LIMIT):
+    """Entries after ``since`` in sequence order, as an API/websocket page.
+
+    ``resync`` is set when entries after ``since`` have been pruned; the
+    page is then empty and ``next_since`` is where to resume after reloading.
+    """
+    oldest = ChangeEntry.objects.order_by("id").values_list("id", flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        return {"results": [], "next_since": settled_head(), "has_more": False, "resync": True}
+
+    settled_before = _settled_before()
+    entries = list(ChangeEntry.objects.filter(id__gt=since).order_by("id")[:limit + 1])
+    has_more = len(entries) > limit
+    page, cursor = [], since
+    for entry in entries[:limit]:
+        # A gap is an entry still in flight or one rolled back. Only once
+        # the entry after it has settled is the gap known to be permanent.
+        if entry.id != cursor + 1 and entry.created_at > settled_before:
+            has_more = False
+            break
+        page.append(entry)
+        cursor = entry.id
+    return {
+        "results": [entry_payload(entry) for entry in page],
+        "next_since": cursor,
+        "has_more": has_more,
+        "resync": False,
+    }
+
+
+def prune(older_than):
+    """Delete entries and tombstones from before ``older_than``.
+
+    The newest entry is always kept so the start of the retained range, and
+    with it which cursors are stale, stays known. Returns how many entries
+    and tombstones went.
+    """
+    tombstones, _ = Tombstone.objects.filter(deleted_at__lt=older_than).delete()
+    newest = ChangeEntry.objects.order_by("-id").values_list("id", flat=True).first()
+    if newest is None:
+        return 0, tombstones
+    entries, _ = ChangeEntry.objects.filter(
+        created_at__lt=older_than, id__lt=newest
+    ).delete()
+    return entries, tombstones
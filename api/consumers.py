@@ -1,5 +1,9 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from . import changes
 from .realtime import ACTIVITY_GROUP
 
 
@@ -11,6 +15,27 @@ class ActivityConsumer(AsyncJsonWebsocketConsumer):
             return
         await self.channel_layer.group_add(ACTIVITY_GROUP, self.channel_name)
         await self.accept()
+        await self.send_backlog()
+
+    async def send_backlog(self):
+        """Replay journal entries after ``?since=`` for a reconnecting client.
+
+        Sent as one ``backlog`` message; when ``has_more`` is set the client
+        reads the rest from ``/api/changes/``, and when ``resync`` is set the
+        cursor predates the retained journal and the client reloads instead.
+        """
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            since = int(query["since"][0])
+        except (KeyError, ValueError):
+            return
+        page = await database_sync_to_async(changes.changes_since)(max(since, 0))
+        await self.send_json({
+            "backlog": page["results"],
+            "next_since": page["next_since"],
+            "has_more": page["has_more"],
+            "resync": page["resync"],
+        })
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(ACTIVITY_GROUP, self.channel_name)
@@ -0,0 +1,281 @@
+"""Streaming CSV and XLSX exports of sales and stock records.
+
+Each dataset is a flat ``values_list`` query over a date range, read with
+``.iterator(chunk_size=...)`` so rows come off a server-side cursor without
+building model instances or nested serializers. The writers are generators
+that yield encoded chunks of roughly ``FLUSH_BYTES``, so memory stays flat
+however long the range is.
+
+The XLSX writer uses only the standard library, like the Paybox360 reader:
+the worksheet is written row by row into a zip stream with inline strings,
+so no shared-strings table has to be held while writing.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from xml.sax.saxutils import escape
+
+from django.utils.timezone import localtime, make_aware
+
+from inventory.models import InventoryMovement
+from sales.models import Payment, Refund, Sale, SaleItem
+
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _line_total(row):
+    quantity, unit_price = row[-2], row[-1]
+    return (*row, (quantity * unit_price).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+def _movements(date_from, date_to):
+    return InventoryMovement.objects.filter(
+        event_at__gte=make_aware(datetime.combine(date_from, time.min)),
+        event_at__lt=make_aware(datetime.combine(date_to + timedelta(days=1), time.min)),
+    )
+
+
+# Dataset name -> (queryset for a date range, [(column, field)], row transform)
+DATASETS = {
+    "sales": (
+        lambda start, end: Sale.objects.filter(date__gte=start, date__lte=end),
+        [
+            ("Invoice", "invoice_number"), ("Date", "date"), ("Sold at", "sold_at"),
+            ("Customer", "customer__name"), ("Salesperson", "user__username"),
+            ("Device", "device_id"), ("Subtotal", "subtotal"), ("Discount", "discount"),
+            ("VAT", "vat_amount"), ("Total", "total"), ("Paid", "amount_paid"),
+            ("Credited", "amount_credited"), ("Refunded", "amount_refunded"),
+            ("Receivable", "receivable"), ("Refund due", "refund_due"),
+            ("Status", "payment_status"), ("Offline", "offline_created"),
+        ],
+        None,
+    ),
+    "sale-lines": (
+        lambda start, end: SaleItem.objects.filter(sale__date__gte=start, sale__date__lte=end),
+        [
+            ("Invoice", "sale__invoice_number"), ("Date", "sale__date"),
+            ("Product ID", "product_id"), ("Product", "product__name"),
+            ("Quantity", "quantity"), ("Unit price", "unit_price"),
+        ],
+        _line_total,
+    ),
+    "payments": (
+        lambda start, end: Payment.objects.filter(date__gte=start, date__lte=end),
+        [
+            ("Invoice", "sale__invoice_number"), ("Date", "date"), ("Method", "method"),
+            ("Amount", "amount"), ("Reference", "reference"), ("Recorded at", "created_at"),
+        ],
+        None,
+    ),
+    "refunds": (
+        lambda start, end: Refund.objects.filter(date__gte=start, date__lte=end),
+        [
+            ("Invoice", "sale__invoice_number"), ("Date", "date"), ("Method", "method"),
+            ("Amount", "amount"), ("Reference", "reference"),
+            ("Recorded by", "user__username"), ("Recorded at", "created_at"),
+        ],
+        None,
+    ),
+    "movements": (
+        _movements,
+        [
+            ("Happened at", "event_at"), ("Product ID", "product_id"),
+            ("Product", "product__name"), ("Reason", "reason"), ("Quantity", "quantity"),
+            ("Stock after", "stock_after"), ("Invoice", "sale__invoice_number"),
+            ("User", "user__username"), ("Device", "device_id"),
+            ("Reference", "client_reference"), ("Note", "note"),
+        ],
+        None,
+    ),
+}
+
+
+def header(dataset):
+    columns = [name for name, _field in DATASETS[dataset][1]]
+    if dataset == "sale-lines":
+        columns.append("Line total")
+    return columns
+
+
+def rows(dataset, date_from, date_to, chunk_size=CHUNK_SIZE):
+    """Yield the dataset's rows for the inclusive date range, oldest first."""
+    queryset, columns, transform = DATASETS[dataset]
+    values = queryset(date_from, date_to).order_by("pk").values_list(
+        *(field for _name, field in columns)
+    )
+    for row in values.iterator(chunk_size=chunk_size):
+        yield transform(row) if transform else row
+
+
+# Leading characters that make a spreadsheet treat a cell as a formula.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return localtime(value).isoformat()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        # Names, notes and references are typed by users; a leading quote
+        # keeps them as text when the export is opened.
+        return f"'{value}"
+    return str(value)
+
+
+def _buffered(pieces):
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def csv_chunks(columns, records):
+    """Encode a header and rows as UTF-8 CSV, in chunks."""
+    def lines():
+        line = io.StringIO()
+        writer = csv.writer(line)
+        # The byte-order mark lets spreadsheet programs detect UTF-8.
+        line.write("\ufeff")
+        writer.writerow(columns)
+        for row in records:
+            writer.writerow([_text(value) for value in row])
+            yield line.getvalue().encode()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue().encode()
+
+    return _buffered(lines())
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable file object collecting whatever the zip writer emits."""
+
+    def __init__(self):
+        self.pieces = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.pieces)
+        self.pieces.clear()
+        return data
+
+
+# Characters XML 1.0 cannot carry at all.
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _column_letters(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _row_xml(number, values, columns):
+    # Numbers stay numeric so totals can be summed in the spreadsheet;
+    # everything else, dates included, is an inline string.
+    cells = []
+    for column, value in zip(columns, values):
+        reference = f"{column}{number}"
+        if isinstance(value, (int, Decimal, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+        else:
+            text = escape(_INVALID_XML.sub("", _text(value)))
+            cells.append(
+                f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+            )
+    return f'<row r="{number}">{"".join(cells)}</row>'.encode()
+
+
+def xlsx_chunks(columns, records, sheet_name="Export"):
+    """Write a one-sheet XLSX workbook as a stream of zip chunks."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name[:31])))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield sink.drain()
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            letters = [_column_letters(index) for index in range(len(columns))]
+            sheet.write(_row_xml(1, columns, letters))
+            written = 0
+            for number, row in enumerate(records, start=2):
+                data = _row_xml(number, row, letters)
+                sheet.write(data)
+                written += len(data)
+                if written >= FLUSH_BYTES:
+                    yield sink.drain()
+                    written = 0
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+def export_chunks(dataset, file_format, date_from, date_to, chunk_size=CHUNK_SIZE):
+    records = rows(dataset, date_from, date_to, chunk_size)
+    if file_format == "xlsx":
+        return xlsx_chunks(header(dataset), records, sheet_name=dataset)
+    return csv_chunks(header(dataset), records)
+
+
+def filename(dataset, file_format, date_from, date_to):
+    return f"{dataset}-{date_from.isoformat()}-to-{date_to.isoformat()}.{file_format}"
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from api import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete change journal entries and delete tombstones older than the "
+        "retention period. Clients whose cursor or updated_since is older "
+        "than what remains are told to reload."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.CHANGE_JOURNAL_RETENTION_DAYS,
+            help=(
+                "Keep this many most recent days. It cannot be below "
+                "CHANGE_JOURNAL_RETENTION_DAYS, which ?updated_since= pulls "
+                "rely on to know which tombstones still exist."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < settings.CHANGE_JOURNAL_RETENTION_DAYS:
+            raise CommandError(
+                f"--days cannot be below CHANGE_JOURNAL_RETENTION_DAYS "
+                f"({settings.CHANGE_JOURNAL_RETENTION_DAYS})."
+            )
+        entries, tombstones = changes.prune(now() - timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {entries} change journal entry(ies) and {tombstones} tombstone(s)."
+        ))
@@ -0,0 +1,34 @@
+"""Counters shared by every backend process, kept in the default cache.
+
+They count since the cache was last flushed and are meant for spotting
+trends (hit rates, sweep sizes), not for accounting.
+"""
+
+from django.core.cache import cache
+
+
+CACHE_PREFIX = "metrics"
+COUNTERS = (
+    "response_cache.products.hit", "response_cache.products.miss",
+    "response_cache.customers.hit", "response_cache.customers.miss",
+    "reservation_sweep.runs", "reservation_sweep.batches",
+    "reservation_sweep.products", "reservation_sweep.reservations",
+    "reorder_forecast.runs", "reorder_forecast.products",
+)
+
+
+def _key(name):
+    return f"{CACHE_PREFIX}:{name}"
+
+
+def incr(name, amount=1):
+    try:
+        cache.incr(_key(name), amount)
+    except ValueError:
+        cache.add(_key(name), 0, timeout=None)
+        cache.incr(_key(name), amount)
+
+
+def snapshot():
+    found = cache.get_many([_key(name) for name in COUNTERS])
+    return {name: found.get(_key(name), 0) for name in COUNTERS}
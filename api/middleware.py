@@ -1,9 +1,11 @@
 class ApiNoCacheMiddleware:
-    """Mark API responses as non-cacheable.
+    """Stop browsers from serving stale copies of API responses.
 
     Without an explicit Cache-Control header some browsers (notably Safari)
     may serve a cached copy of GET endpoints, so a list page can show stale
-    data right after a write until the user hard-reloads.
+    data right after a write until the user hard-reloads. Responses with an
+    ETag may be stored but must be revalidated on every use; everything
+    else is ``no-store``.
     """
 
     def __init__(self, get_response):
@@ -12,5 +14,8 @@ class ApiNoCacheMiddleware:
     def __call__(self, request):
         response = self.get_response(request)
         if request.path.startswith("/api/") and "Cache-Control" not in response:
-            response["Cache-Control"] = "no-store"
+            if response.has_header("ETag"):
+                response["Cache-Control"] = "private, no-cache"
+            else:
+                response["Cache-Control"] = "no-store"
         return response
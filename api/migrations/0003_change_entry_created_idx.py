@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='changeentry',
+            index=models.Index(fields=['created_at'], name='change_entry_created_idx'),
+        ),
+    ]
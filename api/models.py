@@ -1,5 +1,45 @@
 from django.db import models
 
-# Create your models here.
 
-pass
+class ChangeEntry(models.Model):
+    """Append-only journal of changed rows, numbered by ``id``.
+
+    Entries are written in the same transaction as the change they record,
+    so a client that missed websocket events can ask for everything after
+    the last sequence it applied.
+    """
+    id = models.BigAutoField(primary_key=True)
+    resource = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "change entries"
+        indexes = [
+            models.Index(fields=["created_at"], name="change_entry_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.resource}#{self.object_id}"
+
+
+class Tombstone(models.Model):
+    """Marker left behind when a row that devices mirror is deleted.
+
+    ``?updated_since=`` pulls return the ids deleted after the watermark so
+    a local copy can drop them.
+    """
+    resource = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["resource", "deleted_at"], name="tombstone_resource_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.resource}#{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,185 @@
+"""Cached operations-summary snapshot maintained by committed deltas.
+
+Every write fans out an ``operations`` event and every connected till then
+re-reads the summary, so the figures are kept in the cache as one snapshot
+per business date. The signal handlers in ``api.signals`` move individual
+figures with ``cache.incr`` after commit; the snapshot is only rebuilt from
+the database when it is missing, which includes the first read of a new day.
+
+Money is stored in kobo so every figure is an integer the cache backend can
+increment atomically across processes.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Sum
+from django.utils.timezone import localdate
+
+from inventory.models import Product
+from sales.models import DailySalesRollup, Payment, Sale
+
+
+CACHE_PREFIX = "operations-summary"
+PAYMENT_METHODS = tuple(choice[0] for choice in Payment.METHOD_CHOICES)
+FIELDS = (
+    "sales_total", "sale_count",
+    *(f"payments:{method}" for method in PAYMENT_METHODS),
+    "low_stock_count", "inventory_attention_count",
+    "outstanding_total", "refunds_due_total",
+)
+
+
+def _key(day, field):
+    return f"{CACHE_PREFIX}:{day.isoformat()}:{field}"
+
+
+def _kobo(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def _naira(kobo):
+    return str((Decimal(kobo) / 100).quantize(Decimal("0.01")))
+
+
+def build_snapshot(day):
+    """Read every summary figure from the database."""
+    # Takings come from the day's handful of rollup rows rather than every
+    # sale and payment recorded today.
+    rollup = DailySalesRollup.objects.filter(date=day)
+    sales = rollup.aggregate(total=Sum("sales_total"), count=Sum("sale_count"))
+    payments = dict(
+        rollup.exclude(method="").values_list("method").annotate(total=Sum("payments_total"))
+        .order_by()
+    )
+    # Settlement totals are stored on each sale, so only invoices with an
+    # open balance either way are read, through their partial index.
+    open_balances = Sale.objects.filter(
+        Q(receivable__gt=0) | Q(refund_due__gt=0)
+    ).aggregate(outstanding=Sum("receivable"), refunds_due=Sum("refund_due"))
+    snapshot = {
+        "sales_total": _kobo(sales["total"]),
+        "sale_count": sales["count"] or 0,
+        "low_stock_count": Product.objects.filter(stock__lte=F("reorder_point")).count(),
+        "inventory_attention_count": Sale.objects.filter(
+            inventory_attention=True, inventory_resolution=""
+        ).count(),
+        "outstanding_total": _kobo(open_balances["outstanding"]),
+        "refunds_due_total": _kobo(open_balances["refunds_due"]),
+    }
+    for method in PAYMENT_METHODS:
+        snapshot[f"payments:{method}"] = _kobo(payments.get(method))
+    return snapshot
+
+
+def get_summary():
+    """Return today's summary, rebuilding the cached snapshot on a miss."""
+    day = localdate()
+    timeout = settings.OPERATIONS_SUMMARY_CACHE_SECONDS
+    keys = {field: _key(day, field) for field in FIELDS}
+    cached = cache.get_many(keys.values()) if timeout > 0 else {}
+    if len(cached) == len(keys):
+        snapshot = {field: cached[key] for field, key in keys.items()}
+    else:
+        snapshot = build_snapshot(day)
+        if timeout > 0:
+            cache.set_many(
+                {keys[field]: value for field, value in snapshot.items()}, timeout
+            )
+    return {
+        "date": day,
+        "sales_total": _naira(snapshot["sales_total"]),
+        "sale_count": snapshot["sale_count"],
+        "payments": {
+            method: _naira(snapshot[f"payments:{method}"]) for method in PAYMENT_METHODS
+        },
+        "low_stock_count": snapshot["low_stock_count"],
+        "inventory_attention_count": snapshot["inventory_attention_count"],
+        "outstanding_total": _naira(snapshot["outstanding_total"]),
+        "refunds_due_total": _naira(snapshot["refunds_due_total"]),
+    }
+
+
+def invalidate(day=None):
+    cache.delete_many([_key(day or localdate(), field) for field in FIELDS])
+
+
+def apply_delta(day, delta):
+    """Move a day's cached figures; drop the snapshot if any figure is gone.
+
+    A partially expired snapshot cannot be patched safely, so it is removed
+    and the next read rebuilds it. ``None`` means the change could not be
+    expressed as a delta and always drops the snapshot.
+    """
+    if delta is None:
+        invalidate(day)
+        return
+    for field, amount in delta.items():
+        if not amount:
+            continue
+        try:
+            cache.incr(_key(day, field), amount)
+        except ValueError:
+            invalidate(day)
+            return
+
+
+# Row state the signal handlers compare before and after each write. A value
+# of None means the instance was loaded with deferred fields, so its previous
+# contribution is unknown.
+
+SALE_STATE_FIELDS = (
+    "date", "total", "receivable", "refund_due",
+    "inventory_attention", "inventory_resolution",
+)
+PRODUCT_STATE_FIELDS = ("stock", "reorder_point")
+PAYMENT_STATE_FIELDS = ("date", "method", "amount")
+
+
+def row_state(instance, fields):
+    if instance.pk is None:
+        return {}
+    try:
+        return {field: instance.__dict__[field] for field in fields}
+    except KeyError:
+        return None
+
+
+def sale_figures(state, day):
+    if not state:
+        return {}
+    figures = {
+        "outstanding_total": _kobo(state["receivable"]),
+        "refunds_due_total": _kobo(state["refund_due"]),
+        "inventory_attention_count": int(
+            bool(state["inventory_attention"]) and not state["inventory_resolution"]
+        ),
+    }
+    if state["date"] == day:
+        figures["sale_count"] = 1
+        figures["sales_total"] = _kobo(state["total"])
+    return figures
+
+
+def product_figures(state, day):
+    if not state:
+        return {}
+    return {"low_stock_count": int(state["stock"] <= state["reorder_point"])}
+
+
+def payment_figures(state, day):
+    if not state or state["date"] != day or state["method"] not in PAYMENT_METHODS:
+        return {}
+    return {f"payments:{state['method']}": _kobo(state["amount"])}
+
+
+def figures_delta(figures, before, after, day):
+    """Difference in summary figures between two row states, or None."""
+    if before is None or after is None:
+        return None
+    old, new = figures(before, day), figures(after, day)
+    return {
+        field: new.get(field, 0) - old.get(field, 0)
+        for field in set(old) | set(new)
+    }
@@ -1,18 +1,185 @@
+import threading
+import time
+from contextlib import contextmanager
+
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import versions
 
 
 ACTIVITY_GROUP = "business_activity"
+SEQUENCE_KEY = "realtime-change-sequence"
+
+_coalescing = threading.local()
+_debounce_lock = threading.Lock()
+_debounced = {"collector": None, "timer": None}
+
+
+class ChangeCollector:
+    """Resources touched by one database transaction, published on commit.
+
+    A business operation saves several rows (a sale, its products, its
+    payment); each save reports its resources here and the transaction
+    sends a single event when it commits. The event is named after the
+    first source reported, which is the row the operation started with.
+    """
+
+    def __init__(self):
+        self.resources = set()
+        self.rows = {}
+        self.source = None
+        self.journal_sequence = None
+
+    def add(self, resources, source, rows=None, journal_sequence=None):
+        self.resources.update(resources)
+        merge_rows(self.rows, rows)
+        if self.source is None:
+            self.source = source
+        if journal_sequence is not None:
+            self.journal_sequence = max(self.journal_sequence or 0, journal_sequence)
+
+    def publish(self, source=None):
+        publish_change(
+            self.resources, source or self.source, row_lists(self.rows),
+            self.journal_sequence,
+        )
+
+    def flush(self):
+        if getattr(connection, "change_collector", None) is self:
+            connection.change_collector = None
+        versions.bump(self.resources)
+        self.publish()
+
+
+def merge_rows(target, rows):
+    """Merge ``{resource: [row, ...]}`` into ``{resource: {id: row}}``.
+
+    The latest state of a row replaces any earlier one, except that a
+    deleted row stays deleted.
+    """
+    for resource, resource_rows in (rows or {}).items():
+        merged = target.setdefault(resource, {})
+        for row in resource_rows:
+            if not merged.get(row["id"], {}).get("deleted"):
+                merged[row["id"]] = row
+
+
+def row_lists(rows):
+    return {resource: list(by_id.values()) for resource, by_id in rows.items()}
+
+
+def collect_change(resources, source, rows=None, journal_sequence=None):
+    """Publish a change once the current transaction commits.
+
+    Outside a transaction the change is published straight away. Inside
+    one, every change joins the transaction's collector, whose flush is
+    registered with ``on_commit`` once. A collector whose flush was
+    discarded by a savepoint rollback is replaced. Resource versions move
+    at commit, before any debounce delays the event.
+    """
+    if not connection.in_atomic_block:
+        versions.bump(resources)
+        publish_change(resources, source, rows, journal_sequence)
+        return
+    collector = getattr(connection, "change_collector", None)
+    registered = collector is not None and any(
+        func == collector.flush for _, func, _ in connection.run_on_commit
+    )
+    if not registered:
+        collector = connection.change_collector = ChangeCollector()
+        transaction.on_commit(collector.flush)
+    collector.add(resources, source, rows, journal_sequence)
+
+
+@contextmanager
+def coalesce_changes(source):
+    """Merge every change published inside the block into one event.
+
+    Used by batch operations so clients refetch once per batch rather than
+    once per row. Nested blocks join the outermost one.
+    """
+    if getattr(_coalescing, "collector", None) is not None:
+        yield
+        return
+    collector = _coalescing.collector = ChangeCollector()
+    try:
+        yield
+    finally:
+        _coalescing.collector = None
+        if collector.resources:
+            collector.publish(source)
+
+
+def publish_change(resources, source="backend", rows=None, journal_sequence=None):
+    """Broadcast a committed data change to every authenticated app client.
+
+    ``rows`` maps resource names to lists of changed rows, each a dict
+    with at least an ``id``; ``journal_sequence`` is the last change-journal
+    entry the event covers. With ``REALTIME_DEBOUNCE_SECONDS`` set, changes
+    arriving within the window are merged and sent when it closes.
+    """
+    pending = getattr(_coalescing, "collector", None)
+    if pending is not None:
+        pending.add(resources, source, rows, journal_sequence)
+        return
+    window = settings.REALTIME_DEBOUNCE_SECONDS
+    if window <= 0:
+        send_change(resources, source, rows, journal_sequence)
+        return
+    with _debounce_lock:
+        if _debounced["collector"] is None:
+            _debounced["collector"] = ChangeCollector()
+            timer = threading.Timer(window, flush_debounced)
+            timer.daemon = True
+            _debounced["timer"] = timer
+            timer.start()
+        _debounced["collector"].add(resources, source, rows, journal_sequence)
+
+
+def flush_debounced():
+    with _debounce_lock:
+        collector = _debounced["collector"]
+        _debounced.update(collector=None, timer=None)
+    if collector is not None and collector.resources:
+        send_change(
+            collector.resources, collector.source, row_lists(collector.rows),
+            collector.journal_sequence,
+        )
+
+
+def next_sequence():
+    """Next value of the change sequence shared by every backend process.
+
+    Clients remember the last sequence they saw; a jump means an event was
+    missed and should be recovered from ``/api/changes/``.
+    """
+    cache.add(SEQUENCE_KEY, time.time_ns() // 1000, timeout=None)
+    try:
+        return cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        # Evicted between add and incr; restart above any value handed out.
+        cache.add(SEQUENCE_KEY, time.time_ns() // 1000, timeout=None)
+        return cache.incr(SEQUENCE_KEY)
 
 
-def publish_change(resources, source="backend"):
-    """Broadcast a committed data change to every authenticated app client."""
+def send_change(resources, source, rows=None, journal_sequence=None):
     layer = get_channel_layer()
     if layer is None:
         return
     payload = {
+        "sequence": next_sequence(),
         "resources": sorted(set(resources)),
         "source": source,
+        "changes": {
+            resource: sorted(resource_rows, key=lambda row: row["id"])
+            for resource, resource_rows in (rows or {}).items()
+            if resource_rows
+        },
+        "journal_sequence": journal_sequence,
     }
     async_to_sync(layer.group_send)(
         ACTIVITY_GROUP,
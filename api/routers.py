@@ -3,9 +3,11 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ProductViewSet, CustomerViewSet, NotificationsView,
     HealthView, RealtimeTicketView, OperationsSummaryView, InventoryMovementViewSet,
-    StockReservationView,
+    StockReservationView, ChangeFeedView, MetricsView, ExportView,
+)
+from sales.views import (
+    SaleViewSet, PaymentViewSet, RefundViewSet, CreditNoteViewSet, DailySalesReportView,
 )
-from sales.views import SaleViewSet, PaymentViewSet, RefundViewSet, CreditNoteViewSet
 from users.views import UserAdminViewSet, AccountStatusView, LogoutView
 
 router = DefaultRouter()
@@ -24,6 +26,10 @@ urlpatterns = [
     path('stock-reservations/', StockReservationView.as_view(), name='stock-reservations'),
     path('operations-summary/', OperationsSummaryView.as_view(), name='operations-summary'),
     path('notifications/', NotificationsView.as_view(), name='notifications'),
+    path('changes/', ChangeFeedView.as_view(), name='changes'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('exports/<slug:dataset>.<slug:file_format>', ExportView.as_view(), name='export'),
+    path('reports/daily-sales/', DailySalesReportView.as_view(), name='daily-sales-report'),
     path('auth/account-status/', AccountStatusView.as_view(), name='account-status'),
     path('auth/logout/', LogoutView.as_view(), name='logout'),
     path('', include(router.urls)),
@@ -13,9 +13,13 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             "id", "name", "category", "image", "price", "cost_price", "stock",
-            "reorder_level", "created_at", "updated_at",
+            "reorder_level", "reorder_point", "suggested_reorder_point",
+            "daily_demand", "days_of_cover", "forecast_at", "created_at", "updated_at",
+        ]
+        read_only_fields = [
+            "reorder_point", "suggested_reorder_point", "daily_demand",
+            "days_of_cover", "forecast_at", "created_at", "updated_at",
         ]
-        read_only_fields = ["created_at", "updated_at"]
 
     def validate_name(self, value):
         # Trim and treat names case-insensitively so "Rice", "rice " and
@@ -1,49 +1,132 @@
+from decimal import Decimal
+
 from django.db import transaction
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.utils.timezone import localdate
 
 from customers.models import Customer
+from inventory.quantities import parse_stored_quantity
 from inventory.models import Product
 from sales.models import CreditNote, Payment, Refund, Sale
 from users.models import CustomUser
 
-from .realtime import publish_change
+from . import changes, operations
+from .models import Tombstone
+from .realtime import collect_change
+
+
+def record_change(resources, source, rows=None):
+    """Journal ``rows`` now and publish the change once it commits.
+
+    The ``ChangeEntry`` INSERT runs in the caller's transaction, so it rolls
+    back with the change; only the version bump and event wait for commit.
+    """
+    collect_change(resources, source, rows, changes.record(rows))
+
+
+def changed_row(pk, deleted=False, **fields):
+    """One row of an event's ``changes``; values must be JSON/msgpack safe."""
+    row = {"id": pk, **fields}
+    if deleted:
+        row["deleted"] = True
+    return row
+
+
+def product_row(instance, deleted=False):
+    if deleted:
+        return changed_row(instance.pk, deleted=True)
+    return changed_row(
+        instance.pk,
+        stock=str(parse_stored_quantity(instance.stock, allow_negative=True)),
+        price=str(Decimal(instance.price).quantize(Decimal("0.01"))),
+        updated_at=instance.updated_at.isoformat() if instance.updated_at else None,
+    )
+
+
+# Operations-summary figures move by the difference between the state a row
+# was loaded (or last saved) with and the state it was just written with.
+OPERATIONS_TRACKED = {
+    Sale: (operations.SALE_STATE_FIELDS, operations.sale_figures),
+    Product: (operations.PRODUCT_STATE_FIELDS, operations.product_figures),
+    Payment: (operations.PAYMENT_STATE_FIELDS, operations.payment_figures),
+}
+
+
+@receiver(post_init, sender=Sale)
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=Payment)
+def remember_operations_state(sender, instance, **kwargs):
+    fields, _figures = OPERATIONS_TRACKED[sender]
+    instance._operations_state = operations.row_state(instance, fields)
 
 
-def after_commit(resources, source):
-    transaction.on_commit(lambda: publish_change(resources, source))
+def track_operations(sender, instance, deleted=False):
+    fields, figures = OPERATIONS_TRACKED[sender]
+    after = {} if deleted else operations.row_state(instance, fields)
+    day = localdate()
+    delta = operations.figures_delta(
+        figures, getattr(instance, "_operations_state", None), after, day
+    )
+    instance._operations_state = after
+    transaction.on_commit(lambda: operations.apply_delta(day, delta))
 
 
 @receiver([post_save, post_delete], sender=Product)
-def product_changed(sender, instance, **kwargs):
-    after_commit(["products", "operations", "notifications"], "product")
+def product_changed(sender, instance, signal, **kwargs):
+    deleted = signal is post_delete
+    track_operations(sender, instance, deleted=deleted)
+    if deleted:
+        Tombstone.objects.create(resource="products", object_id=instance.pk)
+    record_change(
+        ["products", "operations", "notifications"], "product",
+        {"products": [product_row(instance, deleted)]},
+    )
 
 
 @receiver([post_save, post_delete], sender=Customer)
-def customer_changed(sender, instance, **kwargs):
-    after_commit(["customers"], "customer")
+def customer_changed(sender, instance, signal, **kwargs):
+    deleted = signal is post_delete
+    if deleted:
+        Tombstone.objects.create(resource="customers", object_id=instance.pk)
+    record_change(["customers"], "customer", {
+        "customers": [changed_row(instance.pk, deleted=deleted)],
+    })
 
 
 @receiver([post_save, post_delete], sender=Sale)
-def sale_changed(sender, instance, **kwargs):
-    after_commit(["sales", "operations", "notifications"], "sale")
+def sale_changed(sender, instance, signal, **kwargs):
+    deleted = signal is post_delete
+    track_operations(sender, instance, deleted=deleted)
+    record_change(["sales", "operations", "notifications"], "sale", {
+        "sales": [changed_row(instance.pk, deleted=deleted)],
+    })
 
 
 @receiver([post_save, post_delete], sender=Payment)
-def payment_changed(sender, instance, **kwargs):
-    after_commit(["sales", "operations", "notifications"], "payment")
+def payment_changed(sender, instance, signal, **kwargs):
+    track_operations(sender, instance, deleted=signal is post_delete)
+    record_change(["sales", "operations", "notifications"], "payment", {
+        "sales": [changed_row(instance.sale_id)],
+    })
 
 
 @receiver([post_save, post_delete], sender=Refund)
 def refund_changed(sender, instance, **kwargs):
-    after_commit(["sales", "operations", "notifications"], "refund")
+    record_change(["sales", "operations", "notifications"], "refund", {
+        "sales": [changed_row(instance.sale_id)],
+    })
 
 
 @receiver([post_save, post_delete], sender=CreditNote)
 def return_changed(sender, instance, **kwargs):
-    after_commit(["sales", "products", "operations", "notifications"], "return")
+    record_change(["sales", "products", "operations", "notifications"], "return", {
+        "sales": [changed_row(instance.sale_id)],
+    })
 
 
 @receiver([post_save, post_delete], sender=CustomUser)
-def team_changed(sender, instance, **kwargs):
-    after_commit(["team"], "team")
+def team_changed(sender, instance, signal, **kwargs):
+    record_change(["team"], "team", {
+        "team": [changed_row(instance.pk, deleted=signal is post_delete)],
+    })
@@ -1,13 +1,33 @@
+import csv
+import io
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
 from asgiref.sync import async_to_sync, sync_to_async
 from channels.testing import WebsocketCommunicator
 from django.conf import settings
-from django.test import TransactionTestCase
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
 from rest_framework.test import APIClient
 
 from AkinfoluFoods.asgi import application
+from customers.models import Customer
+from inventory.models import Product
+from inventory.paybox360 import iter_first_xlsx_sheet
+from sales.services import create_sale
 from users.models import CustomUser
 from users.serializers import MyTokenObtainPairSerializer
-from .realtime import publish_change
+from . import changes
+from .models import ChangeEntry
+from .versions import bump as versions_bump
+from .realtime import flush_debounced, publish_change
 from .realtime_auth import create_websocket_ticket
 
 
@@ -34,14 +54,181 @@ class RealtimeActivityTests(TransactionTestCase):
             )
             connected, _ = await communicator.connect()
             self.assertTrue(connected)
-            await sync_to_async(publish_change)(["sales", "operations"], "test")
+            await sync_to_async(publish_change)(
+                ["sales", "operations"], "test", {"sales": [{"id": 7}]}
+            )
             message = await communicator.receive_json_from(timeout=1)
             self.assertEqual(message["resources"], ["operations", "sales"])
             self.assertEqual(message["source"], "test")
+            self.assertEqual(message["changes"], {"sales": [{"id": 7}]})
+            await sync_to_async(publish_change)(["products"], "test")
+            following = await communicator.receive_json_from(timeout=1)
+            self.assertEqual(following["sequence"], message["sequence"] + 1)
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_batch_sale_sync_publishes_one_coalesced_event(self):
+        customer = Customer.objects.create(user=self.user, name="Batch Buyer")
+        product = Product.objects.create(name="Beans", price=Decimal("500"), stock=10)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        async def scenario():
+            ticket = await sync_to_async(create_websocket_ticket)(self.user)
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/activity/?ticket={ticket}",
+                headers=[(b"origin", settings.CORS_ALLOWED_ORIGINS[0].encode())],
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            response = await sync_to_async(client.post)("/api/v1/sales/sync/", [
+                {
+                    "client_sale_id": client_sale_id,
+                    "customer": customer.id,
+                    "offline_created": True,
+                    "items": [{"product": product.id, "quantity": 1}],
+                    "initial_payment": {"amount": "500.00", "method": "cash"},
+                }
+                for client_sale_id in (
+                    "3c0e8a52-94f1-4c1d-a7b2-6f0d2e9b8a13",
+                    "b7d41f06-2a8e-4c35-9e17-d05c3a6b9f48",
+                )
+            ], format="json")
+            self.assertEqual(response.json()["created"], 2)
+            message = await communicator.receive_json_from(timeout=1)
+            self.assertEqual(message["source"], "sale-sync")
+            self.assertIn("sales", message["resources"])
+            self.assertIn("products", message["resources"])
+            self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_sale_publishes_one_change_event_per_transaction(self):
+        customer = Customer.objects.create(user=self.user, name="Walk-up Buyer")
+        product = Product.objects.create(name="Garri", price=Decimal("800"), stock=10)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with mock.patch("api.realtime.send_change") as send_change:
+            response = client.post("/api/v1/sales/", {
+                "customer": customer.id,
+                "items": [{"product": product.id, "quantity": 2}],
+                "initial_payment": {"amount": "1600.00", "method": "cash"},
+            }, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        send_change.assert_called_once()
+        resources, source, rows, journal_sequence = send_change.call_args.args
+        self.assertEqual(source, "sale")
+        self.assertTrue({"sales", "products", "operations"} <= set(resources))
+        self.assertEqual(rows["sales"], [{"id": response.json()["id"]}])
+        self.assertEqual(journal_sequence, ChangeEntry.objects.latest("id").id)
+        product.refresh_from_db()
+        self.assertEqual(rows["products"], [{
+            "id": product.id,
+            "stock": str(product.stock),
+            "price": str(product.price),
+            "updated_at": product.updated_at.isoformat(),
+        }])
+
+    @override_settings(REALTIME_DEBOUNCE_SECONDS=30)
+    def test_debounce_window_merges_a_burst_of_changes(self):
+        with mock.patch("api.realtime.send_change") as send_change, \
+                mock.patch("threading.Timer") as timer:
+            publish_change(["products"], "import")
+            publish_change(["products", "operations"], "import")
+            send_change.assert_not_called()
+            timer.assert_called_once()
+            flush_debounced()
+        send_change.assert_called_once_with({"products", "operations"}, "import", {}, None)
+
+    def test_reconnecting_client_catches_up_from_the_change_journal(self):
+        product = Product.objects.create(name="Yam", price=Decimal("1200"), stock=4)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        since = client.get("/api/v1/changes/").json()["next_since"]
+        Customer.objects.create(user=self.user, name="Journal Buyer")
+        product.stock = 3
+        product.save()
+        product_id = product.id
+        product.delete()
+
+        page = client.get(f"/api/v1/changes/?since={since}&limit=2").json()
+        self.assertTrue(page["has_more"])
+        self.assertEqual(
+            [entry["resource"] for entry in page["results"]], ["customers", "products"]
+        )
+        self.assertEqual(page["results"][1]["row"]["stock"], "3.0000")
+        rest = client.get(f"/api/v1/changes/?since={page['next_since']}").json()
+        self.assertFalse(rest["has_more"])
+        self.assertEqual(rest["results"][0]["row"], {"id": product_id, "deleted": True})
+        self.assertEqual(client.get("/api/v1/changes/?since=soon").status_code, 400)
+
+        async def scenario():
+            ticket = await sync_to_async(create_websocket_ticket)(self.user)
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/activity/?ticket={ticket}&since={page['next_since']}",
+                headers=[(b"origin", settings.CORS_ALLOWED_ORIGINS[0].encode())],
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            message = await communicator.receive_json_from(timeout=1)
+            self.assertEqual(message["backlog"], rest["results"])
+            self.assertEqual(message["next_since"], rest["next_since"])
             await communicator.disconnect()
 
         async_to_sync(scenario)()
 
+    def test_change_feed_does_not_skip_sequences_committed_out_of_order(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Sequence 2 was allocated first but its transaction commits last.
+        ChangeEntry.objects.create(id=1, resource="products", object_id=10)
+        ChangeEntry.objects.create(id=3, resource="products", object_id=30)
+        page = client.get("/api/v1/changes/?since=0").json()
+        self.assertEqual([entry["sequence"] for entry in page["results"]], [1])
+        self.assertEqual(page["next_since"], 1)
+
+        ChangeEntry.objects.create(id=2, resource="products", object_id=20)
+        page = client.get("/api/v1/changes/?since=1").json()
+        self.assertEqual([entry["sequence"] for entry in page["results"]], [2, 3])
+        self.assertEqual(page["next_since"], 3)
+
+        # Sequence 4 was rolled back; the gap is passed once 5 has settled.
+        ChangeEntry.objects.create(id=5, resource="products", object_id=50)
+        self.assertEqual(client.get("/api/v1/changes/?since=3").json()["next_since"], 3)
+        ChangeEntry.objects.filter(id=5).update(created_at=now() - timedelta(minutes=5))
+        page = client.get("/api/v1/changes/?since=3").json()
+        self.assertEqual([entry["sequence"] for entry in page["results"]], [5])
+        self.assertEqual(page["next_since"], 5)
+
+    def test_pruned_journal_sends_stale_cursors_to_a_full_resync(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for sequence in range(1, 5):
+            ChangeEntry.objects.create(id=sequence, resource="customers", object_id=sequence)
+        ChangeEntry.objects.filter(id__lt=4).update(created_at=now() - timedelta(days=40))
+        call_command("prune_change_journal", "--days", "30", stdout=io.StringIO())
+        self.assertEqual(list(ChangeEntry.objects.values_list("id", flat=True)), [4])
+
+        page = client.get("/api/v1/changes/?since=1").json()
+        self.assertEqual(page, {"results": [], "next_since": 3, "has_more": False, "resync": True})
+        page = client.get(f"/api/v1/changes/?since={page['next_since']}").json()
+        self.assertFalse(page["resync"])
+        self.assertEqual([entry["sequence"] for entry in page["results"]], [4])
+
+    def test_batched_journaling_refuses_to_run_in_autocommit(self):
+        with self.assertRaises(RuntimeError):
+            with changes.batched():
+                pass
+        with transaction.atomic(), changes.batched():
+            Product.objects.create(name="Batched", price=Decimal("10"), stock=1)
+        self.assertEqual(ChangeEntry.objects.filter(resource="products").count(), 1)
+
     def test_unauthenticated_client_is_rejected(self):
         async def scenario():
             communicator = WebsocketCommunicator(
@@ -107,3 +294,190 @@ class RealtimeActivityTests(TransactionTestCase):
             self.assertEqual(close_code, 4401)
 
         async_to_sync(scenario)()
+
+
+class ConditionalGetTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="etag-admin", email="etag@example.com", password="password",
+            role=CustomUser.ADMIN,
+        )
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(self.user)
+        cache.clear()
+        self.product = Product.objects.create(name="Rice", price=Decimal("1000"), stock=5)
+
+    def test_unchanged_product_list_is_answered_with_304(self):
+        etag = self.client_api.get("/api/v1/products/?page_size=10")["ETag"]
+
+        with self.assertNumQueries(0):
+            res = self.client_api.get("/api/v1/products/?page_size=10", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+        self.assertNotEqual(self.client_api.get("/api/v1/products/?page_size=20")["ETag"], etag)
+
+        self.client_api.patch(
+            f"/api/v1/products/{self.product.id}/", {"price": "1100"}, format="json"
+        )
+        res = self.client_api.get("/api/v1/products/?page_size=10", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_operations_summary_etag_moves_with_sales(self):
+        etag = self.client_api.get("/api/v1/operations-summary/")["ETag"]
+        customer = Customer.objects.create(user=self.user, name="Etag Buyer")
+        self.assertEqual(
+            self.client_api.get(
+                "/api/v1/operations-summary/", HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            304,
+        )
+        self.client_api.post("/api/v1/sales/", {
+            "customer": customer.id,
+            "items": [{"product": self.product.id, "quantity": 1}],
+        }, format="json")
+        self.assertEqual(
+            self.client_api.get(
+                "/api/v1/operations-summary/", HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            200,
+        )
+
+    def test_customer_version_moves_only_after_its_tags_are_written(self):
+        bumped_with = []
+
+        def bump(resources):
+            if "customers" in resources:
+                bumped_with.append(sorted(
+                    Customer.objects.filter(name="Tagged").values_list("tags__name", flat=True)
+                ))
+            return versions_bump(resources)
+
+        with mock.patch("api.realtime.versions.bump", side_effect=bump):
+            created = self.client_api.post("/api/v1/customers/", {
+                "name": "Tagged", "tag_names": ["wholesale"],
+            }, format="json").json()
+            self.client_api.patch(f"/api/v1/customers/{created['id']}/", {
+                "tag_names": ["wholesale", "vip"],
+            }, format="json")
+        self.assertEqual(bumped_with, [["wholesale"], ["vip", "wholesale"]])
+
+    @override_settings(API_RESPONSE_CACHE_SECONDS=60)
+    def test_product_reads_are_served_from_the_versioned_response_cache(self):
+        first = self.client_api.get("/api/v1/products/?page_size=10&search=ri")
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            again = self.client_api.get("/api/v1/products/?search=ri&page_size=10")
+        self.assertEqual(again["X-Cache"], "HIT")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(self.client_api.get("/api/v1/products/categories/")["X-Cache"], "MISS")
+
+        self.client_api.patch(
+            f"/api/v1/products/{self.product.id}/", {"price": "1250"}, format="json"
+        )
+        fresh = self.client_api.get("/api/v1/products/?page_size=10&search=ri")
+        self.assertEqual(fresh["X-Cache"], "MISS")
+        self.assertEqual(fresh.json()["results"][0]["price"], "1250.00")
+
+        counters = self.client_api.get("/api/v1/metrics/").json()
+        self.assertEqual(counters["response_cache.products.hit"], 1)
+        self.assertEqual(counters["response_cache.products.miss"], 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            username="accounts", email="accounts@example.com", password="password",
+            role=CustomUser.ADMIN,
+        )
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(self.admin)
+        self.product = Product.objects.create(name="Rice & Beans", price=Decimal("1000"), stock=20)
+        customer = Customer.objects.create(user=self.admin, name="Buyer")
+        self.sale, _ = create_sale(
+            user=self.admin, customer=customer, date=date(2026, 7, 10),
+            items=[{"product": self.product, "quantity": "2.5"}],
+            payment={"amount": "1000", "method": "transfer"},
+        )
+        create_sale(
+            user=self.admin, customer=customer, date=date(2026, 8, 1),
+            items=[{"product": self.product, "quantity": 1}],
+        )
+
+    def test_csv_export_streams_rows_in_the_date_range(self):
+        res = self.client_api.get(
+            "/api/v1/exports/sale-lines.csv?date_from=2026-07-01&date_to=2026-07-31"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertIn('filename="sale-lines-2026-07-01-to-2026-07-31.csv"', res["Content-Disposition"])
+        body = b"".join(res.streaming_content).decode("utf-8-sig")
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0][-1], "Line total")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], self.sale.invoice_number)
+        self.assertEqual((rows[1][3], rows[1][-1]), ("Rice & Beans", "2500.00"))
+
+        payments = self.client_api.get(
+            "/api/v1/exports/payments.csv?date_from=2026-07-01&date_to=2026-08-31"
+        )
+        self.assertEqual(b"".join(payments.streaming_content).decode("utf-8-sig").count("\n"), 2)
+
+    def test_xlsx_export_is_a_workbook_the_paybox_reader_can_open(self):
+        res = self.client_api.get(
+            "/api/v1/exports/sales.xlsx?date_from=2026-07-01&date_to=2026-08-31"
+        )
+        self.assertEqual(res.status_code, 200)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "sales.xlsx"
+            path.write_bytes(b"".join(res.streaming_content))
+            self.assertIn("[Content_Types].xml", zipfile.ZipFile(path).namelist())
+            rows = list(iter_first_xlsx_sheet(path))
+        self.assertEqual(rows[0][:2], ["Invoice", "Date"])
+        self.assertEqual([row[1] for row in rows[1:]], ["2026-07-10", "2026-08-01"])
+        self.assertEqual(rows[1][rows[0].index("Paid")], "1000.00")
+
+    def test_free_text_that_looks_like_a_formula_is_exported_as_text(self):
+        name = '=HYPERLINK("http://example.com","Pay here")'
+        customer = Customer.objects.create(user=self.admin, name=name)
+        create_sale(
+            user=self.admin, customer=customer, date=date(2026, 7, 20),
+            items=[{"product": self.product, "quantity": 1}],
+        )
+        query = "date_from=2026-07-20&date_to=2026-07-20"
+        res = self.client_api.get(f"/api/v1/exports/sales.csv?{query}")
+        rows = list(csv.reader(io.StringIO(
+            b"".join(res.streaming_content).decode("utf-8-sig")
+        )))
+        self.assertEqual(rows[1][rows[0].index("Customer")], f"'{name}")
+
+        res = self.client_api.get(f"/api/v1/exports/sales.xlsx?{query}")
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "sales.xlsx"
+            path.write_bytes(b"".join(res.streaming_content))
+            rows = list(iter_first_xlsx_sheet(path))
+        self.assertEqual(rows[1][rows[0].index("Customer")], f"'{name}")
+
+    def test_export_validation_permissions_and_command(self):
+        self.assertEqual(self.client_api.get(
+            "/api/v1/exports/sales.csv?date_from=2026-07-31&date_to=2026-07-01"
+        ).status_code, 400)
+        self.assertEqual(self.client_api.get(
+            "/api/v1/exports/customers.csv?date_from=2026-07-01&date_to=2026-07-31"
+        ).status_code, 404)
+        cashier = CustomUser.objects.create_user(
+            username="cashier", email="cashier@example.com", password="password"
+        )
+        self.client_api.force_authenticate(cashier)
+        self.assertEqual(self.client_api.get(
+            "/api/v1/exports/sales.csv?date_from=2026-07-01&date_to=2026-07-31"
+        ).status_code, 403)
+
+        out = io.StringIO()
+        call_command(
+            "export_records", "movements", "--date-from", "2026-01-01",
+            "--date-to", "2099-12-31", stdout=out,
+        )
+        rows = list(csv.reader(io.StringIO(out.getvalue().lstrip("\ufeff"))))
+        self.assertEqual(rows[0][0], "Happened at")
+        self.assertEqual(sorted(row[3] for row in rows[1:]), ["sale", "sale"])
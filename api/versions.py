@@ -0,0 +1,46 @@
+"""Per-resource version counters, moved forward when a change commits.
+
+Each realtime resource name (``products``, ``customers``, ``operations``,
+...) has a counter in the shared cache. ``api.realtime`` bumps the counters
+of every resource a transaction touched as it commits, so anything derived
+from a version (ETags, cached responses) changes exactly when the data
+does. A missing counter is seeded from the clock, which keeps an evicted
+counter from ever repeating a value it handed out before.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+CACHE_PREFIX = "resource-version"
+
+
+def _key(resource):
+    return f"{CACHE_PREFIX}:{resource}"
+
+
+def _seed():
+    return time.time_ns()
+
+
+def current(resources):
+    """Return ``{resource: version}``, seeding any counter that is missing."""
+    keys = {resource: _key(resource) for resource in resources}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for resource, key in keys.items():
+        if key not in found:
+            cache.add(key, _seed(), timeout=None)
+            found[key] = cache.get(key)
+        versions[resource] = found[key]
+    return versions
+
+
+def bump(resources):
+    for resource in resources:
+        key = _key(resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
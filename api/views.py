@@ -1,29 +1,46 @@
 from rest_framework.viewsets import ModelViewSet
-from datetime import timedelta
+import base64
+import hashlib
+import json
+from urllib.parse import urlencode
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import models, transaction
-from django.db.models import Sum
-from django.utils.timezone import now
+from django.http import StreamingHttpResponse
+from django.utils.cache import parse_etags
+from django.utils.timezone import localdate, make_aware, now
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, NotFound, ParseError, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.filters import OrderingFilter, SearchFilter
 from django_filters import rest_framework as filters
+from django_filters.fields import IsoDateTimeField
 
-from users.permissions import AdminWriteOrReadOnly, CustomerAccess
-from inventory.models import Product, AuditLog, InventoryMovement, StockReservation
-from inventory.services import adjust_inventory
+from users.permissions import AdminOnly, AdminWriteOrReadOnly, CustomerAccess
+from inventory.models import (
+    Product, AuditLog, InventoryMovement, ReservationCart, StockReservation,
+)
+from inventory import reservations
+from inventory.services import adjust_inventory, apply_stock_take
 from inventory.quantities import parse_quarter_quantity, parse_stored_quantity
 from customers.models import Customer
 from .serializers import (
     ProductSerializer, CustomerSerializer, InventoryMovementSerializer,
 )
 from .realtime_auth import create_websocket_ticket
+from . import changes, exports, metrics, operations, versions
+from .models import Tombstone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -73,6 +90,61 @@ class AuditLogMixin:
         instance.delete()
 
 
+class NotModified(APIException):
+    status_code = 304
+    default_detail = "Not modified."
+
+
+class ConditionalGetMixin:
+    """Strong ETags for reads, derived from resource version counters.
+
+    The ETag covers the versions of ``etag_resources``, the full request
+    path, the caller's role and the negotiated format, so a matching
+    ``If-None-Match`` is answered with 304 right after authentication,
+    before any queryset is built. ``etag_daily`` adds the business date for
+    views whose content also changes with the calendar.
+    """
+    etag_resources = ()
+    etag_daily = False
+
+    def version_parts(self):
+        if getattr(self, "resource_versions", None) is None:
+            self.resource_versions = versions.current(self.etag_resources)
+        return [
+            f"{resource}:{version}"
+            for resource, version in sorted(self.resource_versions.items())
+        ]
+
+    def compute_etag(self, request):
+        parts = self.version_parts() + [
+            request.get_full_path(),
+            str(getattr(request.user, "role", "")),
+            request.accepted_renderer.format,
+        ]
+        if self.etag_daily:
+            parts.append(localdate().isoformat())
+        return '"%s"' % hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.resource_versions = None
+        if request.method in ("GET", "HEAD") and self.etag_resources:
+            self.etag = self.compute_etag(request)
+            if self.etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "etag", None) and response.status_code in (200, 304):
+            response["ETag"] = self.etag
+        return response
+
+
 class HealthView(APIView):
     permission_classes = [AllowAny]
     authentication_classes = []
@@ -93,141 +165,431 @@ class RealtimeTicketView(APIView):
 
 
 class StockReservationView(APIView):
-    """Atomically replace the current device's connected-cart reservations."""
+    """Connected-cart stock reservations for the current device.
+
+    POST replaces the whole cart. PATCH applies a diff from one scan:
+    ``set`` adds or changes lines, ``remove`` drops them, and ``version``
+    must match the cart's current version. Only the products a diff
+    changes are locked and rechecked; the cart's other lines just have
+    their expiry extended.
+    """
     permission_classes = [IsAuthenticated]
+    LINE_ERROR = "Each product needs a positive quantity in quarter-unit steps."
 
-    def post(self, request):
+    def _device_id(self, request):
         device_id = str(request.data.get("device_id") or "").strip()
-        raw_items = request.data.get("items", [])
         if not device_id or len(device_id) > 100:
-            return Response({"detail": "A valid device ID is required."}, status=400)
-        if not isinstance(raw_items, list):
-            return Response({"detail": "Items must be a list."}, status=400)
+            raise ParseError("A valid device ID is required.")
+        return device_id
 
-        requested = {}
+    def _parse_lines(self, raw_items):
+        if not isinstance(raw_items, list):
+            raise ParseError("Items must be a list.")
+        lines = {}
         try:
             for row in raw_items:
                 product_id = int(row["product"])
                 quantity = parse_quarter_quantity(row["quantity"])
-                if product_id in requested:
+                if product_id in lines:
                     raise ValueError
-                requested[product_id] = quantity
+                lines[product_id] = quantity
         except (TypeError, ValueError, KeyError):
-            return Response({
-                "detail": "Each product needs a positive quantity in quarter-unit steps."
-            }, status=400)
+            raise ParseError(self.LINE_ERROR)
+        return lines
 
-        current_time = now()
-        expires_at = current_time + timedelta(seconds=settings.STOCK_RESERVATION_SECONDS)
-        with transaction.atomic():
-            StockReservation.objects.filter(expires_at__lte=current_time).delete()
-            products = {
-                product.pk: product
-                for product in Product.objects.select_for_update().filter(pk__in=sorted(requested))
-            }
-            if len(products) != len(requested):
-                return Response({"detail": "One or more products are no longer available."}, status=400)
+    def _lock_cart(self, request, device_id):
+        cart, _ = ReservationCart.objects.get_or_create(user=request.user, device_id=device_id)
+        return ReservationCart.objects.select_for_update().get(pk=cart.pk)
 
-            own = StockReservation.objects.select_for_update().filter(
-                user=request.user, device_id=device_id
-            )
-            conflicts = []
-            availability = []
-            for product_id, quantity in requested.items():
-                product = products[product_id]
-                reserved_elsewhere = StockReservation.objects.filter(
-                    product_id=product_id, expires_at__gt=current_time
-                ).exclude(user=request.user, device_id=device_id).aggregate(
-                    total=Sum("quantity")
-                )["total"] or Decimal("0")
-                available = max(product.stock - reserved_elsewhere, Decimal("0"))
-                if quantity > available:
-                    conflicts.append({
-                        "product": product_id,
-                        "product_name": product.name,
-                        "requested": quantity,
-                        "available": available,
-                    })
-                availability.append({
+    def _lock_products(self, product_ids):
+        return {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(
+                pk__in=product_ids
+            ).order_by("pk")
+        }
+
+    def _check(self, request, device_id, products, lines):
+        """Availability of each line after other carts' holds, and conflicts."""
+        holds = reservations.cart_holds(
+            lines, user=request.user, device_id=device_id, writing=True
+        )
+        conflicts = []
+        availability = []
+        for product_id, quantity in lines.items():
+            product = products[product_id]
+            reserved_elsewhere = holds.get(product_id, (Decimal("0"), None))[0]
+            available = max(product.stock - reserved_elsewhere, Decimal("0"))
+            if quantity > available:
+                conflicts.append({
                     "product": product_id,
-                    "stock": product.stock,
+                    "product_name": product.name,
+                    "requested": quantity,
                     "available": available,
                 })
+            availability.append({
+                "product": product_id,
+                "stock": product.stock,
+                "available": available,
+            })
+        return availability, conflicts
 
-            if conflicts:
-                return Response({
-                    "detail": "Some items are no longer available in the requested quantity.",
-                    "conflicts": conflicts,
-                }, status=409)
+    def _conflict_response(self, conflicts):
+        return Response({
+            "detail": "Some items are no longer available in the requested quantity.",
+            "conflicts": conflicts,
+        }, status=409)
 
-            own.exclude(product_id__in=requested).delete()
-            for product_id, quantity in requested.items():
-                StockReservation.objects.update_or_create(
-                    user=request.user,
-                    device_id=device_id,
-                    product_id=product_id,
-                    defaults={"quantity": quantity, "expires_at": expires_at},
+    def _write_lines(self, request, device_id, lines, expires_at):
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(
+                    user=request.user, device_id=device_id, product_id=product_id,
+                    quantity=quantity, expires_at=expires_at,
                 )
+                for product_id, quantity in lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "device_id", "product"],
+            update_fields=["quantity", "expires_at", "updated_at"],
+        )
 
-        return Response({
+    def _saved(self, cart, availability, expires_at, **extra):
+        cart.version += 1
+        cart.save(update_fields=["version", "updated_at"])
+        return {
+            "version": cart.version,
             "reserved": availability,
+            **extra,
             "expires_at": expires_at,
             "offline_stock_safety_threshold": settings.OFFLINE_STOCK_SAFETY_THRESHOLD,
-        })
+        }
+
+    def post(self, request):
+        device_id = self._device_id(request)
+        requested = self._parse_lines(request.data.get("items", []))
+        expires_at = now() + timedelta(seconds=settings.STOCK_RESERVATION_SECONDS)
+        own = StockReservation.objects.filter(user=request.user, device_id=device_id)
+        with transaction.atomic():
+            cart = self._lock_cart(request, device_id)
+            # Lines this cart drops change their products' totals too, so
+            # they are locked along with the requested ones, in pk order.
+            touched = set(requested) | set(own.values_list("product_id", flat=True))
+            products = self._lock_products(touched)
+            if not set(requested) <= set(products):
+                return Response({"detail": "One or more products are no longer available."}, status=400)
+
+            availability, conflicts = self._check(request, device_id, products, requested)
+            if conflicts:
+                return self._conflict_response(conflicts)
+
+            own.exclude(product_id__in=requested).delete()
+            self._write_lines(request, device_id, requested, expires_at)
+            reservations.refresh_totals(
+                sorted(products), writing_cart=(request.user.pk, device_id)
+            )
+            return Response(self._saved(cart, availability, expires_at))
+
+    def patch(self, request):
+        device_id = self._device_id(request)
+        changes_set = self._parse_lines(request.data.get("set", []))
+        raw_remove = request.data.get("remove", [])
+        try:
+            version = int(request.data["version"])
+            if not isinstance(raw_remove, list):
+                raise TypeError
+            removed = {int(product_id) for product_id in raw_remove}
+        except (KeyError, TypeError, ValueError):
+            raise ParseError("Send the cart version and a list of product IDs to remove.")
+        if removed & set(changes_set):
+            raise ParseError("A product cannot be both set and removed.")
+
+        current_time = now()
+        expires_at = current_time + timedelta(seconds=settings.STOCK_RESERVATION_SECONDS)
+        own = StockReservation.objects.filter(user=request.user, device_id=device_id)
+        with transaction.atomic():
+            cart = self._lock_cart(request, device_id)
+            lines = {
+                product_id: (quantity, line_expiry)
+                for product_id, quantity, line_expiry in own.values_list(
+                    "product_id", "quantity", "expires_at"
+                )
+            }
+            if version != cart.version:
+                return Response({
+                    "detail": "The cart was changed by another request. Resend it in full.",
+                    "version": cart.version,
+                    "items": [
+                        {"product": product_id, "quantity": quantity}
+                        for product_id, (quantity, _) in sorted(lines.items())
+                    ],
+                }, status=409)
+
+            # Lines that lapsed since the last scan are claimed again, so
+            # they are rechecked along with the lines this scan changed.
+            checked = dict(changes_set)
+            for product_id, (quantity, line_expiry) in lines.items():
+                if line_expiry <= current_time and product_id not in removed:
+                    checked.setdefault(product_id, quantity)
+            dropped = removed & set(lines)
+            products = self._lock_products(set(checked) | dropped)
+            if not set(checked) <= set(products):
+                return Response({"detail": "One or more products are no longer available."}, status=400)
+
+            availability, conflicts = self._check(request, device_id, products, checked)
+            if conflicts:
+                return self._conflict_response(conflicts)
+
+            own.filter(product_id__in=dropped).delete()
+            self._write_lines(request, device_id, checked, expires_at)
+            # Unchanged lines keep their quantity, so their products' totals
+            # stay right; the totals' earlier next_expiry only makes the
+            # next reader refresh them once.
+            own.exclude(product_id__in=set(checked) | dropped).update(
+                expires_at=expires_at, updated_at=current_time
+            )
+            reservations.refresh_totals(
+                sorted(products), writing_cart=(request.user.pk, device_id)
+            )
+            return Response(self._saved(
+                cart, availability, expires_at, removed=sorted(dropped)
+            ))
 
 
-class OperationsSummaryView(APIView):
+class ChangeFeedView(APIView):
+    """Journal entries after ``?since=<sequence>`` for reconnecting clients."""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        from django.db.models import Sum
-        from django.utils.timezone import localdate
-        from sales.models import Sale, Payment
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = int(request.query_params.get("limit", changes.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({"detail": "since and limit must be whole numbers."})
+        if since < 0 or limit < 1:
+            raise ValidationError({"detail": "since and limit must be whole numbers."})
+        return Response(changes.changes_since(since, min(limit, changes.MAX_LIMIT)))
 
-        today = localdate()
-        sales = Sale.objects.filter(date=today)
-        payments = Payment.objects.filter(date=today)
-        payment_totals = {
-            method: str(
-                payments.filter(method=method).aggregate(total=Sum("amount"))["total"] or 0
-            )
-            for method in (Payment.CASH, Payment.TRANSFER, Payment.POS)
-        }
-        low_stock = Product.objects.filter(stock__lte=models.F("reorder_level")).count()
-        attention = Sale.objects.filter(
-            inventory_attention=True, inventory_resolution=""
-        ).count()
-        outstanding_sales = Sale.objects.prefetch_related(
-            "payments", "refunds", "credit_notes__items"
-        ).all()
-        outstanding = sum(
-            (sale.receivable for sale in outstanding_sales), Decimal("0")
-        )
-        refunds_due = sum(
-            (sale.refund_due for sale in outstanding_sales), Decimal("0")
+
+class MetricsView(APIView):
+    """Cache hit rates and background job counters, for administrators."""
+    permission_classes = [AdminOnly]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+async def _streamed(chunks):
+    """Hand a blocking chunk generator to an ASGI server one chunk at a time.
+
+    Django buffers a synchronous iterator completely before serving it
+    under ASGI, which would defeat streaming a large export.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    finished = object()
+    while (chunk := await next_chunk(chunks, finished)) is not finished:
+        yield chunk
+
+
+class ExportView(APIView):
+    """Stream sales, sale lines, payments, refunds or stock movements.
+
+    ``/exports/<dataset>.<csv|xlsx>?date_from=&date_to=`` covers whole days,
+    both inclusive. Rows are read and written in chunks, so a year's export
+    is served in flat memory.
+    """
+    permission_classes = [AdminOnly]
+
+    def get(self, request, dataset, file_format):
+        if dataset not in exports.DATASETS or file_format not in exports.FORMATS:
+            raise NotFound("Unknown export.")
+        try:
+            date_from = date.fromisoformat(request.query_params.get("date_from", ""))
+            date_to = date.fromisoformat(request.query_params.get("date_to", ""))
+        except ValueError:
+            raise ValidationError({"detail": "date_from and date_to must be YYYY-MM-DD dates."})
+        if date_from > date_to:
+            raise ValidationError({"detail": "date_from must not be after date_to."})
+
+        chunks = exports.export_chunks(dataset, file_format, date_from, date_to)
+        if isinstance(request._request, ASGIRequest):
+            chunks = _streamed(chunks)
+        response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[file_format])
+        response["Content-Disposition"] = (
+            f'attachment; filename="{exports.filename(dataset, file_format, date_from, date_to)}"'
         )
-        return Response({
-            "date": today,
-            "sales_total": str(sales.aggregate(total=Sum("total"))["total"] or 0),
-            "sale_count": sales.count(),
-            "payments": payment_totals,
-            "low_stock_count": low_stock,
-            "inventory_attention_count": attention,
-            "outstanding_total": str(outstanding),
-            "refunds_due_total": str(refunds_due),
-        })
+        return response
+
+
+class OperationsSummaryView(ConditionalGetMixin, APIView):
+    """Today's takings, stock alerts and open balances from the cached snapshot."""
+    permission_classes = [IsAuthenticated]
+    etag_resources = ("operations",)
+    etag_daily = True
+
+    def get(self, request):
+        return Response(operations.get_summary())
+
+
+def _cursor_position(model, ordering, after):
+    """Check a decoded cursor position and convert it to field values.
+
+    Cursors come back from clients, so anything that is not one valid value
+    per ordering field is a 400 rather than an error in the query.
+    """
+    if not isinstance(after, list) or len(after) != len(ordering):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    try:
+        position = [
+            model._meta.get_field(field.lstrip("-")).to_python(value)
+            for field, value in zip(ordering, after)
+        ]
+    except (DjangoValidationError, TypeError, ValueError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    # Every ordering field is non-null, so a missing value is tampering too.
+    if any(value is None for value in position):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return position
+
+
+def _seek(queryset, ordering, after):
+    """Rows strictly after ``after`` in ``ordering`` (a keyset seek)."""
+    if after is None:
+        return queryset.order_by(*ordering)
+    after = _cursor_position(queryset.model, ordering, after)
+    condition = models.Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = models.Q(**{f"{name}__{lookup}": after[position]})
+        for previous, value in zip(ordering[:position], after):
+            step &= models.Q(**{previous.lstrip("-"): value})
+        condition |= step
+    return queryset.filter(condition).order_by(*ordering)
+
+
+def _encode_cursor(payload):
+    raw = json.dumps(payload, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(value):
+    try:
+        return json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Invalid cursor."})
 
 
 class CustomPagination(PageNumberPagination):
+    """Page-number pagination with a keyset cursor mode.
+
+    Passing ``cursor`` (empty for the first page) switches to keyset pages
+    over the view's ``cursor_ordering``: each page seeks past the last row of
+    the previous one instead of skipping rows with OFFSET, so deep pages cost
+    the same as the first. ``count=false`` leaves out the total row count in
+    either mode.
+    """
     page_size = 25
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    cursor_query_param = 'cursor'
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def wants_count(self, request):
+        return request.query_params.get('count', '').lower() not in ('false', '0')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.include_count = self.wants_count(request)
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        if self.cursor_ordering and self.use_cursor(request):
+            self.mode = 'cursor'
+            return self._paginate_by_cursor(queryset, request)
+        if self.include_count:
+            self.mode = 'page'
+            return super().paginate_queryset(queryset, request, view)
+        self.mode = 'uncounted'
+        return self._paginate_without_count(queryset, request)
+
+    def _paginate_by_cursor(self, queryset, request):
+        ordering = list(self.cursor_ordering)
+        size = self.get_page_size(request)
+        self.count = queryset.count() if self.include_count else None
+        raw = request.query_params.get(self.cursor_query_param)
+        cursor = _decode_cursor(raw) if raw else {}
+        if not isinstance(cursor, dict):
+            raise ValidationError({"cursor": "Invalid cursor."})
+        after, before = cursor.get('after'), cursor.get('before')
+
+        if before is not None:
+            reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+            rows = list(_seek(queryset, reverse, before)[:size + 1])
+            self.has_previous = len(rows) > size
+            self.has_next = True
+            rows = rows[:size][::-1]
+        else:
+            rows = list(_seek(queryset, ordering, after)[:size + 1])
+            self.has_next = len(rows) > size
+            self.has_previous = after is not None
+            rows = rows[:size]
+        self.positions = [
+            [getattr(row, field.lstrip('-')) for field in ordering]
+            for row in (rows[:1] + rows[-1:])
+        ] if rows else []
+        return rows
+
+    def _paginate_without_count(self, queryset, request):
+        size = self.get_page_size(request)
+        try:
+            number = int(request.query_params.get(self.page_query_param) or 1)
+            if number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound("Invalid page.")
+        offset = (number - 1) * size
+        rows = list(queryset[offset:offset + size + 1])
+        if not rows and number > 1:
+            raise NotFound("Invalid page.")
+        self.number = number
+        self.has_next = len(rows) > size
+        return rows[:size]
+
+    def _cursor_link(self, key, position):
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, _encode_cursor({key: position}))
 
     def get_paginated_response(self, data):
+        size = self.get_page_size(self.request)
+        if self.mode == 'cursor':
+            return Response({
+                'count': self.count,
+                'page_size': size,
+                'next': self._cursor_link('after', self.positions[-1]) if self.has_next and self.positions else None,
+                'previous': self._cursor_link('before', self.positions[0]) if self.has_previous and self.positions else None,
+                'results': data,
+            })
+        if self.mode == 'uncounted':
+            url = self.request.build_absolute_uri()
+            previous = None
+            if self.number == 2:
+                previous = remove_query_param(url, self.page_query_param)
+            elif self.number > 2:
+                previous = replace_query_param(url, self.page_query_param, self.number - 1)
+            return Response({
+                'count': None,
+                'page': self.number,
+                'page_size': size,
+                'total_pages': None,
+                'next': replace_query_param(url, self.page_query_param, self.number + 1) if self.has_next else None,
+                'previous': previous,
+                'results': data,
+            })
         return Response({
             'count': self.page.paginator.count,
             'page': self.page.number,
-            'page_size': self.get_page_size(self.request),
+            'page_size': size,
             'total_pages': self.page.paginator.num_pages,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
@@ -235,17 +597,129 @@ class CustomPagination(PageNumberPagination):
         })
 
 
+class LedgerPagination(CustomPagination):
+    """Keyset pages only, for append-only ledgers; ``count=true`` adds the total."""
+
+    def use_cursor(self, request):
+        return True
+
+    def wants_count(self, request):
+        return request.query_params.get('count', '').lower() in ('true', '1')
+
+
+class ResponseCacheMixin:
+    """Serve repeated directory reads from the shared cache.
+
+    Entries are keyed by the resource versions of ``ConditionalGetMixin``,
+    the normalised query string, the caller's role and the response format,
+    so a committed write retires every entry for its resource without any
+    explicit invalidation. Responses say ``X-Cache: HIT`` or ``MISS`` and
+    the counts are kept in ``api.metrics``.
+    """
+    response_cache_actions = ("list",)
+
+    def response_cache_key(self, request):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        )
+        parts = self.version_parts() + [
+            type(self).__name__, self.action, request.build_absolute_uri("/"),
+            urlencode(params), str(getattr(request.user, "role", "")),
+            request.accepted_renderer.format,
+        ]
+        return "api-response:" + hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def cached_response(self, request, build):
+        timeout = settings.API_RESPONSE_CACHE_SECONDS
+        if timeout <= 0 or self.action not in self.response_cache_actions:
+            return build()
+        counter = "response_cache." + "+".join(self.etag_resources)
+        key = self.response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            metrics.incr(f"{counter}.hit")
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        metrics.incr(f"{counter}.miss")
+        response = build()
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResponseCacheMixin, self).list(
+            request, *args, **kwargs
+        ))
+
+
+class DeltaSyncMixin:
+    """``?updated_since=<ISO time>`` for devices that mirror a directory.
+
+    The filterset narrows the list to rows changed after the watermark
+    (through an ``updated_at`` index) and each page also carries the ids of
+    rows deleted since then, from their tombstones.
+
+    ``updated_at`` is stamped before a write commits, so a row can become
+    visible with a timestamp older than a pull that missed it. Every page
+    therefore carries ``sync_watermark``: the time the query started, less
+    ``CHANGE_FEED_SETTLE_SECONDS``. Devices send the watermark of the first
+    page of their last pull back as ``updated_since`` instead of their own
+    clock, and may see a few rows twice.
+
+    Tombstones are pruned after ``CHANGE_JOURNAL_RETENTION_DAYS``, so an
+    older ``updated_since`` gets ``resync`` and no rows: the device reloads
+    the directory and keeps the new ``sync_watermark``.
+    """
+    tombstone_resource = None
+
+    def _since(self, request):
+        value = request.query_params.get("updated_since")
+        if not value:
+            return None
+        try:
+            return IsoDateTimeField().clean(value)
+        except DjangoValidationError:
+            # Left to the filterset, which answers with a 400.
+            return None
+
+    def list(self, request, *args, **kwargs):
+        watermark = now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+        since = self._since(request)
+        retained = now() - timedelta(days=settings.CHANGE_JOURNAL_RETENTION_DAYS)
+        if since is not None and since < retained:
+            return Response({
+                "results": [], "deleted": [], "resync": True,
+                "sync_watermark": watermark.isoformat(),
+            })
+        response = super().list(request, *args, **kwargs)
+        if isinstance(response.data, dict):
+            response.data["sync_watermark"] = watermark.isoformat()
+        if since is not None and isinstance(response.data, dict):
+            response.data["resync"] = False
+            response.data["deleted"] = list(
+                Tombstone.objects.filter(
+                    resource=self.tombstone_resource, deleted_at__gt=since
+                ).order_by("deleted_at").values_list("object_id", flat=True)
+            )
+        return response
+
+
 class ProductFilter(filters.FilterSet):
     category = filters.CharFilter(field_name="category", lookup_expr="iexact")
     stock_status = filters.CharFilter(method="filter_stock_status")
+    updated_since = filters.IsoDateTimeFilter(field_name="updated_at", lookup_expr="gt")
 
     def filter_stock_status(self, queryset, _name, value):
         if value == "in_stock":
-            return queryset.filter(stock__gt=models.F("reorder_level"))
+            return queryset.filter(stock__gt=models.F("reorder_point"))
         if value == "low_stock":
             return queryset.filter(
                 stock__gt=0,
-                stock__lte=models.F("reorder_level"),
+                stock__lte=models.F("reorder_point"),
             )
         if value == "out_of_stock":
             return queryset.filter(stock__lte=0)
@@ -253,11 +727,24 @@ class ProductFilter(filters.FilterSet):
 
     class Meta:
         model = Product
-        fields = ["category", "stock_status"]
+        fields = ["category", "stock_status", "updated_since"]
 
 
-class ProductViewSet(AuditLogMixin, ModelViewSet):
+class CustomerFilter(filters.FilterSet):
+    updated_since = filters.IsoDateTimeFilter(field_name="updated_at", lookup_expr="gt")
+
+    class Meta:
+        model = Customer
+        fields = ["city", "is_active", "updated_since"]
+
+
+class ProductViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, DeltaSyncMixin, AuditLogMixin, ModelViewSet
+):
     """Products: CRUD plus searchable, filterable, paginated directory reads."""
+    etag_resources = ("products",)
+    response_cache_actions = ("list", "categories")
+    tombstone_resource = "products"
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AdminWriteOrReadOnly]
@@ -270,14 +757,13 @@ class ProductViewSet(AuditLogMixin, ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def categories(self, request):
-        categories = (
+        return self.cached_response(request, lambda: Response(list(
             self.get_queryset()
             .exclude(category="")
             .values_list("category", flat=True)
             .distinct()
             .order_by("category")
-        )
-        return Response(list(categories))
+        )))
 
     @transaction.atomic
     def perform_create(self, serializer):
@@ -328,11 +814,79 @@ class ProductViewSet(AuditLogMixin, ModelViewSet):
         })
 
 
+def _start_of_day(day):
+    return make_aware(datetime.combine(day, time.min))
+
+
+class InventoryMovementFilter(filters.FilterSet):
+    date_from = filters.DateFilter(method="filter_date_from")
+    date_to = filters.DateFilter(method="filter_date_to")
+
+    # Dates are business days in the local time zone. Comparing event_at to
+    # the day boundaries keeps the (product, event_at, id) index usable.
+    def filter_date_from(self, queryset, _name, value):
+        return queryset.filter(event_at__gte=_start_of_day(value))
+
+    def filter_date_to(self, queryset, _name, value):
+        return queryset.filter(event_at__lt=_start_of_day(value + timedelta(days=1)))
+
+    class Meta:
+        model = InventoryMovement
+        fields = ["product", "reason", "sale", "device_id", "date_from", "date_to"]
+
+
 class InventoryMovementViewSet(ModelViewSet):
+    """Append-only stock ledger, newest first, in keyset pages.
+
+    Filter with ?product=, ?reason=, ?sale=, ?device_id= and
+    ?date_from=/?date_to= (inclusive business dates).
+    """
     queryset = InventoryMovement.objects.select_related("product", "sale", "user").all()
     serializer_class = InventoryMovementSerializer
     permission_classes = [AdminWriteOrReadOnly]
+    pagination_class = LedgerPagination
+    filter_backends = [filters.DjangoFilterBackend]
+    filterset_class = InventoryMovementFilter
+    cursor_ordering = ("-event_at", "-id")
     http_method_names = ["get", "post", "head", "options"]
+    STOCK_TAKE_LIMIT = 5000
+
+    @action(detail=False, methods=["post"], url_path="stock-take")
+    def stock_take(self, request):
+        """Record a stock count for many products at once.
+
+        Body: ``{"counts": [{"product": id, "counted": qty}, ...], "note",
+        "event_at"}``. Differences are booked as corrections in one
+        transaction and the variance report is returned.
+        """
+        rows = request.data.get("counts")
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({"counts": "Send a non-empty list of counted products."})
+        if len(rows) > self.STOCK_TAKE_LIMIT:
+            raise ValidationError({
+                "counts": f"Send at most {self.STOCK_TAKE_LIMIT} products per stock take."
+            })
+        counts = {}
+        try:
+            for row in rows:
+                product_id = int(row["product"])
+                if product_id in counts:
+                    raise ValueError
+                counts[product_id] = row["counted"]
+        except (TypeError, ValueError, KeyError):
+            raise ValidationError({
+                "counts": "Each product must appear once with its counted quantity."
+            })
+        event_at = request.data.get("event_at")
+        if event_at:
+            event_at = IsoDateTimeField().clean(event_at)
+        report = apply_stock_take(
+            counts=counts,
+            user=request.user,
+            note=str(request.data.get("note") or ""),
+            event_at=event_at or None,
+        )
+        return Response(report)
 
     def perform_create(self, serializer):
         movement = adjust_inventory(
@@ -346,19 +900,35 @@ class InventoryMovementViewSet(ModelViewSet):
         serializer.instance = movement
 
 
-class CustomerViewSet(AuditLogMixin, ModelViewSet):
+class CustomerViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, DeltaSyncMixin, AuditLogMixin, ModelViewSet
+):
     """Customers: full CRUD, paginated (?page_size=N)."""
     WALK_IN_NAME = "Walk-in Customer"
+    etag_resources = ("customers",)
+    tombstone_resource = "customers"
 
     queryset = Customer.objects.prefetch_related("tags").all()
     serializer_class = CustomerSerializer
     permission_classes = [CustomerAccess]
     pagination_class = CustomPagination
     filter_backends = [filters.DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ["city", "is_active"]
+    filterset_class = CustomerFilter
     search_fields = ["name", "phone_number", "city"]
     ordering_fields = ["name", "created_at", "updated_at"]
     ordering = ["name"]
+    cursor_ordering = ("name", "id")
+
+    # Tags are set after the customer row is saved. In one transaction the
+    # customers version moves at commit, once the tags are in, so an ETag
+    # or cached list is never taken between the two writes.
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
 
     @action(detail=False, methods=["get"], url_path="walk-in")
     def walk_in(self, request):
@@ -373,50 +943,118 @@ class CustomerViewSet(AuditLogMixin, ModelViewSet):
         return Response(self.get_serializer(customer).data)
 
 
-class NotificationsView(APIView):
-    """Operational alerts for stock and overdue customer balances."""
+class NotificationsView(ConditionalGetMixin, APIView):
+    """Operational alerts for stock and overdue customer balances.
+
+    Alerts come section by section (low stock, stock conflicts, overdue
+    invoices) in pages of ``page_size``. ``next`` is an opaque cursor for the
+    following page; each section is read with a keyset seek over an indexed
+    ordering, so every page costs the same however deep it is.
+    """
     permission_classes = [IsAuthenticated]
+    etag_resources = ("notifications",)
+    etag_daily = True
+    page_size = 25
+    max_page_size = 100
+    SECTIONS = ("low_stock", "stock_conflict", "overdue_invoice")
 
-    def get(self, request):
-        from datetime import timedelta
-        from django.utils.timezone import localdate
+    def _sections(self, cutoff):
         from sales.models import Sale
 
-        today = localdate()
-        overdue_days = int(request.query_params.get("overdue_days", 14))
-        cutoff = today - timedelta(days=overdue_days)
+        return {
+            "low_stock": (
+                Product.objects.filter(stock__lte=models.F("reorder_point")),
+                ("stock", "name"),
+            ),
+            "stock_conflict": (
+                Sale.objects.filter(inventory_attention=True, inventory_resolution=""),
+                ("-synced_at", "-id"),
+            ),
+            # Oldest debts first. Settlement totals are stored on the sale,
+            # so the receivable check runs in SQL.
+            "overdue_invoice": (
+                Sale.objects.select_related("customer").filter(
+                    date__lte=cutoff, receivable__gt=0
+                ),
+                ("date", "id"),
+            ),
+        }
 
-        items = []
-        low_stock_products = Product.objects.filter(
-            stock__lte=models.F("reorder_level")
-        ).order_by("stock", "name")
-        for product in low_stock_products:
-            status_label = "out of stock" if product.stock <= 0 else f"low on stock ({product.stock} left)"
-            stock_status = "out_of_stock" if product.stock <= 0 else "low_stock"
-            items.append({
+    def _item(self, section, row, today):
+        if section == "low_stock":
+            status_label = "out of stock" if row.stock <= 0 else f"low on stock ({row.stock} left)"
+            stock_status = "out_of_stock" if row.stock <= 0 else "low_stock"
+            return {
                 "type": "low_stock",
-                "message": f"{product.name} is {status_label}.",
+                "message": f"{row.name} is {status_label}.",
                 "link": f"/products?stock_status={stock_status}",
-            })
-
-        conflicts = Sale.objects.select_related("customer").filter(
-            inventory_attention=True, inventory_resolution=""
-        ).order_by("-synced_at")
-        for sale in conflicts:
-            items.append({
+            }
+        if section == "stock_conflict":
+            return {
                 "type": "stock_conflict",
-                "message": f"{sale.invoice_number} has an unresolved stock conflict.",
-                "link": f"/sales/{sale.id}",
-            })
+                "message": f"{row.invoice_number} has an unresolved stock conflict.",
+                "link": f"/sales/{row.id}",
+            }
+        return {
+            "type": "overdue_invoice",
+            "message": f"{row.invoice_number} — {row.customer.name} owes ₦{row.receivable:,.2f} ({(today - row.date).days} days).",
+            "link": f"/sales/{row.id}",
+        }
 
-        sales = Sale.objects.select_related("customer").prefetch_related(
-            "payments", "refunds", "credit_notes__items"
-        ).filter(date__lte=cutoff)
-        for sale in sales:
-            if sale.receivable > 0:
-                items.append({
-                    "type": "overdue_invoice",
-                    "message": f"{sale.invoice_number} — {sale.customer.name} owes ₦{sale.receivable:,.2f} ({(today - sale.date).days} days).",
-                    "link": f"/sales/{sale.id}",
-                })
-        return Response({"count": len(items), "items": items})
+    @staticmethod
+    def _section_cursor(section, after):
+        return _encode_cursor({"section": section, "after": after})
+
+    def _read_section_cursor(self, value):
+        if not value:
+            return self.SECTIONS[0], None
+        try:
+            cursor = _decode_cursor(value)
+            section, after = cursor["section"], cursor["after"]
+        except (TypeError, KeyError):
+            raise ValidationError({"cursor": "Invalid cursor."})
+        if section not in self.SECTIONS or not (after is None or isinstance(after, list)):
+            raise ValidationError({"cursor": "Invalid cursor."})
+        return section, after
+
+    def get(self, request):
+        from django.utils.timezone import localdate
+
+        today = localdate()
+        try:
+            overdue_days = int(request.query_params.get("overdue_days", 14))
+            page_size = int(request.query_params.get("page_size", self.page_size))
+        except ValueError:
+            raise ValidationError({"detail": "overdue_days and page_size must be whole numbers."})
+        page_size = min(max(page_size, 1), self.max_page_size)
+        cutoff = today - timedelta(days=overdue_days)
+        section, after = self._read_section_cursor(request.query_params.get("cursor"))
+
+        sections = self._sections(cutoff)
+        counts = {name: queryset.count() for name, (queryset, _ordering) in sections.items()}
+        items = []
+        next_cursor = None
+        for name in self.SECTIONS[self.SECTIONS.index(section):]:
+            if not counts[name]:
+                after = None
+                continue
+            remaining = page_size - len(items)
+            if remaining == 0:
+                next_cursor = self._section_cursor(name, None)
+                break
+            queryset, ordering = sections[name]
+            rows = list(_seek(queryset, ordering, after)[:remaining + 1])
+            after = None
+            items.extend(self._item(name, row, today) for row in rows[:remaining])
+            if len(rows) > remaining:
+                last = rows[remaining - 1]
+                next_cursor = self._section_cursor(
+                    name, [getattr(last, field.lstrip("-")) for field in ordering]
+                )
+                break
+        return Response({
+            "count": sum(counts.values()),
+            "counts": counts,
+            "items": items,
+            "next": next_cursor,
+        })
@@ -30,6 +30,10 @@ class Customer(models.Model):
     class Meta:
         unique_together = ("user", "name", "phone_number")
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["name", "id"], name="customer_name_id_idx"),
+            models.Index(fields=["updated_at", "id"], name="customer_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
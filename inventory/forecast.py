@@ -0,0 +1,211 @@
+"""Sales velocity and reorder points forecast from the movement ledger.
+
+``run`` reads the window's SALE, RETURN and REVERSAL movements in one pass
+ordered by product. Only one product's daily buckets are in memory at a
+time, and each is reduced to a ``Demand``:
+
+* ``average``: the moving-average units sold per day over the most recent
+  part of the window;
+* ``weekday``: each weekday's demand relative to the average day over the
+  whole window, so a shop that sells most on Saturdays plans for that.
+
+Combined with current stock, a demand gives the suggested reorder point
+(the forecast units over the restock lead time plus safety days) and the
+days of cover (how many forecast days the stock lasts). Both are written to
+the product with ``reorder_point`` as the larger of the suggestion and the
+manual reorder level, as ``Product.save`` keeps it. Products whose figures
+moved get a new ``updated_at`` and a change journal entry, so devices
+syncing with ``?updated_since=`` or the change feed pick them up.
+
+Windows are a few dozen days per product, so the arithmetic is plain Python
+over per-day lists.
+"""
+
+import math
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils.timezone import localdate, localtime, make_aware, now
+
+from api import changes, metrics
+
+from .models import InventoryMovement, Product
+
+
+# Deleting a sale writes a REVERSAL movement, which cancels its SALE
+# movement out of the demand.
+DEMAND_REASONS = (
+    InventoryMovement.SALE, InventoryMovement.RETURN, InventoryMovement.REVERSAL,
+)
+MAX_COVER_DAYS = 365
+# bulk_update skips auto_now, so updated_at is set explicitly.
+FORECAST_FIELDS = [
+    "daily_demand", "days_of_cover", "suggested_reorder_point", "reorder_point",
+    "forecast_at", "updated_at",
+]
+
+Demand = namedtuple("Demand", ["average", "weekday"])
+NO_DEMAND = Demand(0.0, (1.0,) * 7)
+
+
+def daily_units(movements, start, days):
+    """Units sold per day of the window, net of returns and reversals."""
+    buckets = [0.0] * days
+    for event_at, quantity in movements:
+        offset = (localtime(event_at).date() - start).days
+        if 0 <= offset < days:
+            buckets[offset] -= float(quantity)
+    return buckets
+
+
+def demand_for(buckets, start, recent_days):
+    recent = buckets[-recent_days:]
+    average = max(sum(recent) / len(recent), 0.0)
+    mean = sum(buckets) / len(buckets)
+    if average <= 0 or mean <= 0:
+        return Demand(average, NO_DEMAND.weekday)
+    totals, counts = [0.0] * 7, [0] * 7
+    for offset, units in enumerate(buckets):
+        weekday = (start + timedelta(days=offset)).weekday()
+        totals[weekday] += units
+        counts[weekday] += 1
+    return Demand(average, tuple(
+        max(totals[day] / counts[day], 0.0) / mean if counts[day] else 1.0
+        for day in range(7)
+    ))
+
+
+def upcoming_units(demand, today, days):
+    """Forecast units for each of the next ``days`` days, starting today."""
+    return [
+        demand.average * demand.weekday[(today + timedelta(days=offset)).weekday()]
+        for offset in range(days)
+    ]
+
+
+def days_of_cover(demand, stock, today):
+    """Forecast days until ``stock`` runs out, or None without any demand."""
+    if demand.average <= 0:
+        return None
+    remaining = float(stock)
+    if remaining <= 0:
+        return Decimal("0")
+    for offset, units in enumerate(upcoming_units(demand, today, MAX_COVER_DAYS)):
+        if units >= remaining:
+            return Decimal(str(round(offset + remaining / units, 1)))
+        remaining -= units
+    return Decimal(MAX_COVER_DAYS)
+
+
+def reorder_point(demand, today, lead_time_days, safety_days):
+    """Units that cover the lead time plus safety days, in whole quarters."""
+    units = sum(upcoming_units(demand, today, lead_time_days))
+    units += demand.average * safety_days
+    return Decimal(math.ceil(round(units * 4, 6))) / 4
+
+
+def read_demand(start, days, recent_days, chunk_size):
+    """Stream the window's ledger once and reduce it to a demand per product."""
+    window = (
+        make_aware(datetime.combine(start, time.min)),
+        make_aware(datetime.combine(start + timedelta(days=days), time.min)),
+    )
+    movements = InventoryMovement.objects.filter(
+        reason__in=DEMAND_REASONS, product__isnull=False,
+        event_at__gte=window[0], event_at__lt=window[1],
+    ).order_by("product", "-event_at").values_list(
+        "product_id", "event_at", "quantity"
+    ).iterator(chunk_size=chunk_size)
+    return {
+        product_id: demand_for(
+            daily_units(((event_at, quantity) for _, event_at, quantity in rows), start, days),
+            start, recent_days,
+        )
+        for product_id, rows in groupby(movements, key=itemgetter(0))
+    }
+
+
+def run(*, window_days=None, recent_days=None, lead_time_days=None, safety_days=None,
+        chunk_size=2000, today=None):
+    """Forecast every product and store its demand, cover and reorder point.
+
+    The window covers the ``window_days`` whole days before ``today``.
+    Returns the number of products written and how many had any demand.
+    """
+    window_days = window_days or settings.REORDER_FORECAST_WINDOW_DAYS
+    recent_days = min(recent_days or settings.REORDER_RECENT_DAYS, window_days)
+    lead_time_days = lead_time_days if lead_time_days is not None else settings.REORDER_LEAD_TIME_DAYS
+    safety_days = safety_days if safety_days is not None else settings.REORDER_SAFETY_DAYS
+    today = today or localdate()
+    start = today - timedelta(days=window_days)
+
+    demands = read_demand(start, window_days, recent_days, chunk_size)
+
+    def forecast(product):
+        demand = demands.get(product.pk, NO_DEMAND)
+        suggested = reorder_point(demand, today, lead_time_days, safety_days)
+        return {
+            "daily_demand": Decimal(str(round(demand.average, 4))),
+            "days_of_cover": days_of_cover(demand, product.stock, today),
+            "suggested_reorder_point": suggested,
+            "reorder_point": max(product.reorder_level, suggested),
+        }
+
+    forecast_at = now()
+    written = 0
+    product_ids = Product.objects.order_by("pk").values_list("pk", flat=True)
+    batch = []
+    for product_id in product_ids.iterator(chunk_size=chunk_size):
+        batch.append(product_id)
+        if len(batch) >= chunk_size:
+            written += _write(batch, forecast, forecast_at)
+            batch = []
+    written += _write(batch, forecast, forecast_at)
+
+    metrics.incr("reorder_forecast.runs")
+    metrics.incr("reorder_forecast.products", written)
+    return written, sum(1 for demand in demands.values() if demand.average > 0)
+
+
+def _write(product_ids, forecast, forecast_at):
+    if not product_ids:
+        return 0
+    with transaction.atomic():
+        # Locked in pk order like every stock writer, so cover is worked
+        # out from current stock and the journaled rows are not stale.
+        products = list(
+            Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk")
+        )
+        saved_at = now()
+        changed, unchanged = [], []
+        for product in products:
+            values = forecast(product)
+            moved = any(getattr(product, name) != value for name, value in values.items())
+            for name, value in values.items():
+                setattr(product, name, value)
+            product.forecast_at = forecast_at
+            if moved:
+                product.updated_at = saved_at
+                changed.append(product)
+            else:
+                unchanged.append(product)
+        # A product whose figures did not move only has forecast_at stamped,
+        # so delta syncs and ETags are not churned by every nightly run.
+        Product.objects.bulk_update(unchanged, ["forecast_at"])
+        Product.objects.bulk_update(changed, FORECAST_FIELDS)
+        # As in save_stock_in_bulk, post_save is sent by hand so the changed
+        # products are journaled and their low-stock figures move.
+        with changes.batched():
+            for product in changed:
+                post_save.send(
+                    sender=Product, instance=product, created=False,
+                    update_fields=frozenset(FORECAST_FIELDS), raw=False,
+                    using=product._state.db,
+                )
+    return len(products)
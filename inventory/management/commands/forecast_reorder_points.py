@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import forecast
+
+
+class Command(BaseCommand):
+    help = (
+        "Forecast each product's daily demand from the sales ledger and store "
+        "its days of cover and suggested reorder point. Run it daily; the "
+        "defaults come from the REORDER_* settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--window-days", type=int)
+        parser.add_argument("--recent-days", type=int)
+        parser.add_argument("--lead-time-days", type=int)
+        parser.add_argument("--safety-days", type=int)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for name in ("window_days", "recent_days"):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        for name in ("lead_time_days", "safety_days"):
+            if options[name] is not None and options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} cannot be negative.")
+        written, selling = forecast.run(
+            window_days=options["window_days"],
+            recent_days=options["recent_days"],
+            lead_time_days=options["lead_time_days"],
+            safety_days=options["safety_days"],
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {written} product(s); {selling} sold during the window."
+        ))
@@ -71,7 +71,11 @@ class Command(BaseCommand):
                 invalid_emails.append({"legacy_id": customer.legacy_id, "email": customer.email})
         customer_report["invalid_emails_cleared"] = invalid_emails
 
-        file_hash = hashlib.sha256(inventory_path.read_bytes()).hexdigest()
+        digest = hashlib.sha256()
+        with inventory_path.open("rb") as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(block)
+        file_hash = digest.hexdigest()
         existing = {
             "products": Product.objects.count(),
             "customers": Customer.objects.exclude(name__iexact="Walk-in Customer").count(),
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import metrics
+from inventory.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Purge expired connected-cart reservations and refresh the reserved "
+        "totals of the products they held. With --loop, keep sweeping every "
+        "--interval seconds (run it as a worker process)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=15)
+
+    def sweep(self, batch_size):
+        swept = 0
+        while batch := sweep_expired(batch_size):
+            swept += len(batch)
+        metrics.incr("reservation_sweep.runs")
+        return swept
+
+    def handle(self, *args, **options):
+        while True:
+            swept = self.sweep(options["batch_size"])
+            if not options["loop"]:
+                break
+            if swept:
+                self.stdout.write(f"Refreshed reservations on {swept} product(s).")
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed reservations on {swept} product(s)."))
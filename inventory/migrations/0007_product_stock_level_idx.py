@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_alter_inventorymovement_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock', 'reorder_level'], name='product_stock_level_idx'),
+        ),
+    ]
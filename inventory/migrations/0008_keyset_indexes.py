@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_product_stock_level_idx'),
+        ('sales', '0011_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['-event_at', '-id'], name='movement_event_id_idx'),
+        ),
+    ]
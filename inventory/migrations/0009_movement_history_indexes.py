@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_keyset_indexes'),
+        ('sales', '0011_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', '-event_at', '-id'], name='movement_product_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['device_id', '-event_at', '-id'], name='movement_device_event_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, Sum
+from django.utils.timezone import now
+
+
+def backfill_reservation_totals(apps, schema_editor):
+    StockReservation = apps.get_model("inventory", "StockReservation")
+    StockReservationTotal = apps.get_model("inventory", "StockReservationTotal")
+    StockReservation.objects.filter(expires_at__lte=now()).delete()
+    StockReservationTotal.objects.bulk_create(
+        StockReservationTotal(
+            product_id=row["product_id"], quantity=row["total"], next_expiry=row["earliest"]
+        )
+        for row in StockReservation.objects.values("product_id").annotate(
+            total=Sum("quantity"), earliest=Min("expires_at")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_product_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservationTotal',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reservation_total', serialize=False, to='inventory.product')),
+                ('quantity', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('next_expiry', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_reservation_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:15
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_reorder_levels(apps, schema_editor):
+    Product = apps.get_model("inventory", "Product")
+    Product.objects.update(reorder_point=F("reorder_level"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_reservationcart'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_stock_level_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='daily_demand',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='days_of_cover',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='forecast_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_point',
+            field=models.DecimalField(decimal_places=4, default=5, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='suggested_reorder_point',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock', 'reorder_point'], name='product_reorder_point_idx'),
+        ),
+        migrations.RunPython(copy_reorder_levels, migrations.RunPython.noop),
+    ]
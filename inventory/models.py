@@ -1,4 +1,5 @@
 import uuid
+from decimal import Decimal
 
 from django.db import models
 from django.utils.timezone import now
@@ -21,15 +22,44 @@ class Product(models.Model):
     cost_price = models.DecimalField(
         max_digits=10, decimal_places=2, blank=True, null=True
     )
+    # Written by `forecast_reorder_points` from the sales ledger: forecast
+    # units sold per day, how many days the stock at forecast time lasts,
+    # and the stock that covers the restock lead time plus safety days.
+    daily_demand = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    days_of_cover = models.DecimalField(
+        max_digits=7, decimal_places=1, blank=True, null=True
+    )
+    suggested_reorder_point = models.DecimalField(
+        max_digits=14, decimal_places=4, default=0
+    )
+    forecast_at = models.DateTimeField(blank=True, null=True)
+    # Low-stock threshold: the larger of the manual reorder level and the
+    # forecast suggestion. It is stored so stock alerts compare two columns.
+    reorder_point = models.DecimalField(max_digits=14, decimal_places=4, default=5)
     created_at = models.DateTimeField(default=now)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["stock", "reorder_point"], name="product_reorder_point_idx"),
+            models.Index(fields=["updated_at", "id"], name="product_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.reorder_point = max(
+            Decimal(self.reorder_level), Decimal(self.suggested_reorder_point)
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {
+            "reorder_level", "suggested_reorder_point"
+        } & set(update_fields):
+            kwargs["update_fields"] = [*update_fields, "reorder_point"]
+        super().save(*args, **kwargs)
+
 
 class StockReservation(models.Model):
     """Short-lived stock claim for a connected point-of-sale cart.
@@ -63,6 +93,50 @@ class StockReservation(models.Model):
         return f"{self.quantity} × {self.product} for {self.device_id}"
 
 
+class ReservationCart(models.Model):
+    """Version of one device's connected cart.
+
+    Every reservation write from the cart moves ``version`` on, and a
+    diff update names the version it was based on, so a retried or
+    out-of-order scan cannot be applied twice.
+    """
+    user = models.ForeignKey(
+        CustomUser, related_name="reservation_carts", on_delete=models.CASCADE
+    )
+    device_id = models.CharField(max_length=100)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "device_id"], name="unique_reservation_cart",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} cart v{self.version}"
+
+
+class StockReservationTotal(models.Model):
+    """Maintained sum of the connected-cart reservations on one product.
+
+    Rewritten by ``inventory.reservations`` under the product's row lock
+    whenever its reservations change, so a whole cart's availability is one
+    indexed read. ``next_expiry`` is the earliest expiry the total includes;
+    once it passes the total is refreshed before it is trusted.
+    """
+    product = models.OneToOneField(
+        Product, primary_key=True, related_name="reservation_total",
+        on_delete=models.CASCADE,
+    )
+    quantity = models.DecimalField(max_digits=14, decimal_places=4)
+    next_expiry = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} reserved of {self.product}"
+
+
 class AuditLog(models.Model):
     """Append-only record of who changed what and when."""
     CREATE = "create"
@@ -136,6 +210,16 @@ class InventoryMovement(models.Model):
 
     class Meta:
         ordering = ["-event_at", "-id"]
+        indexes = [
+            models.Index(fields=["-event_at", "-id"], name="movement_event_id_idx"),
+            # One product's or one device's history is a range scan.
+            models.Index(
+                fields=["product", "-event_at", "-id"], name="movement_product_event_idx"
+            ),
+            models.Index(
+                fields=["device_id", "-event_at", "-id"], name="movement_device_event_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_reason_display()}: {self.quantity:+f} {self.product or 'deleted product'}"
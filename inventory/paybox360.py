@@ -15,6 +15,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal, InvalidOperation, ROUND_FLOOR, ROUND_HALF_UP
 from pathlib import Path
+from typing import Iterator
 from xml.etree import ElementTree
 
 
@@ -53,7 +54,86 @@ def _column_number(reference: str) -> int:
     return result - 1
 
 
-def read_first_xlsx_sheet(path: str | Path) -> list[list[str]]:
+def _iterparse_detached(handle, tag: str):
+    """Yield each finished ``tag`` element, then detach it from its parent.
+
+    ``iterparse`` keeps building the whole tree, so dropping every element
+    once it has been used keeps memory flat however long the part is.
+    """
+    parents = []
+    for event, element in ElementTree.iterparse(handle, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag != tag:
+            continue
+        yield element
+        if parents:
+            parents[-1].remove(element)
+
+
+class _SharedStrings:
+    """A workbook's shared strings, parsed only as far as a cell needs.
+
+    Cells refer to strings by index and a sheet mostly asks for them in
+    rising order, so entries are read from the part with ``iterparse`` up
+    to the highest index requested. Nothing is read for a workbook that
+    only uses inline strings.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self._archive = archive
+        self._handle = None
+        self._items = None
+        self._strings: list[str] = []
+
+    def _iter_items(self):
+        for element in _iterparse_detached(self._handle, f"{{{SHEET_NS}}}si"):
+            yield "".join(element.itertext())
+
+    def __getitem__(self, index: int) -> str:
+        if self._items is None:
+            try:
+                self._handle = self._archive.open("xl/sharedStrings.xml")
+            except KeyError:
+                raise ValueError("Inventory workbook refers to missing shared strings.") from None
+            self._items = self._iter_items()
+        while len(self._strings) <= index:
+            try:
+                self._strings.append(next(self._items))
+            except StopIteration:
+                raise ValueError(f"Inventory workbook has no shared string {index}.") from None
+        return self._strings[index]
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+
+
+def _row_values(row, shared_strings: _SharedStrings) -> list[str]:
+    values: dict[int, str] = {}
+    for cell in row.iter(f"{{{SHEET_NS}}}c"):
+        index = _column_number(cell.attrib.get("r", "A1"))
+        cell_type = cell.attrib.get("t")
+        if cell_type == "inlineStr":
+            value = "".join(cell.itertext())
+        else:
+            node = cell.find(f"{{{SHEET_NS}}}v")
+            value = node.text if node is not None and node.text is not None else ""
+            if cell_type == "s" and value:
+                value = shared_strings[int(value)]
+        values[index] = clean_text(value)
+    width = max(values, default=-1) + 1
+    return [values.get(index, "") for index in range(width)]
+
+
+def iter_first_xlsx_sheet(path: str | Path) -> Iterator[list[str]]:
+    """Yield the first worksheet's rows one at a time.
+
+    The sheet is read with ``iterparse`` and each row element is dropped
+    once it has been yielded, so memory does not grow with the sheet.
+    """
     path = Path(path)
     try:
         archive = zipfile.ZipFile(path)
@@ -61,32 +141,17 @@ def read_first_xlsx_sheet(path: str | Path) -> list[list[str]]:
         raise ValueError(f"Could not open inventory workbook {path}: {exc}") from exc
 
     with archive:
-        shared_strings = []
-        if "xl/sharedStrings.xml" in archive.namelist():
-            root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
-            shared_strings = ["".join(item.itertext()) for item in root]
         try:
-            root = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+            handle = archive.open("xl/worksheets/sheet1.xml")
         except KeyError as exc:
             raise ValueError("Inventory workbook has no first worksheet.") from exc
-
-    rows: list[list[str]] = []
-    for row in root.findall(f".//{{{SHEET_NS}}}sheetData/{{{SHEET_NS}}}row"):
-        values: dict[int, str] = {}
-        for cell in row.findall(f"{{{SHEET_NS}}}c"):
-            index = _column_number(cell.attrib.get("r", "A1"))
-            cell_type = cell.attrib.get("t")
-            if cell_type == "inlineStr":
-                value = "".join(cell.itertext())
-            else:
-                node = cell.find(f"{{{SHEET_NS}}}v")
-                value = node.text if node is not None and node.text is not None else ""
-                if cell_type == "s" and value:
-                    value = shared_strings[int(value)]
-            values[index] = clean_text(value)
-        width = max(values, default=-1) + 1
-        rows.append([values.get(index, "") for index in range(width)])
-    return rows
+        shared_strings = _SharedStrings(archive)
+        try:
+            for row in _iterparse_detached(handle, f"{{{SHEET_NS}}}row"):
+                yield _row_values(row, shared_strings)
+        finally:
+            shared_strings.close()
+            handle.close()
 
 
 @dataclass(frozen=True)
@@ -108,19 +173,17 @@ class CustomerImportRow:
 
 
 def read_inventory(path: str | Path, rounding: str = "exact"):
-    rows = read_first_xlsx_sheet(path)
+    rows = enumerate(iter_first_xlsx_sheet(path), start=1)
     expected = ["category", "subcategory", "item", "quantity", "stock price", "selling price"]
-    header_index = next(
-        (index for index, row in enumerate(rows) if [clean_text(v).casefold() for v in row[:6]] == expected),
-        None,
-    )
-    if header_index is None:
+    # Title lines come before the header; everything after it is read as
+    # it streams out of the workbook.
+    if not any([clean_text(v).casefold() for v in row[:6]] == expected for _, row in rows):
         raise ValueError("Inventory workbook is missing the expected six-column header.")
 
     grouped: OrderedDict[str, list[ProductImportRow]] = OrderedDict()
     errors = []
     below_cost = []
-    for source_row, values in enumerate(rows[header_index + 1 :], start=header_index + 2):
+    for source_row, values in rows:
         if not any(values):
             continue
         padded = values + [""] * (6 - len(values))
@@ -0,0 +1,153 @@
+"""Connected-cart stock reservations and their per-product totals.
+
+``StockReservationTotal`` holds, per product, the sum of its reservations
+and the earliest expiry among them. Every writer holds the product row
+locks, changes the reservation rows, then calls ``refresh_totals`` for the
+products it touched. Readers take the totals as they are unless their
+``next_expiry`` has passed, in which case only those products are purged
+and recomputed. Expired reservations elsewhere are left to
+``sweep_expired``, which runs in the background.
+
+A cart that loses lapsed lines to a purge has its version moved on, so the
+device's next diff update is refused and it resends the whole cart.
+"""
+
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Min, OuterRef, Q, Subquery, Sum
+from django.utils.timezone import now
+
+from api import metrics
+from api.realtime import collect_change
+
+from .models import Product, ReservationCart, StockReservation, StockReservationTotal
+
+
+def _bump_carts(carts):
+    condition = Q()
+    for user_id, device_id in carts:
+        condition |= Q(user_id=user_id, device_id=device_id)
+    ReservationCart.objects.filter(condition).update(version=F("version") + 1)
+
+
+def refresh_totals(product_ids, at=None, writing_cart=None):
+    """Drop expired reservations of ``product_ids`` and rewrite their totals.
+
+    The caller must hold the row locks of every product in ``product_ids``.
+    ``writing_cart`` is the ``(user_id, device_id)`` of a cart whose version
+    the caller moves itself under the cart lock, so purging its lines does
+    not move it again. Returns the number of expired reservations removed.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    at = at or now()
+    expired = list(StockReservation.objects.filter(
+        product_id__in=product_ids, expires_at__lte=at
+    ).values_list("pk", "user_id", "device_id"))
+    purged = len(expired)
+    if expired:
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in expired]).delete()
+        # Carts are locked before products by the reservation views, so the
+        # owners' versions move once the product locks are released.
+        carts = {(user_id, device_id) for _, user_id, device_id in expired}
+        carts.discard(writing_cart)
+        if carts:
+            transaction.on_commit(partial(_bump_carts, carts))
+    live = StockReservation.objects.filter(product_id__in=product_ids).values(
+        "product_id"
+    ).annotate(total=Sum("quantity"), earliest=Min("expires_at"))
+    totals = [
+        StockReservationTotal(
+            product_id=row["product_id"], quantity=row["total"], next_expiry=row["earliest"]
+        )
+        for row in live
+    ]
+    StockReservationTotal.objects.filter(product_id__in=product_ids).exclude(
+        product_id__in=[total.product_id for total in totals]
+    ).delete()
+    if totals:
+        StockReservationTotal.objects.bulk_create(
+            totals, update_conflicts=True, unique_fields=["product"],
+            update_fields=["quantity", "next_expiry"],
+        )
+    return purged
+
+
+def _read_totals(product_ids, user, device_id):
+    own = StockReservation.objects.filter(
+        product_id=OuterRef("product_id"), user=user, device_id=device_id
+    ).values("quantity")[:1]
+    return {
+        row["product_id"]: row
+        for row in StockReservationTotal.objects.filter(product_id__in=product_ids).annotate(
+            own=Subquery(own)
+        ).values("product_id", "quantity", "next_expiry", "own")
+    }
+
+
+def cart_holds(product_ids, *, user, device_id, writing=False):
+    """Return ``{product_id: (reserved_elsewhere, reserved_by_this_cart)}``.
+
+    One read of the totals with the cart's own lines joined in. Products
+    without reservations are left out. The caller must hold the product
+    row locks, since stale totals are refreshed in place. ``writing`` is
+    set when the caller is about to move this cart's version itself.
+    """
+    product_ids = list(product_ids)
+    at = now()
+    rows = _read_totals(product_ids, user, device_id)
+    stale = [product_id for product_id, row in rows.items() if row["next_expiry"] <= at]
+    if stale:
+        refresh_totals(stale, at, writing_cart=(user.pk, device_id) if writing else None)
+        rows = _read_totals(product_ids, user, device_id)
+    holds = {}
+    for product_id, row in rows.items():
+        own = (row["own"] or Decimal("0")) if device_id else Decimal("0")
+        holds[product_id] = (row["quantity"] - own, own)
+    return holds
+
+
+def _reserved(product_ids):
+    return dict(
+        StockReservationTotal.objects.filter(product_id__in=product_ids)
+        .values_list("product_id", "quantity")
+    )
+
+
+def sweep_expired(batch_size=500):
+    """Purge expired reservations for up to ``batch_size`` products.
+
+    Products are locked in primary-key order like every other stock
+    writer. Products whose reserved total went down are announced as one
+    ``reservations`` change so carts can offer the freed units. Returns the
+    ids of the products whose totals were refreshed.
+    """
+    at = now()
+    with transaction.atomic():
+        candidates = list(
+            StockReservationTotal.objects.filter(next_expiry__lte=at)
+            .order_by("product_id").values_list("product_id", flat=True)[:batch_size]
+        )
+        if not candidates:
+            return []
+        product_ids = list(
+            Product.objects.select_for_update().filter(pk__in=candidates)
+            .order_by("pk").values_list("pk", flat=True)
+        )
+        before = _reserved(product_ids)
+        purged = refresh_totals(product_ids, at)
+        after = _reserved(product_ids)
+        freed = [
+            {"id": product_id, "reserved": str(after.get(product_id, Decimal("0")))}
+            for product_id in product_ids
+            if after.get(product_id) != before.get(product_id)
+        ]
+        if freed:
+            collect_change(["reservations"], "reservation-sweep", {"reservations": freed})
+    metrics.incr("reservation_sweep.batches")
+    metrics.incr("reservation_sweep.products", len(product_ids))
+    metrics.incr("reservation_sweep.reservations", purged)
+    return product_ids
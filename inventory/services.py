@@ -1,15 +1,43 @@
 """Transactional inventory helpers backed by an append-only movement ledger."""
 
 import uuid
+from decimal import Decimal
 
 from django.db import transaction
+from django.db.models.signals import post_save
 from django.utils.timezone import now
 from rest_framework.exceptions import ValidationError
 
+from api import changes
+
 from .models import InventoryMovement, Product
 from .quantities import parse_quarter_quantity
 
 
+def save_stock_in_bulk(products):
+    """Write the stock of many locked products in a single UPDATE.
+
+    ``bulk_update`` neither touches ``auto_now`` fields nor sends
+    ``post_save``, so both are done here to keep realtime listeners seeing
+    the same per-product saves as ``product.save(update_fields=...)``. Their
+    change-journal entries are written together.
+    """
+    products = list(products)
+    if not products:
+        return
+    saved_at = now()
+    for product in products:
+        product.updated_at = saved_at
+    Product.objects.bulk_update(products, ["stock", "updated_at"])
+    with changes.batched():
+        for product in products:
+            post_save.send(
+                sender=Product, instance=product, created=False,
+                update_fields=frozenset({"stock", "updated_at"}), raw=False,
+                using=product._state.db,
+            )
+
+
 @transaction.atomic
 def adjust_inventory(*, product, quantity, reason, user=None, note="", event_at=None):
     try:
@@ -43,3 +71,74 @@ def adjust_inventory(*, product, quantity, reason, user=None, note="", event_at=
         synced_at=now(),
         note=note,
     )
+
+
+@transaction.atomic
+def apply_stock_take(*, counts, user=None, note="", event_at=None):
+    """Set many products to their counted stock in one transaction.
+
+    ``counts`` maps product ids to counted quantities. Products are locked
+    in primary-key order, every non-zero difference becomes a correction
+    movement, and all stock is written with one UPDATE. Returns the
+    variance report, one line per counted product.
+    """
+    try:
+        counted = {
+            int(product_id): parse_quarter_quantity(quantity, allow_zero=True)
+            for product_id, quantity in counts.items()
+        }
+    except ValueError as exc:
+        raise ValidationError(str(exc)) from exc
+    products = list(
+        Product.objects.select_for_update().filter(pk__in=counted).order_by("pk")
+    )
+    if len(products) != len(counted):
+        raise ValidationError("One or more products are no longer available.")
+
+    take_reference = uuid.uuid4()
+    event_at = event_at or now()
+    changed = []
+    movements = []
+    lines = []
+    for product in products:
+        expected = product.stock
+        variance = counted[product.pk] - expected
+        lines.append({
+            "product": product.pk,
+            "product_name": product.name,
+            "expected": expected,
+            "counted": counted[product.pk],
+            "variance": variance,
+            "variance_value": (
+                (variance * product.cost_price).quantize(Decimal("0.01"))
+                if product.cost_price is not None else None
+            ),
+        })
+        if not variance:
+            continue
+        product.stock = counted[product.pk]
+        changed.append(product)
+        movements.append(InventoryMovement(
+            product=product,
+            user=user,
+            quantity=variance,
+            stock_after=product.stock,
+            reason=InventoryMovement.CORRECTION,
+            client_reference=f"stocktake:{take_reference}:{product.pk}",
+            event_at=event_at,
+            synced_at=now(),
+            note=note or "Stock take",
+        ))
+
+    save_stock_in_bulk(changed)
+    InventoryMovement.objects.bulk_create(movements)
+    return {
+        "reference": take_reference,
+        "counted": len(lines),
+        "adjusted": len(changed),
+        "variance_value": sum(
+            (line["variance_value"] for line in lines if line["variance_value"] is not None),
+            Decimal("0.00"),
+        ),
+        "lines": lines,
+    }
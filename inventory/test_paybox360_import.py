@@ -4,12 +4,15 @@ import tempfile
 import zipfile
 from decimal import Decimal
 from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
 from django.core.management import call_command
 from django.test import TestCase
 
 from customers.models import Customer
 from inventory.models import InventoryMovement, Product
+from inventory.paybox360 import _SharedStrings, iter_first_xlsx_sheet, read_inventory
 from users.models import CustomUser
 
 
@@ -117,3 +120,79 @@ class Paybox360ImportTests(TestCase):
             call_command("import_paybox360", **options)
         self.assertEqual(Product.objects.get(name="Gino Tomato").stock, 4)
         self.assertEqual(InventoryMovement.objects.count(), 2)
+
+    def test_workbook_rows_stream_with_shared_strings_resolved_on_demand(self):
+        namespace = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+        strings = ["Category", "Subcategory", "Item", "Quantity", "Stock Price", "Selling Price", "Rice"]
+        shared = (
+            f'<sst xmlns="{namespace}">'
+            + "".join(f"<si><t>{value}</t></si>" for value in strings)
+            + "</sst>"
+        )
+        header = "".join(f'<c r="{chr(65 + index)}2" t="s"><v>{index}</v></c>' for index in range(6))
+        rows = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Akinfolu  Foods</t></is></c></row>'
+            f'<row r="2">{header}</row>'
+            '<row r="3"><c r="A3" t="s"><v>6</v></c><c r="C3" t="s"><v>6</v></c>'
+            '<c r="D3"><v>2.5</v></c><c r="E3"><v>900</v></c><c r="F3"><v>1000</v></c></row>'
+            '<row r="4"><c r="C4" t="s"><v>6</v></c><c r="D4"><v>-1</v></c>'
+            '<c r="E4"><v>900</v></c><c r="F4"><v>1000</v></c></row>'
+        )
+        with tempfile.TemporaryDirectory() as temp:
+            workbook = Path(temp) / "inventory.xlsx"
+            with zipfile.ZipFile(workbook, "w") as archive:
+                archive.writestr("xl/sharedStrings.xml", shared)
+                archive.writestr(
+                    "xl/worksheets/sheet1.xml",
+                    f'<worksheet xmlns="{namespace}"><sheetData>{rows}</sheetData></worksheet>',
+                )
+            products, report = read_inventory(workbook)
+
+            # Rows are produced as the sheet is parsed, before its end.
+            truncated = Path(temp) / "truncated.xlsx"
+            with zipfile.ZipFile(truncated, "w") as archive:
+                archive.writestr("xl/sharedStrings.xml", shared)
+                archive.writestr(
+                    "xl/worksheets/sheet1.xml",
+                    f'<worksheet xmlns="{namespace}"><sheetData>{rows}<row r="5"><c',
+                )
+            stream = iter_first_xlsx_sheet(truncated)
+            self.assertEqual(next(stream), ["Akinfolu Foods"])
+            self.assertEqual(next(stream)[:3], ["Category", "Subcategory", "Item"])
+            self.assertEqual(next(stream)[:3], ["Rice", "", "Rice"])
+            next(stream)
+            with self.assertRaises(ElementTree.ParseError):
+                next(stream)
+
+        self.assertEqual([(product.name, product.stock) for product in products], [("Rice", Decimal("2.5"))])
+        self.assertEqual(report["errors"], [{"row": 4, "error": "quantity and prices cannot be negative"}])
+
+    def test_shared_strings_are_detached_once_read(self):
+        namespace = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+        shared = (
+            f'<sst xmlns="{namespace}">'
+            + "".join(f"<si><r><t>Item {index}</t></r></si>" for index in range(50))
+            + "</sst>"
+        )
+        roots = []
+        iterparse = ElementTree.iterparse
+
+        def recording_iterparse(source, events):
+            for event, element in iterparse(source, events):
+                if not roots:
+                    roots.append(element)
+                yield event, element
+
+        with tempfile.TemporaryDirectory() as temp:
+            workbook = Path(temp) / "strings.xlsx"
+            with zipfile.ZipFile(workbook, "w") as archive:
+                archive.writestr("xl/sharedStrings.xml", shared)
+            with zipfile.ZipFile(workbook) as archive, \
+                    mock.patch.object(ElementTree, "iterparse", recording_iterparse):
+                strings = _SharedStrings(archive)
+                self.assertEqual(strings[49], "Item 49")
+                self.assertEqual(strings[3], "Item 3")
+                strings.close()
+        # Only the last string parsed is still attached to the root.
+        self.assertEqual(roots[0].tag, f"{{{namespace}}}sst")
+        self.assertEqual(len(roots[0]), 1)
@@ -1,8 +1,20 @@
+import io
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import make_aware, now
 from rest_framework.test import APIClient
 
+from api.models import ChangeEntry, Tombstone
+from customers.models import Customer
 from users.models import CustomUser
+from . import forecast
 from .models import Product, InventoryMovement
 
 
@@ -34,6 +46,60 @@ class ProductTests(TestCase):
         categories = self.client_api.get("/api/v1/products/categories/").json()
         self.assertEqual(categories, ["Canned", "Grains"])
 
+    def test_updated_since_returns_changed_rows_and_tombstones(self):
+        watermark = now()
+        Product.objects.create(name="Old stock", price=100, stock=1)
+        Product.objects.filter(name="Old stock").update(updated_at=watermark - timedelta(days=1))
+        changed = Product.objects.create(name="Fresh", price=200, stock=2)
+        removed = Product.objects.create(name="Gone", price=300, stock=3)
+        removed_id = removed.id
+        removed.delete()
+        query = urlencode({"updated_since": watermark.isoformat()})
+
+        synced = self.client_api.get(f"/api/v1/products/?{query}").json()
+        self.assertEqual([item["id"] for item in synced["results"]], [changed.id])
+        self.assertEqual(synced["deleted"], [removed_id])
+        self.assertNotIn("deleted", self.client_api.get("/api/v1/products/").json())
+
+        customer = Customer.objects.create(user=self.admin, name="Mirror")
+        customer_id = customer.id
+        customer.delete()
+        customers = self.client_api.get(f"/api/v1/customers/?{query}").json()
+        self.assertEqual(customers["results"], [])
+        self.assertEqual(customers["deleted"], [customer_id])
+        self.assertEqual(
+            self.client_api.get("/api/v1/products/?updated_since=yesterday").status_code, 400
+        )
+
+    def test_updated_since_older_than_the_retained_tombstones_asks_for_a_resync(self):
+        product = Product.objects.create(name="Dropped", price=100, stock=1)
+        product.delete()
+        Tombstone.objects.update(deleted_at=now() - timedelta(days=40))
+        call_command("prune_change_journal", stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+        stale = urlencode({"updated_since": (now() - timedelta(days=35)).isoformat()})
+        synced = self.client_api.get(f"/api/v1/products/?{stale}").json()
+        self.assertTrue(synced["resync"])
+        self.assertEqual((synced["results"], synced["deleted"]), ([], []))
+        recent = urlencode({"updated_since": (now() - timedelta(days=1)).isoformat()})
+        self.assertFalse(self.client_api.get(f"/api/v1/products/?{recent}").json()["resync"])
+
+    def test_sync_watermark_trails_the_pull_so_late_commits_are_not_skipped(self):
+        watermark = self.client_api.get("/api/v1/products/").json()["sync_watermark"]
+        trailing = datetime.fromisoformat(watermark)
+        self.assertLessEqual(
+            trailing, now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+        )
+        # Stamped just before that pull ran, but committed after it.
+        late = Product.objects.create(name="Late", price=100, stock=1)
+        Product.objects.filter(pk=late.pk).update(updated_at=trailing + timedelta(seconds=1))
+
+        synced = self.client_api.get(
+            f"/api/v1/products/?{urlencode({'updated_since': watermark})}"
+        ).json()
+        self.assertEqual([item["id"] for item in synced["results"]], [late.id])
+
     def test_update_and_delete_product(self):
         created = self.client_api.post(
             "/api/v1/products/", {"name": "Garri", "price": "300", "stock": 8}, format="json").json()
@@ -141,6 +207,74 @@ class ProductTests(TestCase):
         product.refresh_from_db()
         self.assertEqual(product.stock, 11)
 
+    def test_stock_take_books_corrections_and_reports_variance(self):
+        rice = Product.objects.create(
+            name="Rice", price=Decimal("100"), cost_price=Decimal("80"), stock=10
+        )
+        oil = Product.objects.create(name="Oil", price=Decimal("100"), stock=4)
+        salt = Product.objects.create(name="Salt", price=Decimal("50"), stock=6)
+
+        res = self.client_api.post("/api/v1/inventory-movements/stock-take/", {
+            "counts": [
+                {"product": rice.id, "counted": "8.5"},
+                {"product": oil.id, "counted": 6},
+                {"product": salt.id, "counted": 6},
+            ],
+            "note": "March count",
+        }, format="json")
+
+        self.assertEqual(res.status_code, 200)
+        report = res.json()
+        self.assertEqual((report["counted"], report["adjusted"]), (3, 2))
+        variances = {line["product"]: Decimal(str(line["variance"])) for line in report["lines"]}
+        self.assertEqual(variances, {rice.id: Decimal("-1.5"), oil.id: 2, salt.id: 0})
+        self.assertEqual(Decimal(str(report["variance_value"])), Decimal("-120.00"))
+        corrections = InventoryMovement.objects.filter(reason=InventoryMovement.CORRECTION)
+        self.assertEqual(corrections.count(), 2)
+        self.assertEqual(corrections.get(product=oil).stock_after, 6)
+        rice.refresh_from_db()
+        self.assertEqual(rice.stock, Decimal("8.5"))
+
+        def take(products):
+            with CaptureQueriesContext(connection) as queries:
+                self.client_api.post("/api/v1/inventory-movements/stock-take/", {
+                    "counts": [{"product": product.id, "counted": 1} for product in products],
+                }, format="json")
+            return len(queries)
+
+        extra = [Product.objects.create(name=f"Extra {n}", price=1, stock=3) for n in range(4)]
+        self.assertEqual(take(extra[:1]), take(extra[1:]))
+
+        duplicate = self.client_api.post("/api/v1/inventory-movements/stock-take/", {
+            "counts": [{"product": rice.id, "counted": 1}, {"product": rice.id, "counted": 2}],
+        }, format="json")
+        self.assertEqual(duplicate.status_code, 400)
+
+    def test_movement_ledger_is_cursor_paginated_and_filterable(self):
+        rice = Product.objects.create(name="Rice", price=Decimal("100"), stock=0)
+        beans = Product.objects.create(name="Beans", price=Decimal("100"), stock=0)
+        for product in (rice, beans, rice, rice):
+            self.client_api.post("/api/v1/inventory-movements/", {
+                "product": product.id, "quantity": 1, "reason": "restock",
+            }, format="json")
+
+        page = self.client_api.get(
+            f"/api/v1/inventory-movements/?product={rice.id}&page_size=2"
+        ).json()
+        self.assertIsNone(page["count"])
+        history = [row["stock_after"] for row in page["results"]]
+        page = self.client_api.get(page["next"]).json()
+        history.extend(row["stock_after"] for row in page["results"])
+        self.assertIsNone(page["next"])
+        self.assertEqual(history, [3, 2, 1])
+
+        counted = self.client_api.get(
+            "/api/v1/inventory-movements/?reason=restock&date_from=2000-01-01&count=true"
+        ).json()
+        self.assertEqual(counted["count"], 4)
+        future = self.client_api.get("/api/v1/inventory-movements/?date_from=2999-01-01").json()
+        self.assertEqual(future["results"], [])
+
     def test_product_deletion_keeps_ledger_history(self):
         created = self.client_api.post("/api/v1/products/", {
             "name": "Disposable item", "price": "10", "stock": 2,
@@ -153,6 +287,79 @@ class ProductTests(TestCase):
         movement = InventoryMovement.objects.get(id=movement_id)
         self.assertIsNone(movement.product_id)
 
-    def test_api_responses_are_not_cacheable(self):
+    def test_api_responses_are_revalidated_or_not_stored(self):
         res = self.client_api.get("/api/v1/products/")
+        self.assertEqual(res["Cache-Control"], "private, no-cache")
+        self.assertTrue(res.has_header("ETag"))
+        res = self.client_api.get("/api/v1/inventory-movements/")
         self.assertEqual(res["Cache-Control"], "no-store")
+        self.assertFalse(res.has_header("ETag"))
+
+    def test_reorder_forecast_stores_cover_and_drives_low_stock(self):
+        today = date(2026, 7, 17)  # a Friday
+        steady = Product.objects.create(name="Rice", price=Decimal("100"), stock=20, reorder_level=2)
+        weekend = Product.objects.create(name="Palm oil", price=Decimal("100"), stock=5, reorder_level=2)
+        idle = Product.objects.create(name="Salt", price=Decimal("100"), stock=1, reorder_level=3)
+
+        def moved(product, day, quantity, reason=InventoryMovement.SALE):
+            InventoryMovement.objects.create(
+                product=product, quantity=quantity, stock_after=product.stock, reason=reason,
+                event_at=make_aware(datetime.combine(day, time(12))),
+            )
+
+        for offset in range(1, 15):
+            day = today - timedelta(days=offset)
+            moved(steady, day, -2)
+            if day.weekday() == 5:
+                moved(weekend, day, -8)
+                moved(weekend, day, 1, reason=InventoryMovement.RETURN)
+        # Outside the window.
+        moved(steady, today - timedelta(days=30), -50)
+
+        watermark = now()
+        written, selling = forecast.run(
+            window_days=14, recent_days=14, lead_time_days=7, safety_days=1, today=today
+        )
+        self.assertEqual((written, selling), (3, 2))
+
+        # Only products whose figures moved are handed to syncing devices.
+        query = urlencode({"updated_since": watermark.isoformat()})
+        synced = self.client_api.get(f"/api/v1/products/?{query}").json()
+        self.assertEqual(
+            {item["name"] for item in synced["results"]}, {"Rice", "Palm oil"}
+        )
+        self.assertEqual(
+            set(ChangeEntry.objects.filter(
+                resource="products", created_at__gte=watermark
+            ).values_list("object_id", flat=True)),
+            {steady.id, weekend.id},
+        )
+
+        steady.refresh_from_db()
+        self.assertEqual(steady.daily_demand, Decimal("2"))
+        self.assertEqual(steady.days_of_cover, Decimal("10.0"))
+        self.assertEqual(steady.suggested_reorder_point, Decimal("16"))
+        self.assertEqual(steady.reorder_point, Decimal("16"))
+
+        # All of the weekly demand falls on Saturday, tomorrow.
+        weekend.refresh_from_db()
+        self.assertEqual(weekend.daily_demand, Decimal("1"))
+        self.assertEqual(weekend.days_of_cover, Decimal("1.7"))
+        self.assertEqual(weekend.suggested_reorder_point, Decimal("8"))
+
+        idle.refresh_from_db()
+        self.assertEqual((idle.daily_demand, idle.days_of_cover), (0, None))
+        self.assertEqual(idle.reorder_point, Decimal("3"))
+
+        def low_stock():
+            response = self.client_api.get("/api/v1/products/?stock_status=low_stock")
+            return {row["name"] for row in response.json()["results"]}
+
+        self.assertEqual(low_stock(), {"Palm oil", "Salt"})
+
+        # Raising the manual level lifts the stored threshold with it.
+        steady.reorder_level = 25
+        steady.save(update_fields=["reorder_level"])
+        steady.refresh_from_db()
+        self.assertEqual(steady.reorder_point, Decimal("25"))
+        self.assertEqual(low_stock(), {"Rice", "Palm oil", "Salt"})
@@ -2,17 +2,36 @@ from django.contrib import admin
 from .models import Sale, SaleItem, Payment, Refund, CreditNote, CreditNoteItem
 
 
-class SaleItemInline(admin.TabularInline):
+class ReadOnlyAdminMixin:
+    """View-only admin for rows that the sales services must write.
+
+    Payments, refunds, credit notes and sale lines move the stored
+    settlement totals, stock and daily rollups through ``sales.services``.
+    An admin form would save the row alone and leave those figures out of
+    step, so changes go through the API instead.
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class SaleItemInline(ReadOnlyAdminMixin, admin.TabularInline):
     model = SaleItem
     extra = 0
 
 
-class PaymentInline(admin.TabularInline):
+class PaymentInline(ReadOnlyAdminMixin, admin.TabularInline):
     model = Payment
     extra = 0
 
 
-class RefundInline(admin.TabularInline):
+class RefundInline(ReadOnlyAdminMixin, admin.TabularInline):
     model = Refund
     extra = 0
 
@@ -22,10 +41,15 @@ class SaleAdmin(admin.ModelAdmin):
     list_display = ("invoice_number", "customer", "date", "total", "payment_status")
     list_filter = ("date",)
     search_fields = ("invoice_number", "customer__name")
+    readonly_fields = Sale.SETTLEMENT_FIELDS
     inlines = [SaleItemInline, PaymentInline, RefundInline]
 
+    def has_delete_permission(self, request, obj=None):
+        # Deleting a sale restocks it and takes it out of the rollups,
+        # which only the delete_sale service does.
+        return False
+
 
-admin.site.register(CreditNote)
-admin.site.register(CreditNoteItem)
-admin.site.register(Payment)
-admin.site.register(Refund)
+@admin.register(CreditNote, CreditNoteItem, Payment, Refund)
+class SalesRecordAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
+    pass
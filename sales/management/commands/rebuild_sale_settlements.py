@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sales.models import Sale
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute each sale's stored payment, credit and refund totals from "
+        "its payments, refunds and credit notes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report sales whose stored totals have drifted; change nothing.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        sales = Sale.objects.prefetch_related(
+            "payments", "refunds", "credit_notes__items"
+        ).order_by("pk")
+        checked = 0
+        drifted = []
+        for sale in sales.iterator(chunk_size=options["chunk_size"]):
+            checked += 1
+            stored = {field: getattr(sale, field) for field in Sale.SETTLEMENT_FIELDS}
+            sale.recompute_settlement()
+            if all(getattr(sale, field) == value for field, value in stored.items()):
+                continue
+            drifted.append(sale.invoice_number)
+            if not options["verify"]:
+                with transaction.atomic():
+                    locked = Sale.objects.select_for_update().get(pk=sale.pk)
+                    locked.recompute_settlement()
+                    locked.save(update_fields=[*Sale.SETTLEMENT_FIELDS, "updated_at"])
+
+        for invoice_number in drifted:
+            self.stdout.write(f"{invoice_number}: stored settlement totals were out of date")
+        if options["verify"] and drifted:
+            raise CommandError(f"{len(drifted)} of {checked} sale(s) have drifted settlement totals.")
+        if options["verify"]:
+            message = f"Checked {checked} sale(s); all settlement totals match."
+        else:
+            message = f"Checked {checked} sale(s); rebuilt {len(drifted)}."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,49 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales import rollups
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"{value} is not a YYYY-MM-DD date.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups from sales, payments, refunds and "
+        "credit notes, for every day or a date range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", type=parse_date)
+        parser.add_argument("--date-to", type=parse_date)
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report days whose stored rollups have drifted; change nothing.",
+        )
+
+    def handle(self, *args, **options):
+        date_from, date_to = options["date_from"], options["date_to"]
+        if date_from and date_to and date_from > date_to:
+            raise CommandError("--date-from must not be after --date-to.")
+
+        expected = rollups.expected(date_from, date_to)
+        stored = rollups.stored(date_from, date_to)
+        drifted = sorted({
+            key[0] for key in set(expected) | set(stored)
+            if expected.get(key) != stored.get(key)
+        })
+        for day in drifted:
+            self.stdout.write(f"{day.isoformat()}: stored rollups were out of date")
+        if options["verify"] and drifted:
+            raise CommandError(f"{len(drifted)} day(s) have drifted sales rollups.")
+        if options["verify"]:
+            message = "All sales rollups match."
+        else:
+            rows = rollups.rebuild(date_from, date_to)
+            message = f"Rebuilt {rows} rollup row(s); {len(drifted)} day(s) had drifted."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:57
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_settlement_totals(apps, schema_editor):
+    Sale = apps.get_model("sales", "Sale")
+    sales = Sale.objects.prefetch_related("payments", "refunds", "credit_notes__items")
+    for sale in sales.iterator(chunk_size=500):
+        vat_factor = Decimal("1") + (sale.vat_rate / Decimal("100"))
+        sale.amount_paid = sum((p.amount for p in sale.payments.all()), Decimal("0"))
+        sale.amount_refunded = sum((r.amount for r in sale.refunds.all()), Decimal("0"))
+        sale.amount_credited = sum(
+            (
+                sum(
+                    (item.quantity * item.unit_price * vat_factor for item in note.items.all()),
+                    Decimal("0"),
+                ).quantize(Decimal("0.01"))
+                for note in sale.credit_notes.all()
+            ),
+            Decimal("0"),
+        )
+        net_total = max(sale.total - sale.amount_credited, Decimal("0"))
+        sale.balance = net_total - sale.amount_paid + sale.amount_refunded
+        sale.receivable = max(sale.balance, Decimal("0"))
+        sale.refund_due = max(-sale.balance, Decimal("0"))
+        net_paid = sale.amount_paid - sale.amount_refunded
+        if net_total <= 0 or net_paid >= net_total:
+            sale.payment_status = "paid"
+        elif net_paid <= 0:
+            sale.payment_status = "pending"
+        else:
+            sale.payment_status = "partial"
+        sale.save(update_fields=[
+            "amount_paid", "amount_credited", "amount_refunded", "balance",
+            "receivable", "refund_due", "payment_status",
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_alter_creditnoteitem_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='amount_credited',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='amount_refunded',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='payment_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('partial', 'Partially paid'), ('paid', 'Paid')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='receivable',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='refund_due',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_settlement_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_legacy_id'),
+        ('sales', '0008_sale_settlement_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('receivable__gt', 0), ('refund_due__gt', 0), _connector='OR'), fields=['receivable', 'refund_due'], name='sale_open_balance_idx'),
+        ),
+    ]
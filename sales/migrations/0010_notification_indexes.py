@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_legacy_id'),
+        ('sales', '0009_sale_open_balance_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date'], name='sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['inventory_attention', 'inventory_resolution'], name='sale_inventory_attention_idx'),
+        ),
+    ]
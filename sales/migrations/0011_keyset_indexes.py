@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_keyset_indexes'),
+        ('sales', '0010_notification_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['-date', '-id'], name='sale_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:06
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_invoice_counter(apps, schema_editor):
+    # Existing invoices were numbered from their primary key; the counter
+    # continues after the highest one.
+    Sale = apps.get_model("sales", "Sale")
+    InvoiceCounter = apps.get_model("sales", "InvoiceCounter")
+    InvoiceCounter.objects.create(
+        name="invoice", value=Sale.objects.aggregate(last=Max("pk"))["last"] or 0
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceCounter',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_invoice_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils.timezone import localtime
+
+
+def backfill_rollups(apps, schema_editor):
+    Sale = apps.get_model("sales", "Sale")
+    Payment = apps.get_model("sales", "Payment")
+    Refund = apps.get_model("sales", "Refund")
+    CreditNote = apps.get_model("sales", "CreditNote")
+    DailySalesRollup = apps.get_model("sales", "DailySalesRollup")
+
+    figures = defaultdict(lambda: defaultdict(int))
+    for row in Sale.objects.values("date", "user", "device_id").annotate(
+        count=Count("id"), total=Sum("total")
+    ).order_by():
+        key = (row["date"], "", row["user"], row["device_id"] or "")
+        figures[key]["sale_count"] += row["count"]
+        figures[key]["sales_total"] += row["total"]
+    for model, prefix in ((Payment, "payment"), (Refund, "refund")):
+        for row in model.objects.values("date", "method", "sale__user", "sale__device_id").annotate(
+            count=Count("id"), total=Sum("amount")
+        ).order_by():
+            key = (row["date"], row["method"], row["sale__user"], row["sale__device_id"] or "")
+            figures[key][f"{prefix}_count"] += row["count"]
+            figures[key][f"{prefix}s_total"] += row["total"]
+    for note in CreditNote.objects.select_related("sale").prefetch_related("items"):
+        vat_factor = Decimal("1") + note.sale.vat_rate / Decimal("100")
+        credit = sum(
+            (item.quantity * item.unit_price * vat_factor for item in note.items.all()),
+            Decimal("0"),
+        ).quantize(Decimal("0.01"))
+        key = (localtime(note.created_at).date(), "", note.sale.user_id, note.sale.device_id or "")
+        figures[key]["credited_total"] += credit
+
+    DailySalesRollup.objects.bulk_create(
+        DailySalesRollup(date=day, method=method, user_id=user_id, device_id=device_id, **values)
+        for (day, method, user_id, device_id), values in figures.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_invoicecounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('method', models.CharField(blank=True, choices=[('cash', 'Cash'), ('transfer', 'Bank Transfer'), ('pos', 'POS')], default='', max_length=20)),
+                ('device_id', models.CharField(blank=True, default='', max_length=100)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credited_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('payments_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refund_count', models.IntegerField(default=0)),
+                ('refunds_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', 'method'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'method', 'user', 'device_id'), name='unique_daily_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
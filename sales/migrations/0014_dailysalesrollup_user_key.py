@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+FIGURES = (
+    "sale_count", "sales_total", "credited_total", "payment_count",
+    "payments_total", "refund_count", "refunds_total",
+)
+
+
+def fill_user_key(apps, schema_editor):
+    DailySalesRollup = apps.get_model("sales", "DailySalesRollup")
+    DailySalesRollup.objects.filter(user__isnull=False).update(user_key=F("user_id"))
+    # The old key let unattributed rows repeat; fold each set into one row.
+    kept = {}
+    for row in DailySalesRollup.objects.filter(user__isnull=True).order_by("pk"):
+        key = (row.date, row.method, row.device_id)
+        if key not in kept:
+            kept[key] = row
+            continue
+        for name in FIGURES:
+            setattr(kept[key], name, getattr(kept[key], name) + getattr(row, name))
+        kept[key].save(update_fields=FIGURES)
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0013_dailysalesrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailysalesrollup',
+            name='unique_daily_sales_rollup',
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='user_key',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_user_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'method', 'user_key', 'device_id'), name='unique_daily_sales_rollup'),
+        ),
+    ]
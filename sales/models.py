@@ -1,5 +1,6 @@
 from decimal import Decimal, ROUND_HALF_UP
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Max
 from django.utils.timezone import now, localdate
 import uuid
 from users.models import CustomUser
@@ -7,11 +8,49 @@ from customers.models import Customer
 from inventory.models import Product
 
 
+class InvoiceCounter(models.Model):
+    """Last number handed out for a numbering series.
+
+    Numbers are allocated by incrementing the row inside the caller's
+    transaction: the row lock serialises concurrent allocations and a rolled
+    back sale also rolls back its number, so the series has no gaps.
+    """
+    INVOICE = "invoice"
+
+    name = models.CharField(max_length=30, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def allocate(cls, name, seed=lambda: 0):
+        """Return the next value of the `name` series.
+
+        A missing series starts after `seed()`, so numbering can continue
+        from rows created before the counter existed.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(value=F("value") + 1):
+                cls.objects.get_or_create(name=name, defaults={"value": seed()})
+                cls.objects.filter(name=name).update(value=F("value") + 1)
+            return cls.objects.values_list("value", flat=True).get(name=name)
+
+
 class Sale(models.Model):
     """A sale / invoice raised for a customer."""
     PENDING = "pending"
     PARTIAL = "partial"
     PAID = "paid"
+    PAYMENT_STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (PARTIAL, "Partially paid"),
+        (PAID, "Paid"),
+    )
+    SETTLEMENT_FIELDS = (
+        "amount_paid", "amount_credited", "amount_refunded", "balance",
+        "receivable", "refund_due", "payment_status",
+    )
     RETURN_NONE = "none"
     RETURN_PARTIAL = "partial"
     RETURN_FULL = "full"
@@ -53,66 +92,113 @@ class Sale(models.Model):
     vat_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    # Running settlement totals, kept current by the sales services in the
+    # same transaction as the payment, refund or credit note that moves them.
+    # `rebuild_sale_settlements` recomputes them from the related rows.
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    amount_credited = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    amount_refunded = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Signed compatibility field: positive is owed, negative is refundable.
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Amount the customer still owes on this invoice.
+    receivable = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Amount the business owes the customer after returns.
+    refund_due = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payment_status = models.CharField(
+        max_length=10, choices=PAYMENT_STATUS_CHOICES, default=PENDING
+    )
+
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(default=now)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Serves date filters and the directory's (-date, -id) keyset.
+            models.Index(fields=["-date", "-id"], name="sale_date_id_idx"),
+            models.Index(
+                fields=["inventory_attention", "inventory_resolution"],
+                name="sale_inventory_attention_idx",
+            ),
+            # Covers the operations summary's outstanding and refunds-due
+            # totals without visiting settled invoices.
+            models.Index(
+                fields=["receivable", "refund_due"],
+                condition=models.Q(receivable__gt=0) | models.Q(refund_due__gt=0),
+                name="sale_open_balance_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.invoice_number or f"Sale #{self.pk}"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        # The number is allocated before the INSERT so a new sale is written
+        # once instead of being inserted and then updated with its number.
         if not self.invoice_number:
-            self.invoice_number = f"INV-{self.pk:05d}"
-            super().save(update_fields=["invoice_number"])
+            self.invoice_number = self.next_invoice_number()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def next_invoice_number():
+        value = InvoiceCounter.allocate(
+            InvoiceCounter.INVOICE,
+            seed=lambda: Sale.objects.aggregate(last=Max("pk"))["last"] or 0,
+        )
+        return f"INV-{value:05d}"
 
-    def recalculate(self, persist=True):
-        subtotal = sum((item.line_total for item in self.items.all()), Decimal("0"))
+    def recalculate(self, persist=True, items=None):
+        """Recompute the invoice totals from its lines.
+
+        `items` lets a sale that is not saved yet be totalled from its
+        in-memory lines; by default the stored lines are read.
+        """
+        if items is None:
+            items = self.items.all()
+        subtotal = sum((item.line_total for item in items), Decimal("0"))
         taxable = max(subtotal - self.discount, Decimal("0"))
         vat_amount = (taxable * self.vat_rate / Decimal("100")).quantize(Decimal("0.01"))
         self.subtotal = subtotal
         self.vat_amount = vat_amount
         self.total = taxable + vat_amount
+        self.refresh_settlement()
         if persist:
-            super().save(update_fields=["subtotal", "vat_amount", "total", "updated_at"])
-
-    @property
-    def amount_paid(self):
-        if "payments" in getattr(self, "_prefetched_objects_cache", {}):
-            return sum((payment.amount for payment in self.payments.all()), Decimal("0"))
-        return self.payments.aggregate(total=models.Sum("amount"))["total"] or Decimal("0")
-
-    @property
-    def amount_credited(self):
-        total = Decimal("0")
-        for note in self.credit_notes.all():
-            total += note.amount
-        return total
-
-    @property
-    def amount_refunded(self):
-        if "refunds" in getattr(self, "_prefetched_objects_cache", {}):
-            return sum((refund.amount for refund in self.refunds.all()), Decimal("0"))
-        return self.refunds.aggregate(total=models.Sum("amount"))["total"] or Decimal("0")
+            super().save(update_fields=[
+                "subtotal", "vat_amount", "total", *self.SETTLEMENT_FIELDS, "updated_at",
+            ])
+
+    def refresh_settlement(self):
+        """Derive balance and payment status from the stored running totals."""
+        self.balance = self.net_total - self.amount_paid + self.amount_refunded
+        self.receivable = max(self.balance, Decimal("0"))
+        self.refund_due = max(-self.balance, Decimal("0"))
+        net_paid = self.amount_paid - self.amount_refunded
+        if self.net_total <= 0 or net_paid >= self.net_total:
+            self.payment_status = self.PAID
+        elif net_paid <= 0:
+            self.payment_status = self.PENDING
+        else:
+            self.payment_status = self.PARTIAL
+
+    def recompute_settlement(self):
+        """Rebuild the running totals from payments, refunds and credit notes."""
+        self.amount_paid = sum((payment.amount for payment in self.payments.all()), Decimal("0"))
+        self.amount_refunded = sum((refund.amount for refund in self.refunds.all()), Decimal("0"))
+        self.amount_credited = sum(
+            (
+                CreditNote.amount_for(note.items.all(), self.vat_rate)
+                for note in self.credit_notes.all()
+            ),
+            Decimal("0"),
+        )
+        self.refresh_settlement()
 
     @property
     def net_total(self):
         """Invoice value after all credit notes, never below zero."""
         return max(self.total - self.amount_credited, Decimal("0"))
 
-    @property
-    def receivable(self):
-        """Amount the customer still owes on this invoice."""
-        return max(self.balance, Decimal("0"))
-
-    @property
-    def refund_due(self):
-        """Amount the business owes the customer after returns."""
-        return max(-self.balance, Decimal("0"))
-
     @property
     def return_status(self):
         sold_units = sum((item.quantity for item in self.items.all()), Decimal("0"))
@@ -130,22 +216,6 @@ class Sale(models.Model):
             return self.RETURN_FULL
         return self.RETURN_PARTIAL
 
-    @property
-    def balance(self):
-        """Signed compatibility field: positive is owed, negative is refundable."""
-        return self.net_total - self.amount_paid + self.amount_refunded
-
-    @property
-    def payment_status(self):
-        net_paid = self.amount_paid - self.amount_refunded
-        if self.net_total <= 0:
-            return self.PAID
-        if net_paid <= 0:
-            return self.PENDING
-        if net_paid >= self.net_total:
-            return self.PAID
-        return self.PARTIAL
-
 
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, related_name="items", on_delete=models.CASCADE)
@@ -178,9 +248,14 @@ class CreditNote(models.Model):
 
     @property
     def amount(self):
-        vat_factor = Decimal("1") + (self.sale.vat_rate / Decimal("100"))
+        return self.amount_for(self.items.all(), self.sale.vat_rate)
+
+    @staticmethod
+    def amount_for(items, vat_rate):
+        """VAT-inclusive credit for returned lines at the sale's VAT rate."""
+        vat_factor = Decimal("1") + (vat_rate / Decimal("100"))
         total = Decimal("0")
-        for item in self.items.all():
+        for item in items:
             total += item.quantity * item.unit_price * vat_factor
         return total.quantize(Decimal("0.01"))
 
@@ -240,3 +315,53 @@ class Refund(models.Model):
 
     def __str__(self):
         return f"Refund {self.amount} ({self.get_method_display()}) on {self.sale}"
+
+
+class DailySalesRollup(models.Model):
+    """Sales, returns and money movements summed per day.
+
+    Rows are keyed by business date, payment method, salesperson and till.
+    Invoice and credit figures are not tied to a payment method and are kept
+    on the row with a blank method. The sales services move these figures in
+    the same transaction as the write they summarise, and
+    `rebuild_sales_rollups` recomputes them from the underlying rows.
+    """
+    date = models.DateField()
+    method = models.CharField(
+        max_length=20, choices=Payment.METHOD_CHOICES, blank=True, default=""
+    )
+    user = models.ForeignKey(
+        CustomUser, related_name="sales_rollups", on_delete=models.SET_NULL,
+        blank=True, null=True,
+    )
+    # The salesperson's id, or 0 without one. Unlike ``user`` it is never
+    # NULL, so the unique key holds for unattributed sales too, and it
+    # survives the user's deletion.
+    user_key = models.PositiveBigIntegerField(default=0)
+    device_id = models.CharField(max_length=100, blank=True, default="")
+
+    sale_count = models.IntegerField(default=0)
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credited_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+    payments_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refund_count = models.IntegerField(default=0)
+    refunds_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    FIGURES = (
+        "sale_count", "sales_total", "credited_total", "payment_count",
+        "payments_total", "refund_count", "refunds_total",
+    )
+
+    class Meta:
+        ordering = ["-date", "method"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "method", "user_key", "device_id"],
+                name="unique_daily_sales_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.method or 'invoices'} {self.user_id or '-'} {self.device_id or '-'}"
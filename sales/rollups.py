@@ -0,0 +1,202 @@
+"""Incremental maintenance of the ``DailySalesRollup`` table.
+
+The sales services call these helpers inside their own transaction, so a
+rollup row only moves when the sale, payment, refund or credit note it
+summarises is committed. Each helper works out the figures a row contributes
+to its (date, method, salesperson, device) keys and adds them with
+``F()`` updates, which keeps concurrent tills from losing each other's
+increments.
+
+``rebuild`` recomputes a date range from the underlying rows for the
+``rebuild_sales_rollups`` command, and ``summarize`` is the read side used by
+the operations summary and the daily sales report.
+"""
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils.timezone import localtime, now
+
+from .models import CreditNote, DailySalesRollup, Payment, Refund, Sale
+
+
+def _key(day, sale, method=""):
+    return (day, method, sale.user_id, sale.device_id or "")
+
+
+def _merge(*parts):
+    merged = defaultdict(lambda: defaultdict(int))
+    for part in parts:
+        for key, figures in part.items():
+            for name, amount in figures.items():
+                merged[key][name] += amount
+    return merged
+
+
+def sale_figures(sale, sign=1):
+    return {_key(sale.date, sale): {"sale_count": sign, "sales_total": sign * sale.total}}
+
+
+def payment_figures(payment, sale, sign=1):
+    return {_key(payment.date, sale, payment.method): {
+        "payment_count": sign, "payments_total": sign * payment.amount,
+    }}
+
+
+def refund_figures(refund, sale, sign=1):
+    return {_key(refund.date, sale, refund.method): {
+        "refund_count": sign, "refunds_total": sign * refund.amount,
+    }}
+
+
+def credit_figures(note, sale, amount, sign=1):
+    return {_key(localtime(note.created_at).date(), sale): {"credited_total": sign * amount}}
+
+
+def apply(figures):
+    """Add per-key figure deltas to their rollup rows, creating missing rows.
+
+    Rows are touched in key order so two transactions updating the same
+    rows cannot deadlock.
+    """
+    for key in sorted(figures, key=repr):
+        day, method, user_id, device_id = key
+        deltas = {name: amount for name, amount in figures[key].items() if amount}
+        if not deltas:
+            continue
+        lookup = {"date": day, "method": method, "user_key": user_id or 0, "device_id": device_id}
+        rows = DailySalesRollup.objects.filter(**lookup).values_list("pk", flat=True)
+        pk = rows.first()
+        if pk is None:
+            try:
+                with transaction.atomic():
+                    DailySalesRollup.objects.create(user_id=user_id, **lookup, **deltas)
+                continue
+            except IntegrityError:
+                # Another till created the row first.
+                pk = rows.get()
+        DailySalesRollup.objects.filter(pk=pk).update(
+            **{name: F(name) + amount for name, amount in deltas.items()}, updated_at=now()
+        )
+
+
+def record_sale(sale, payment=None):
+    parts = [sale_figures(sale)]
+    if payment is not None:
+        parts.append(payment_figures(payment, sale))
+    apply(_merge(*parts))
+
+
+def record_payment(payment, sale):
+    apply(payment_figures(payment, sale))
+
+
+def record_refund(refund, sale):
+    apply(refund_figures(refund, sale))
+
+
+def record_credit_note(note, sale, amount):
+    apply(credit_figures(note, sale, amount))
+
+
+def remove_sale(sale):
+    """Take a sale and everything recorded against it out of the rollups."""
+    parts = [sale_figures(sale, sign=-1)]
+    parts.extend(payment_figures(payment, sale, sign=-1) for payment in sale.payments.all())
+    parts.extend(refund_figures(refund, sale, sign=-1) for refund in sale.refunds.all())
+    parts.extend(
+        credit_figures(
+            note, sale, CreditNote.amount_for(note.items.all(), sale.vat_rate), sign=-1
+        )
+        for note in sale.credit_notes.prefetch_related("items")
+    )
+    apply(_merge(*parts))
+
+
+def _in_range(queryset, field, date_from, date_to):
+    if date_from is not None:
+        queryset = queryset.filter(**{f"{field}__gte": date_from})
+    if date_to is not None:
+        queryset = queryset.filter(**{f"{field}__lte": date_to})
+    return queryset
+
+
+def expected(date_from=None, date_to=None):
+    """Rollup figures recomputed from sales, payments, refunds and credit notes."""
+    figures = defaultdict(lambda: defaultdict(int))
+    sales = _in_range(Sale.objects.all(), "date", date_from, date_to)
+    for row in sales.values("date", "user", "device_id").annotate(
+        count=Count("id"), total=Sum("total")
+    ).order_by():
+        key = (row["date"], "", row["user"], row["device_id"] or "")
+        figures[key]["sale_count"] += row["count"]
+        figures[key]["sales_total"] += row["total"]
+    for model, prefix in ((Payment, "payment"), (Refund, "refund")):
+        rows = _in_range(model.objects.all(), "date", date_from, date_to)
+        for row in rows.values("date", "method", "sale__user", "sale__device_id").annotate(
+            count=Count("id"), total=Sum("amount")
+        ).order_by():
+            key = (row["date"], row["method"], row["sale__user"], row["sale__device_id"] or "")
+            figures[key][f"{prefix}_count"] += row["count"]
+            figures[key][f"{prefix}s_total"] += row["total"]
+    notes = _in_range(
+        CreditNote.objects.select_related("sale").prefetch_related("items"),
+        "created_at__date", date_from, date_to,
+    )
+    for note in notes:
+        for key, credit in credit_figures(
+            note, note.sale, CreditNote.amount_for(note.items.all(), note.sale.vat_rate)
+        ).items():
+            figures[key]["credited_total"] += credit["credited_total"]
+    return {
+        key: {name: values.get(name, 0) for name in DailySalesRollup.FIGURES}
+        for key, values in figures.items()
+        if any(values.values())
+    }
+
+
+def stored(date_from=None, date_to=None):
+    """Rollup figures as currently stored, keyed like `expected`."""
+    rows = _in_range(DailySalesRollup.objects.all(), "date", date_from, date_to)
+    # Rows whose salesperson was deleted share a key, so they are summed.
+    return {
+        key: {name: values.get(name, 0) for name in DailySalesRollup.FIGURES}
+        for key, values in _merge(*(
+            {(row.date, row.method, row.user_id, row.device_id): {
+                name: getattr(row, name) for name in DailySalesRollup.FIGURES
+            }}
+            for row in rows
+        )).items()
+        if any(values.values())
+    }
+
+
+@transaction.atomic
+def rebuild(date_from=None, date_to=None):
+    """Replace the rollup rows in a date range with recomputed figures."""
+    figures = expected(date_from, date_to)
+    _in_range(DailySalesRollup.objects.all(), "date", date_from, date_to).delete()
+    DailySalesRollup.objects.bulk_create(
+        DailySalesRollup(
+            date=day, method=method, user_id=user_id, user_key=user_id or 0,
+            device_id=device_id, **values
+        )
+        for (day, method, user_id, device_id), values in figures.items()
+    )
+    return len(figures)
+
+
+def summarize(date_from=None, date_to=None, group_by=("date",)):
+    """Summed figures for a date range, one row per `group_by` combination."""
+    rows = _in_range(DailySalesRollup.objects.all(), "date", date_from, date_to)
+    sums = rows.values(*group_by).annotate(
+        **{f"sum_{name}": Sum(name) for name in DailySalesRollup.FIGURES}
+    ).order_by(*group_by)
+    return [
+        {
+            **{field: row[field] for field in group_by},
+            **{name: row[f"sum_{name}"] for name in DailySalesRollup.FIGURES},
+        }
+        for row in sums
+    ]
@@ -3,7 +3,9 @@ from rest_framework import serializers
 from inventory.models import Product
 from customers.models import Customer
 from .models import Sale, SaleItem, Payment, Refund, CreditNote, CreditNoteItem
-from .services import create_sale, create_credit_note, create_refund, credited_quantity
+from .services import (
+    create_sale, create_credit_note, create_payment, create_refund, credited_quantity,
+)
 
 
 class SaleItemSerializer(serializers.ModelSerializer):
@@ -22,6 +24,10 @@ class SaleItemSerializer(serializers.ModelSerializer):
         extra_kwargs = {"unit_price": {"required": False}}
 
     def get_returned_quantity(self, obj):
+        # Read querysets annotate this (see SaleViewSet.queryset); freshly
+        # created lines fall back to one aggregate.
+        if hasattr(obj, "returned_quantity"):
+            return obj.returned_quantity
         return credited_quantity(obj)
 
 
@@ -48,6 +54,15 @@ class PaymentSerializer(serializers.ModelSerializer):
             )
         return attrs
 
+    def create(self, validated_data):
+        return create_payment(
+            sale=validated_data["sale"],
+            amount=validated_data["amount"],
+            method=validated_data.get("method", Payment.CASH),
+            reference=validated_data.get("reference"),
+            date=validated_data.get("date"),
+        )
+
 
 class RefundSerializer(serializers.ModelSerializer):
     method_display = serializers.CharField(source="get_method_display", read_only=True)
@@ -174,3 +189,35 @@ class SaleSerializer(serializers.ModelSerializer):
             payment=payment,
         )
         return sale
+
+
+class SaleListSerializer(serializers.ModelSerializer):
+    """Compact invoice row for the sales directory.
+
+    Nested collections are opt-in through ``?expand=items,payments,...``;
+    the view passes the requested names in the ``expand`` context key and
+    prefetches only those relations.
+    """
+    customer_name = serializers.CharField(source="customer.name", read_only=True)
+
+    expandable_fields = {
+        "items": SaleItemSerializer,
+        "payments": PaymentSerializer,
+        "refunds": RefundSerializer,
+        "credit_notes": CreditNoteSerializer,
+    }
+
+    class Meta:
+        model = Sale
+        fields = [
+            "id", "client_sale_id", "invoice_number", "customer", "customer_name",
+            "date", "total", "receivable", "refund_due", "balance", "payment_status",
+            "offline_created", "inventory_attention", "pricing_attention",
+            "inventory_resolution", "created_at",
+        ]
+        read_only_fields = fields
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.context.get("expand", ()):
+            self.fields[name] = self.expandable_fields[name](many=True, read_only=True)
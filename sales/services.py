@@ -1,11 +1,15 @@
 from decimal import Decimal
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils.timezone import localtime, now
 from django.conf import settings
 from rest_framework.exceptions import ValidationError
 from inventory.models import Product, InventoryMovement, StockReservation
 from inventory.quantities import parse_quarter_quantity
+from inventory import reservations
+from inventory.services import save_stock_in_bulk
+from . import rollups
 from .models import Sale, SaleItem, Payment, Refund, CreditNote, CreditNoteItem
 
 
@@ -14,6 +18,31 @@ def credited_quantity(sale_item):
     return sale_item.credited_items.aggregate(t=Sum("quantity"))["t"] or Decimal("0")
 
 
+def returned_quantity_subquery():
+    """`credited_quantity` as an annotation for SaleItem querysets."""
+    returned = CreditNoteItem.objects.filter(sale_item=OuterRef("pk")).values(
+        "sale_item"
+    ).annotate(total=Sum("quantity")).values("total")
+    return Coalesce(
+        Subquery(returned),
+        Value(Decimal("0")),
+        output_field=DecimalField(max_digits=14, decimal_places=4),
+    )
+
+
+def apply_settlement(sale, *, paid=Decimal("0"), credited=Decimal("0"), refunded=Decimal("0")):
+    """Move a sale's stored running totals by the given amounts.
+
+    Callers hold the sale row lock (or created the sale in the current
+    transaction) so concurrent payments and refunds cannot lose updates.
+    """
+    sale.amount_paid += paid
+    sale.amount_credited += credited
+    sale.amount_refunded += refunded
+    sale.refresh_settlement()
+    sale.save(update_fields=[*Sale.SETTLEMENT_FIELDS, "updated_at"])
+
+
 @transaction.atomic
 def create_sale(*, user, customer, items, discount=Decimal("0"),
                 vat_rate=None, date=None, notes=None, client_sale_id=None,
@@ -50,33 +79,42 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
     elif not offline_created:
         sale.vat_rate = settings.DEFAULT_VAT_RATE
     sale.date = date if date is not None else localtime(sale.sold_at).date()
-    sale.save()
 
-    # Every stock-changing transaction locks product rows in primary-key
-    # order. This keeps multi-product checkouts and cart reservations from
-    # deadlocking each other when their input order differs.
-    sorted_items = sorted(items, key=lambda row: row["product"].pk)
-    seen_products = set()
-    for row in sorted_items:
+    # Validate every line before touching the database so the lock window
+    # below only covers the checks that need current stock.
+    quantities = {}
+    for row in items:
         product = row["product"]
-        if product.pk in seen_products:
+        if product.pk in quantities:
             raise ValidationError(f"{product.name} appears more than once in this sale.")
-        seen_products.add(product.pk)
         try:
-            quantity = parse_quarter_quantity(row["quantity"])
+            quantities[product.pk] = parse_quarter_quantity(row["quantity"])
         except ValueError as exc:
             raise ValidationError(str(exc)) from exc
+    requested_prices = {row["product"].pk: row.get("unit_price") for row in items}
 
-        # Lock the product row and respect stock held by other connected carts.
-        product = Product.objects.select_for_update().get(pk=product.pk)
-        reservation_query = StockReservation.objects.select_for_update().filter(
-            product=product, expires_at__gt=now()
+    # Every stock-changing transaction locks product rows in primary-key
+    # order. This keeps multi-product checkouts and cart reservations from
+    # deadlocking each other when their input order differs. All products
+    # are locked in one ordered query.
+    products = list(
+        Product.objects.select_for_update().filter(pk__in=quantities).order_by("pk")
+    )
+    if len(products) != len(quantities):
+        raise ValidationError("One or more products are no longer available.")
+
+    # Respect stock held by other connected carts. Reservation writers lock
+    # the same product rows first, so the maintained per-product totals read
+    # here are stable for the rest of this transaction.
+    holds = reservations.cart_holds(quantities, user=user, device_id=device_id)
+
+    sale_items = []
+    movements = []
+    for product in products:
+        quantity = quantities[product.pk]
+        reserved_elsewhere, own_reserved_quantity = holds.get(
+            product.pk, (Decimal("0"), Decimal("0"))
         )
-        own_reservation = reservation_query.filter(user=user, device_id=device_id) if device_id else reservation_query.none()
-        own_reserved_quantity = own_reservation.aggregate(total=Sum("quantity"))["total"] or Decimal("0")
-        reserved_elsewhere = reservation_query.exclude(
-            user=user, device_id=device_id
-        ).aggregate(total=Sum("quantity"))["total"] or Decimal("0")
         available_stock = product.stock - reserved_elsewhere
         reservation_covers_sale = own_reserved_quantity >= quantity
         if quantity > available_stock and not offline_created and not reservation_covers_sale:
@@ -84,7 +122,7 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
                 f"Not enough available stock for {product.name}: short by {quantity - available_stock} unit(s)."
             )
 
-        unit_price = row.get("unit_price")
+        unit_price = requested_prices[product.pk]
         if unit_price in (None, ""):
             unit_price = product.price
         else:
@@ -97,10 +135,11 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
                         f"The price for {product.name} changed. Refresh products and try again."
                     )
 
-        SaleItem.objects.create(sale=sale, product=product, quantity=quantity, unit_price=unit_price)
         product.stock -= quantity
-        product.save(update_fields=["stock", "updated_at"])
-        InventoryMovement.objects.create(
+        sale_items.append(
+            SaleItem(sale=sale, product=product, quantity=quantity, unit_price=unit_price)
+        )
+        movements.append(InventoryMovement(
             product=product,
             sale=sale,
             user=user,
@@ -111,20 +150,19 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
             device_id=device_id,
             event_at=sale.sold_at,
             synced_at=sale.synced_at,
-        )
+        ))
         # Offline sales are preserved, but consuming units promised to a live
         # cart is still an explicit reconciliation conflict even before the
         # physical count becomes negative.
         if product.stock < 0 or (offline_created and quantity > available_stock):
             sale.inventory_attention = True
-        own_reservation.delete()
 
-    sale.recalculate()
-    if sale.inventory_attention or sale.pricing_attention:
-        sale.save(update_fields=[
-            "inventory_attention", "pricing_attention", "updated_at"
-        ])
+    # Totals, flags and any payment taken at the till are settled in memory
+    # so the sale row is written once, with its invoice number, before the
+    # lines, stock and movements that reference it.
+    sale.recalculate(persist=False, items=sale_items)
 
+    amount = None
     if payment:
         amount = Decimal(str(payment.get("amount", "0")))
         method = payment.get("method", Payment.CASH)
@@ -137,13 +175,8 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
             amount = sale.total
         if amount > sale.total:
             raise ValidationError("Payment cannot be greater than the sale total.")
-        Payment.objects.create(
-            sale=sale,
-            amount=amount,
-            method=method,
-            reference=payment.get("reference") or None,
-            date=sale.date,
-        )
+        sale.amount_paid = amount
+        sale.refresh_settlement()
 
     # A walk-in has no name to collect a debt from, so the sale must be
     # settled in full at the till.
@@ -151,6 +184,28 @@ def create_sale(*, user, customer, items, discount=Decimal("0"),
         raise ValidationError(
             "Walk-in sales must be paid in full. Pick a named customer to sell on credit."
         )
+
+    sale.save()
+    SaleItem.objects.bulk_create(sale_items)
+    save_stock_in_bulk(products)
+    InventoryMovement.objects.bulk_create(movements)
+    if device_id:
+        released, _ = StockReservation.objects.filter(
+            user=user, device_id=device_id, product_id__in=quantities
+        ).delete()
+        if released:
+            reservations.refresh_totals(quantities)
+
+    initial_payment = None
+    if amount is not None:
+        initial_payment = Payment.objects.create(
+            sale=sale,
+            amount=amount,
+            method=method,
+            reference=payment.get("reference") or None,
+            date=sale.date,
+        )
+    rollups.record_sale(sale, payment=initial_payment)
     return sale, True
 
 
@@ -177,6 +232,7 @@ def delete_sale(sale):
                 device_id=sale.device_id,
                 note=f"Reversal of {sale.invoice_number}",
             )
+    rollups.remove_sale(sale)
     sale.delete()
 
 
@@ -186,8 +242,10 @@ def create_credit_note(*, sale, items, user=None, reason=None):
     if not items:
         raise ValidationError("A credit note must have at least one item.")
 
+    sale = Sale.objects.select_for_update().get(pk=sale.pk)
     note = CreditNote.objects.create(sale=sale, user=user, reason=reason)
 
+    credited_items = []
     for row in items:
         sale_item = row["sale_item"]
         try:
@@ -202,10 +260,10 @@ def create_credit_note(*, sale, items, user=None, reason=None):
                 f"Can return at most {returnable} unit(s) of {sale_item.product.name}."
             )
 
-        CreditNoteItem.objects.create(
+        credited_items.append(CreditNoteItem.objects.create(
             credit_note=note, sale_item=sale_item,
             quantity=quantity, unit_price=sale_item.unit_price,
-        )
+        ))
         product = Product.objects.select_for_update().get(pk=sale_item.product_id)
         product.stock += quantity
         product.save(update_fields=["stock", "updated_at"])
@@ -221,9 +279,35 @@ def create_credit_note(*, sale, items, user=None, reason=None):
             synced_at=now(),
         )
 
+    credited = CreditNote.amount_for(credited_items, sale.vat_rate)
+    apply_settlement(sale, credited=credited)
+    rollups.record_credit_note(note, sale, credited)
     return note
 
 
+@transaction.atomic
+def create_payment(*, sale, amount, method=Payment.CASH, reference=None, date=None):
+    """Record money received against a sale's outstanding balance."""
+    locked_sale = Sale.objects.select_for_update().get(pk=sale.pk)
+    amount = Decimal(str(amount))
+    if amount > locked_sale.receivable:
+        raise ValidationError(
+            {"amount": "Payment cannot be greater than the outstanding balance."}
+        )
+    payment = Payment(
+        sale=locked_sale,
+        amount=amount,
+        method=method,
+        reference=reference or None,
+    )
+    if date is not None:
+        payment.date = date
+    payment.save()
+    apply_settlement(locked_sale, paid=amount)
+    rollups.record_payment(payment, locked_sale)
+    return payment
+
+
 @transaction.atomic
 def create_refund(*, sale, amount, method, user=None, reference=None):
     """Record money paid back against a sale's current refund liability."""
@@ -237,10 +321,13 @@ def create_refund(*, sale, amount, method, user=None, reference=None):
         raise ValidationError(
             f"Refund cannot exceed the remaining refund due of {locked_sale.refund_due}."
         )
-    return Refund.objects.create(
+    refund = Refund.objects.create(
         sale=locked_sale,
         user=user,
         amount=amount,
         method=method,
         reference=reference or None,
     )
+    apply_settlement(locked_sale, refunded=amount)
+    rollups.record_refund(refund, locked_sale)
+    return refund
@@ -1,13 +1,29 @@
+import base64
+import io
+import json
+import re
 from datetime import date, timedelta
 from decimal import Decimal
-
-from django.test import TestCase
+from unittest import mock
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
 
+from api import metrics
 from users.models import CustomUser
 from customers.models import Customer
-from inventory.models import Product, StockReservation
-from .models import Sale, Refund
+from inventory.models import Product, StockReservation, StockReservationTotal
+from inventory.reservations import sweep_expired
+from . import rollups
+from .models import CreditNote, CreditNoteItem, DailySalesRollup, Payment, Refund, Sale
+from .services import create_sale
 from inventory.models import InventoryMovement
 
 
@@ -61,6 +77,42 @@ class SalesFlowTests(TestCase):
         self.assertEqual(data["results"][0]["id"], second["id"])
         self.assertNotEqual(first["id"], second["id"])
 
+    def test_sales_list_is_compact_unless_expanded(self):
+        self.create_sale(2)
+        lean = self.client_api.get("/api/v1/sales/").json()["results"][0]
+        self.assertEqual(lean["customer_name"], "Buyer")
+        self.assertEqual(lean["payment_status"], "pending")
+        self.assertNotIn("items", lean)
+        self.assertNotIn("payments", lean)
+
+        expanded = self.client_api.get("/api/v1/sales/?expand=items").json()["results"][0]
+        self.assertEqual(expanded["items"][0]["product_name"], "Rice 50kg")
+        self.assertNotIn("payments", expanded)
+        self.assertEqual(self.client_api.get("/api/v1/sales/?expand=ledger").status_code, 400)
+
+    def test_sales_directory_keyset_cursor_pages_forward_and_back(self):
+        created = [self.create_sale(1).json()["id"] for _ in range(5)]
+        first = self.client_api.get("/api/v1/sales/?cursor=&page_size=2").json()
+        self.assertEqual(first["count"], 5)
+        self.assertIsNone(first["previous"])
+
+        seen = [row["id"] for row in first["results"]]
+        page = first
+        while page["next"]:
+            page = self.client_api.get(page["next"]).json()
+            seen.extend(row["id"] for row in page["results"])
+        self.assertEqual(seen, sorted(created, reverse=True))
+
+        back = self.client_api.get(page["previous"]).json()
+        self.assertEqual([row["id"] for row in back["results"]], seen[2:4])
+
+        uncounted = self.client_api.get("/api/v1/sales/?cursor=&count=false").json()
+        self.assertIsNone(uncounted["count"])
+        paged = self.client_api.get("/api/v1/sales/?page=2&page_size=2&count=false").json()
+        self.assertEqual([row["id"] for row in paged["results"]], seen[2:4])
+        self.assertIsNone(paged["total_pages"])
+        self.assertIsNotNone(paged["next"])
+
     def test_quarter_sale_and_return_preserve_exact_stock_and_value(self):
         sale_response = self.create_sale("0.25")
         self.assertEqual(sale_response.status_code, 201)
@@ -135,6 +187,31 @@ class SalesFlowTests(TestCase):
         self.assertEqual(detail["return_status"], "partial")
         self.assertEqual(detail["payment_status"], "pending")
 
+    def test_sales_list_query_count_does_not_grow_with_page_size(self):
+        for _ in range(4):
+            sale = self.create_sale(2).json()
+            self.client_api.post("/api/v1/payments/", {
+                "sale": sale["id"], "amount": "2000", "method": "cash",
+            }, format="json")
+            self.client_api.post("/api/v1/credit-notes/", {
+                "sale": sale["id"],
+                "items": [{"sale_item": sale["items"][0]["id"], "quantity": 1}],
+            }, format="json")
+            self.client_api.post("/api/v1/refunds/", {
+                "sale": sale["id"], "amount": "500", "method": "cash",
+            }, format="json")
+
+        def list_queries(page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client_api.get(
+                    f"/api/v1/sales/?page_size={page_size}&expand=items,payments,refunds,credit_notes"
+                )
+            self.assertEqual(len(response.json()["results"]), page_size)
+            self.assertEqual(response.json()["results"][0]["items"][0]["returned_quantity"], 1)
+            return len(queries)
+
+        self.assertEqual(list_queries(1), list_queries(4))
+
     def test_unpaid_full_return_has_no_receivable_or_refund(self):
         sale = self.create_sale(3).json()
         item_id = sale["items"][0]["id"]
@@ -273,6 +350,48 @@ class SalesFlowTests(TestCase):
         self.assertEqual(Decimal(summary["outstanding_total"]), Decimal("10000.00"))
         self.assertEqual(Decimal(summary["refunds_due_total"]), Decimal("5000.00"))
 
+    def test_operations_summary_cost_does_not_grow_with_sales_history(self):
+        def summary_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client_api.get("/api/v1/operations-summary/")
+            self.assertEqual(response.status_code, 200)
+            return len(queries), response.json()
+
+        self.create_sale(1)
+        baseline, _ = summary_queries()
+        for _ in range(10):
+            self.create_sale(1)
+        grown, summary = summary_queries()
+        self.assertEqual(grown, baseline)
+        self.assertEqual(Decimal(summary["outstanding_total"]), Decimal("11000.00"))
+        self.assertEqual(summary["sale_count"], 11)
+
+    @override_settings(OPERATIONS_SUMMARY_CACHE_SECONDS=300)
+    def test_operations_summary_snapshot_is_patched_by_committed_writes(self):
+        cache.clear()
+        self.product.stock = 6
+        self.product.reorder_level = 5
+        self.product.save(update_fields=["stock", "reorder_level"])
+        before = self.client_api.get("/api/v1/operations-summary/").json()
+        self.assertEqual(before["low_stock_count"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = self.create_sale(2).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_api.post("/api/v1/payments/", {
+                "sale": sale["id"], "amount": "500", "method": "transfer",
+            }, format="json")
+
+        with self.assertNumQueries(0):
+            summary = self.client_api.get("/api/v1/operations-summary/").json()
+        self.assertEqual(summary["sale_count"], 1)
+        self.assertEqual(Decimal(summary["sales_total"]), Decimal("2000.00"))
+        self.assertEqual(Decimal(summary["payments"]["transfer"]), Decimal("500.00"))
+        self.assertEqual(Decimal(summary["outstanding_total"]), Decimal("1500.00"))
+        self.assertEqual(summary["low_stock_count"], 1)
+        cache.clear()
+        self.assertEqual(self.client_api.get("/api/v1/operations-summary/").json(), summary)
+
     def test_fully_returned_invoice_is_not_reported_as_overdue(self):
         old_date = date.today() - timedelta(days=30)
         sale = self.client_api.post("/api/v1/sales/", {
@@ -301,6 +420,56 @@ class SalesFlowTests(TestCase):
         self.assertIn("Rice 50kg", low_stock[0]["message"])
         self.assertEqual(low_stock[0]["link"], "/products?stock_status=low_stock")
 
+    def test_notifications_are_cursor_paginated_with_per_type_counts(self):
+        self.product.stock = 1
+        self.product.save(update_fields=["stock"])
+        for index in range(2):
+            Product.objects.create(name=f"Short {index}", price=Decimal("10"), stock=index)
+        old_date = date.today() - timedelta(days=30)
+        for _ in range(2):
+            self.client_api.post("/api/v1/sales/", {
+                "customer": self.customer.id,
+                "date": old_date.isoformat(),
+                "items": [{"product": self.product.id, "quantity": "0.25"}],
+            }, format="json")
+
+        seen = []
+        url = "/api/v1/notifications/?page_size=2"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client_api.get(url).json()
+            self.assertLessEqual(len(queries), 6)
+            self.assertLessEqual(len(page["items"]), 2)
+            self.assertEqual(page["counts"], {
+                "low_stock": 3, "stock_conflict": 0, "overdue_invoice": 2,
+            })
+            seen.extend(page["items"])
+            url = page["next"] and f"/api/v1/notifications/?page_size=2&cursor={page['next']}"
+
+        self.assertEqual([item["type"] for item in seen], ["low_stock"] * 3 + ["overdue_invoice"] * 2)
+        self.assertEqual(len({item["message"] for item in seen}), 5)
+
+    def test_notifications_reject_a_malformed_cursor(self):
+        response = self.client_api.get("/api/v1/notifications/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursors_are_rejected_not_queried(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        self.create_sale(1)
+        Product.objects.create(name="Salt", price=Decimal("100"), stock=1)
+        for url in (
+            f"/api/v1/sales/?cursor={cursor({'after': ['not-a-date', 1]})}",
+            f"/api/v1/sales/?cursor={cursor({'after': ['2026-01-01']})}",
+            f"/api/v1/sales/?cursor={cursor({'before': ['2026-01-01', None]})}",
+            f"/api/v1/sales/?cursor={cursor({'after': '2026-01-01'})}",
+            f"/api/v1/notifications/?cursor={cursor({'section': 'low_stock', 'after': ['lots', 'Salt']})}",
+        ):
+            response = self.client_api.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"cursor": "Invalid cursor."})
+
     def test_delete_sale_with_returns_does_not_double_restock(self):
         sale = self.create_sale(10).json()  # stock 25 -> 15
         item_id = sale["items"][0]["id"]
@@ -351,6 +520,53 @@ class SalesFlowTests(TestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 22)
 
+    def test_offline_queue_syncs_as_one_batch_with_per_sale_results(self):
+        synced = {
+            "client_sale_id": "0b6f5a3e-3f0d-4d8e-9a55-3a1c5d0f7e11",
+            "customer": self.customer.id,
+            "offline_created": True,
+            "device_id": "mum-phone",
+            "items": [{"product": self.product.id, "quantity": 2}],
+        }
+        self.client_api.post("/api/v1/sales/", synced, format="json")
+        fresh = {**synced, "client_sale_id": "5d2c9b8e-7a41-4f3b-b0c6-2e8f1a9d4c72",
+                 "items": [{"product": self.product.id, "quantity": 3}]}
+        conflicting = {**synced, "items": [{"product": self.product.id, "quantity": 5}]}
+        invalid = {**synced, "client_sale_id": "9a7e3c1b-6d5f-4e2a-8b0c-1f3d5e7a9b24",
+                   "items": [{"product": self.product.id, "quantity": "0.3"}]}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_api.post("/api/v1/sales/sync/", {
+                "sales": [synced, fresh, conflicting, invalid],
+            }, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [result["status"] for result in data["results"]],
+            ["duplicate", "created", "conflict", "error"],
+        )
+        self.assertEqual(
+            (data["created"], data["duplicate"], data["conflict"], data["error"]), (1, 1, 1, 1)
+        )
+        self.assertEqual(data["results"][1]["sale"]["client_sale_id"], fresh["client_sale_id"])
+        self.assertTrue(data["results"][3]["errors"])
+        lookups = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and '"client_sale_id" IN' in query["sql"]
+        ]
+        self.assertEqual(len(lookups), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 20)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_offline_batch_sync_requires_client_sale_ids(self):
+        response = self.client_api.post("/api/v1/sales/sync/", {
+            "sales": [{"customer": self.customer.id, "items": []}],
+        }, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Sale.objects.count(), 0)
+
     def test_offline_sale_records_real_sale_and_flags_negative_stock(self):
         res = self.client_api.post("/api/v1/sales/", {
             "client_sale_id": "7e0c6f5f-dc70-444b-8ce5-26b935f667fc",
@@ -423,6 +639,157 @@ class SalesFlowTests(TestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 0)
 
+    def test_reservation_totals_are_maintained_and_expired_holds_swept(self):
+        other = Product.objects.create(name="Beans", price=Decimal("500"), stock=10)
+        self.client_api.post("/api/v1/stock-reservations/", {
+            "device_id": "till-a",
+            "items": [
+                {"product": self.product.id, "quantity": 2},
+                {"product": other.id, "quantity": 1},
+            ],
+        }, format="json")
+        self.assertEqual(self.product.reservation_total.quantity, 2)
+        self.client_api.post("/api/v1/stock-reservations/", {
+            "device_id": "till-a",
+            "items": [{"product": self.product.id, "quantity": 3}],
+        }, format="json")
+        self.assertEqual(StockReservationTotal.objects.get(product=self.product).quantity, 3)
+        self.assertFalse(StockReservationTotal.objects.filter(product=other).exists())
+
+        # An expired hold elsewhere stops counting without any table-wide
+        # delete; only the product being checked is refreshed inline.
+        StockReservation.objects.update(expires_at=now() - timedelta(seconds=1))
+        StockReservationTotal.objects.update(next_expiry=now() - timedelta(seconds=1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_api.post("/api/v1/stock-reservations/", {
+                "device_id": "till-b",
+                "items": [{"product": other.id, "quantity": 10}],
+            }, format="json")
+        self.assertEqual(response.status_code, 200)
+        deletes = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("DELETE")
+        ]
+        self.assertTrue(all('"product_id" IN' in sql for sql in deletes))
+        self.assertTrue(StockReservation.objects.filter(product=self.product).exists())
+
+        before = metrics.snapshot()
+        out = io.StringIO()
+        with mock.patch("inventory.reservations.collect_change") as collect_change:
+            call_command("sweep_stock_reservations", stdout=out)
+        self.assertIn("1 product(s)", out.getvalue())
+        collect_change.assert_called_once_with(
+            ["reservations"], "reservation-sweep",
+            {"reservations": [{"id": self.product.id, "reserved": "0"}]},
+        )
+        after = metrics.snapshot()
+        self.assertEqual(after["reservation_sweep.runs"] - before["reservation_sweep.runs"], 1)
+        self.assertEqual(
+            after["reservation_sweep.reservations"] - before["reservation_sweep.reservations"], 1
+        )
+        self.assertFalse(StockReservation.objects.filter(product=self.product).exists())
+        self.assertFalse(StockReservationTotal.objects.filter(product=self.product).exists())
+
+    def test_swept_cart_lines_make_the_next_diff_resend_the_cart(self):
+        beans = Product.objects.create(name="Beans", price=Decimal("500"), stock=4)
+        created = self.client_api.post("/api/v1/stock-reservations/", {
+            "device_id": "sweep-till",
+            "items": [{"product": self.product.id, "quantity": 2}],
+        }, format="json").json()
+        StockReservation.objects.update(expires_at=now() - timedelta(seconds=1))
+        StockReservationTotal.objects.update(next_expiry=now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired(), [self.product.id])
+
+        scan = self.client_api.patch("/api/v1/stock-reservations/", {
+            "device_id": "sweep-till",
+            "version": created["version"],
+            "set": [{"product": beans.id, "quantity": 1}],
+        }, format="json")
+        self.assertEqual(scan.status_code, 409)
+        self.assertEqual(scan.json()["version"], created["version"] + 1)
+        self.assertEqual(scan.json()["items"], [])
+        self.assertFalse(StockReservation.objects.filter(device_id="sweep-till").exists())
+
+    def test_cart_whose_own_lines_lapsed_keeps_the_version_it_was_given(self):
+        beans = Product.objects.create(name="Beans", price=Decimal("500"), stock=4)
+        created = self.client_api.post("/api/v1/stock-reservations/", {
+            "device_id": "lapsed-till",
+            "items": [{"product": self.product.id, "quantity": 2}],
+        }, format="json").json()
+        StockReservation.objects.update(expires_at=now() - timedelta(seconds=1))
+        StockReservationTotal.objects.update(next_expiry=now() - timedelta(seconds=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client_api.patch("/api/v1/stock-reservations/", {
+                "device_id": "lapsed-till",
+                "version": created["version"],
+                "set": [{"product": beans.id, "quantity": 1}],
+            }, format="json")
+        self.assertEqual(first.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client_api.patch("/api/v1/stock-reservations/", {
+                "device_id": "lapsed-till",
+                "version": first.json()["version"],
+                "set": [{"product": beans.id, "quantity": 2}],
+            }, format="json")
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(
+            StockReservation.objects.filter(device_id="lapsed-till").count(), 2
+        )
+
+    def test_cart_diff_updates_lock_only_changed_lines_and_check_version(self):
+        other = Product.objects.create(name="Beans", price=Decimal("500"), stock=4)
+        created = self.client_api.post("/api/v1/stock-reservations/", {
+            "device_id": "diff-till",
+            "items": [{"product": self.product.id, "quantity": 2}],
+        }, format="json").json()
+        self.assertEqual(created["version"], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            scan = self.client_api.patch("/api/v1/stock-reservations/", {
+                "device_id": "diff-till",
+                "version": 1,
+                "set": [{"product": other.id, "quantity": 1}],
+            }, format="json")
+        self.assertEqual(scan.status_code, 200)
+        self.assertEqual(scan.json()["version"], 2)
+        self.assertEqual([line["product"] for line in scan.json()["reserved"]], [other.id])
+        product_locks = [
+            query["sql"] for query in queries.captured_queries
+            if 'FROM "inventory_product" WHERE "inventory_product"."id" IN' in query["sql"]
+        ]
+        self.assertTrue(product_locks)
+        locked = {
+            int(pk) for sql in product_locks
+            for pk in re.search(r"IN \(([^)]*)\)", sql).group(1).split(", ")
+        }
+        self.assertEqual(locked, {other.id})
+        self.assertEqual(
+            StockReservation.objects.filter(device_id="diff-till").count(), 2
+        )
+
+        stale = self.client_api.patch("/api/v1/stock-reservations/", {
+            "device_id": "diff-till", "version": 1, "remove": [other.id],
+        }, format="json")
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.json()["version"], 2)
+        self.assertEqual(len(stale.json()["items"]), 2)
+
+        removed = self.client_api.patch("/api/v1/stock-reservations/", {
+            "device_id": "diff-till", "version": 2, "remove": [other.id],
+        }, format="json")
+        self.assertEqual(removed.json()["removed"], [other.id])
+        self.assertFalse(StockReservationTotal.objects.filter(product=other).exists())
+        self.assertEqual(StockReservationTotal.objects.get(product=self.product).quantity, 2)
+
+        too_many = self.client_api.patch("/api/v1/stock-reservations/", {
+            "device_id": "diff-till", "version": 3,
+            "set": [{"product": other.id, "quantity": 5}],
+        }, format="json")
+        self.assertEqual(too_many.status_code, 409)
+        self.assertEqual(too_many.json()["conflicts"][0]["available"], 4)
+
     def test_connected_sale_cannot_use_stock_reserved_by_another_cart(self):
         self.product.stock = 1
         self.product.save(update_fields=["stock"])
@@ -615,6 +982,163 @@ class SalesFlowTests(TestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 25)
 
+    def test_settlement_totals_are_stored_and_rebuildable(self):
+        sale = self.create_sale(5).json()
+        self.client_api.post("/api/v1/payments/", {
+            "sale": sale["id"], "amount": "5000", "method": "cash",
+        }, format="json")
+        self.client_api.post("/api/v1/credit-notes/", {
+            "sale": sale["id"],
+            "items": [{"sale_item": sale["items"][0]["id"], "quantity": 2}],
+        }, format="json")
+        stored = Sale.objects.get(pk=sale["id"])
+        self.assertEqual(stored.amount_paid, Decimal("5000.00"))
+        self.assertEqual(stored.amount_credited, Decimal("2000.00"))
+        self.assertEqual(stored.refund_due, Decimal("2000.00"))
+        self.assertEqual(stored.payment_status, Sale.PAID)
+
+        Sale.objects.filter(pk=sale["id"]).update(amount_paid=0, refund_due=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_sale_settlements", "--verify", stdout=io.StringIO())
+        call_command("rebuild_sale_settlements", stdout=io.StringIO())
+        rebuilt = Sale.objects.get(pk=sale["id"])
+        self.assertEqual(rebuilt.amount_paid, Decimal("5000.00"))
+        self.assertEqual(rebuilt.refund_due, Decimal("2000.00"))
+        call_command("rebuild_sale_settlements", "--verify", stdout=io.StringIO())
+
+    def test_daily_rollups_follow_sales_payments_returns_and_deletes(self):
+        sale = self.create_sale(5).json()
+        self.client_api.post("/api/v1/payments/", {
+            "sale": sale["id"], "amount": "5000", "method": "transfer",
+        }, format="json")
+        self.client_api.post("/api/v1/credit-notes/", {
+            "sale": sale["id"],
+            "items": [{"sale_item": sale["items"][0]["id"], "quantity": 2}],
+        }, format="json")
+        self.client_api.post("/api/v1/refunds/", {
+            "sale": sale["id"], "amount": "500", "method": "cash",
+        }, format="json")
+        self.client_api.post("/api/v1/sales/", {
+            "customer": self.customer.id,
+            "items": [{"product": self.product.id, "quantity": 1}],
+            "initial_payment": {"amount": "1000", "method": "cash"},
+        }, format="json")
+
+        report = self.client_api.get("/api/v1/reports/daily-sales/?group_by=method").json()
+        by_method = {row["method"]: row for row in report["results"]}
+        self.assertEqual(by_method[""]["sale_count"], 2)
+        self.assertEqual(Decimal(by_method[""]["sales_total"]), Decimal("6000"))
+        self.assertEqual(Decimal(by_method[""]["credited_total"]), Decimal("2000"))
+        self.assertEqual(Decimal(by_method["transfer"]["payments_total"]), Decimal("5000"))
+        self.assertEqual(Decimal(by_method["cash"]["payments_total"]), Decimal("1000"))
+        self.assertEqual(Decimal(by_method["cash"]["refunds_total"]), Decimal("500"))
+        self.assertEqual(report["totals"]["payment_count"], 2)
+        self.assertEqual(
+            self.client_api.get("/api/v1/operations-summary/").json()["payments"]["transfer"],
+            "5000.00",
+        )
+        call_command("rebuild_sales_rollups", "--verify", stdout=io.StringIO())
+
+        self.assertEqual(self.client_api.delete(f"/api/v1/sales/{sale['id']}/").status_code, 204)
+        totals = self.client_api.get("/api/v1/reports/daily-sales/").json()["totals"]
+        self.assertEqual(totals["sale_count"], 1)
+        self.assertEqual(Decimal(totals["credited_total"]), Decimal("0"))
+        self.assertEqual(Decimal(totals["refunds_total"]), Decimal("0"))
+        call_command("rebuild_sales_rollups", "--verify", stdout=io.StringIO())
+
+        DailySalesRollup.objects.update(sales_total=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_sales_rollups", "--verify", stdout=io.StringIO())
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        call_command("rebuild_sales_rollups", "--verify", stdout=io.StringIO())
+        self.assertEqual(
+            self.client_api.get("/api/v1/reports/daily-sales/?group_by=bogus").status_code, 400
+        )
+
+    def test_admin_cannot_write_rows_that_move_settlements(self):
+        request = RequestFactory().get("/admin/")
+        request.user = self.admin
+        for model in (Payment, Refund, CreditNote, CreditNoteItem):
+            model_admin = admin.site._registry[model]
+            self.assertFalse(model_admin.has_add_permission(request))
+            self.assertFalse(model_admin.has_change_permission(request))
+            self.assertFalse(model_admin.has_delete_permission(request))
+        sale_admin = admin.site._registry[Sale]
+        self.assertFalse(sale_admin.has_delete_permission(request))
+        for inline in sale_admin.get_inline_instances(request):
+            self.assertFalse(inline.has_add_permission(request, None))
+            self.assertFalse(inline.has_change_permission(request))
+
+    def test_rollups_without_a_salesperson_share_one_row(self):
+        today = now().date()
+        key = (today, "cash", None, "till-9")
+        rollups.apply({key: {"payment_count": 1, "payments_total": Decimal("100")}})
+        rollups.apply({key: {"payment_count": 1, "payments_total": Decimal("50")}})
+        row = DailySalesRollup.objects.get()
+        self.assertEqual((row.user_id, row.user_key), (None, 0))
+        self.assertEqual((row.payment_count, row.payments_total), (2, Decimal("150")))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailySalesRollup.objects.create(date=today, method="cash", device_id="till-9")
+
+    def test_checkout_query_count_does_not_grow_with_cart_size(self):
+        products = [
+            Product.objects.create(name=f"Line {index}", price=Decimal("100"), stock=10)
+            for index in range(6)
+        ]
+
+        def checkout(lines):
+            with CaptureQueriesContext(connection) as queries:
+                create_sale(
+                    user=self.admin, customer=self.customer, device_id="till-1",
+                    items=[{"product": product, "quantity": 1} for product in lines],
+                )
+            return len(queries)
+
+        # The first sale of the day also creates its rollup row.
+        checkout(products[:1])
+        self.assertEqual(checkout(products[1:2]), checkout(products[2:]))
+        self.assertEqual(InventoryMovement.objects.filter(reason=InventoryMovement.SALE).count(), 6)
+        self.assertEqual(
+            sorted(Product.objects.filter(pk__in=[p.pk for p in products]).values_list("stock", flat=True)),
+            [Decimal("9.0000")] * 6,
+        )
+
+    def test_sale_is_written_once_with_a_gap_free_invoice_number(self):
+        def sale_writes(**kwargs):
+            with CaptureQueriesContext(connection) as queries:
+                sale, _ = create_sale(
+                    user=self.admin, customer=self.customer,
+                    items=[{"product": self.product, "quantity": 1}], **kwargs,
+                )
+            statements = [query["sql"] for query in queries.captured_queries]
+            return sale, (
+                sum(sql.startswith('INSERT INTO "sales_sale"') for sql in statements),
+                sum(sql.startswith('UPDATE "sales_sale"') for sql in statements),
+            )
+
+        first, writes = sale_writes()
+        self.assertEqual(writes, (1, 0))
+        self.assertEqual(first.total, Decimal("1000.00"))
+        self.assertEqual(first.payment_status, Sale.PENDING)
+
+        # A rejected sale does not use up a number.
+        with self.assertRaises(ValidationError):
+            create_sale(
+                user=self.admin, customer=self.customer,
+                items=[{"product": self.product, "quantity": 1}],
+                payment={"amount": "5000", "method": "cash"},
+            )
+
+        paid, writes = sale_writes(payment={"amount": "1000", "method": "cash"})
+        self.assertEqual(writes, (1, 0))
+        self.assertEqual(paid.payment_status, Sale.PAID)
+        self.assertEqual(paid.payments.get().amount, Decimal("1000.00"))
+        first_number = int(first.invoice_number.removeprefix("INV-"))
+        self.assertEqual(paid.invoice_number, f"INV-{first_number + 1:05d}")
+        stored = Sale.objects.get(pk=paid.pk)
+        self.assertEqual((stored.total, stored.amount_paid, stored.balance),
+                         (Decimal("1000.00"), Decimal("1000.00"), Decimal("0.00")))
+
     def test_offline_sale_and_payment_use_actual_lagos_sale_date(self):
         res = self.client_api.post("/api/v1/sales/", {
             "client_sale_id": "76592bce-9dfa-4c46-ae33-e3bf8cc20fcf",
@@ -1,23 +1,32 @@
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import status
 from rest_framework.response import Response
-from django.db import IntegrityError
+from rest_framework.views import APIView
+import uuid
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from decimal import Decimal, InvalidOperation
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.decorators import action
-from django.utils.timezone import now
+from rest_framework.exceptions import ValidationError
+from django.utils.timezone import localdate, now
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as filters
 
-from api.views import AuditLogMixin, CustomPagination
+from api.realtime import coalesce_changes
+from api.views import AuditLogMixin, ConditionalGetMixin, CustomPagination
 from inventory.models import AuditLog
 from users.permissions import AdminOnly
-from .models import Sale, Payment, Refund, CreditNote
+from . import rollups
+from .models import DailySalesRollup, Sale, SaleItem, Payment, Refund, CreditNote, CreditNoteItem
 from .serializers import (
-    SaleSerializer, PaymentSerializer, RefundSerializer, CreditNoteSerializer,
+    SaleSerializer, SaleListSerializer, PaymentSerializer, RefundSerializer,
+    CreditNoteSerializer,
 )
-from .services import delete_sale
+from .services import delete_sale, returned_quantity_subquery
 
 
 class SalesAccess(BasePermission):
@@ -41,8 +50,26 @@ class SaleFilter(filters.FilterSet):
 
 class SaleViewSet(AuditLogMixin, ModelViewSet):
     """Sales: list (paginated, ?customer=<id> filter), detail, create, delete."""
+    SYNC_BATCH_LIMIT = 500
+    # Prefetches per nested collection, shared by the full detail
+    # representation and ?expand= on the list.
+    PREFETCHES = {
+        "items": Prefetch(
+            "items",
+            queryset=SaleItem.objects.select_related("product").annotate(
+                returned_quantity=returned_quantity_subquery()
+            ),
+        ),
+        "payments": Prefetch("payments"),
+        "refunds": Prefetch("refunds", queryset=Refund.objects.select_related("user")),
+        "credit_notes": Prefetch(
+            "credit_notes__items",
+            queryset=CreditNoteItem.objects.select_related("sale_item__product"),
+        ),
+    }
+
     queryset = Sale.objects.select_related("customer", "user").prefetch_related(
-        "items__product", "payments", "refunds", "credit_notes__items"
+        *PREFETCHES.values()
     ).all()
     serializer_class = SaleSerializer
     permission_classes = [SalesAccess]
@@ -52,8 +79,37 @@ class SaleViewSet(AuditLogMixin, ModelViewSet):
     search_fields = ["invoice_number", "customer__name"]
     ordering_fields = ["date", "created_at", "invoice_number"]
     ordering = ["-date", "-id"]
+    cursor_ordering = ("-date", "-id")
     http_method_names = ["get", "post", "delete", "head", "options"]
 
+    def _expand(self):
+        raw = self.request.query_params.get("expand", "")
+        names = [name.strip() for name in raw.split(",") if name.strip()]
+        unknown = set(names) - set(self.PREFETCHES)
+        if unknown:
+            raise ValidationError({
+                "expand": f"Unknown expansion: {', '.join(sorted(unknown))}."
+            })
+        return list(dict.fromkeys(names))
+
+    def get_queryset(self):
+        if self.action != "list":
+            return super().get_queryset()
+        return Sale.objects.select_related("customer").prefetch_related(
+            *(self.PREFETCHES[name] for name in self._expand())
+        )
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return SaleListSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == "list":
+            context["expand"] = self._expand()
+        return context
+
     def _same_idempotent_request(self, sale, data):
         try:
             if int(data.get("customer")) != sale.customer_id:
@@ -102,6 +158,81 @@ class SaleViewSet(AuditLogMixin, ModelViewSet):
                 return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
             raise
 
+    @action(detail=False, methods=["post"], url_path="sync")
+    def sync(self, request):
+        """Replay a queue of offline sales in one request.
+
+        Accepts ``{"sales": [...]}`` (or a bare list) of sale payloads, each
+        with its ``client_sale_id``. Known IDs are looked up in one query;
+        the rest go through the normal sale rules, one transaction per sale,
+        so a rejected sale never blocks the ones after it. Realtime change
+        events for the whole batch go out as a single event.
+        """
+        payloads = request.data.get("sales") if isinstance(request.data, dict) else request.data
+        if not isinstance(payloads, list) or not payloads:
+            raise ValidationError({"sales": "Send a non-empty list of sales."})
+        if len(payloads) > self.SYNC_BATCH_LIMIT:
+            raise ValidationError({
+                "sales": f"Send at most {self.SYNC_BATCH_LIMIT} sales per request."
+            })
+        client_ids = []
+        for payload in payloads:
+            try:
+                client_ids.append(uuid.UUID(str(payload["client_sale_id"])))
+            except (TypeError, KeyError, ValueError):
+                raise ValidationError({
+                    "sales": "Every sale needs a valid client_sale_id."
+                })
+
+        known = {
+            sale.client_sale_id: sale
+            for sale in Sale.objects.filter(client_sale_id__in=client_ids).prefetch_related("items")
+        }
+        results = []
+        with coalesce_changes("sale-sync"):
+            for client_sale_id, payload in zip(client_ids, payloads):
+                existing = known.get(client_sale_id)
+                if existing is None:
+                    serializer = SaleSerializer(data=payload, context=self.get_serializer_context())
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        with transaction.atomic():
+                            sale = serializer.save()
+                    except ValidationError as exc:
+                        results.append({
+                            "client_sale_id": client_sale_id, "status": "error",
+                            "errors": exc.detail,
+                        })
+                        continue
+                    except IntegrityError:
+                        existing = Sale.objects.filter(client_sale_id=client_sale_id).first()
+                        if existing is None:
+                            raise
+                    else:
+                        self._log(AuditLog.CREATE, sale, {"after": self._snapshot(sale)})
+                        known[client_sale_id] = sale
+                        results.append({
+                            "client_sale_id": client_sale_id, "status": "created",
+                            "sale": SaleListSerializer(sale).data,
+                        })
+                        continue
+                if self._same_idempotent_request(existing, payload):
+                    results.append({
+                        "client_sale_id": client_sale_id, "status": "duplicate",
+                        "sale": SaleListSerializer(existing).data,
+                    })
+                else:
+                    results.append({
+                        "client_sale_id": client_sale_id, "status": "conflict",
+                        "detail": "This sale reference was already used for different sale data.",
+                    })
+
+        summary = {
+            outcome: sum(1 for result in results if result["status"] == outcome)
+            for outcome in ("created", "duplicate", "conflict", "error")
+        }
+        return Response({**summary, "results": results})
+
     def perform_destroy(self, instance):
         instance._acting_user = self.request.user
         self._log(AuditLog.DELETE, instance)
@@ -167,3 +298,49 @@ class CreditNoteViewSet(AuditLogMixin, ModelViewSet):
     serializer_class = CreditNoteSerializer
     permission_classes = [AdminOnly]
     http_method_names = ["post", "head", "options"]
+
+
+class DailySalesReportView(ConditionalGetMixin, APIView):
+    """Sales, returns and takings over a date range, read from the daily rollups.
+
+    ``?date_from=`` and ``?date_to=`` default to the last 30 days, and
+    ``?group_by=`` takes any of date, method, user and device.
+    """
+    permission_classes = [AdminOnly]
+    etag_resources = ("sales",)
+    etag_daily = True
+    DEFAULT_DAYS = 30
+    GROUPS = {"date": "date", "method": "method", "user": "user", "device": "device_id"}
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            date_to = date.fromisoformat(params["date_to"]) if params.get("date_to") else localdate()
+            date_from = (
+                date.fromisoformat(params["date_from"]) if params.get("date_from")
+                else date_to - timedelta(days=self.DEFAULT_DAYS - 1)
+            )
+        except ValueError:
+            raise ValidationError({"detail": "date_from and date_to must be YYYY-MM-DD dates."})
+        if date_from > date_to:
+            raise ValidationError({"detail": "date_from must not be after date_to."})
+
+        names = [name.strip() for name in params.get("group_by", "date").split(",") if name.strip()]
+        unknown = set(names) - set(self.GROUPS)
+        if not names or unknown:
+            raise ValidationError({
+                "group_by": f"Group by any of: {', '.join(self.GROUPS)}."
+            })
+        group_by = [self.GROUPS[name] for name in dict.fromkeys(names)]
+
+        rows = rollups.summarize(date_from, date_to, group_by)
+        return Response({
+            "date_from": date_from,
+            "date_to": date_to,
+            "group_by": list(dict.fromkeys(names)),
+            "results": rows,
+            "totals": {
+                name: sum((row[name] for row in rows), 0)
+                for name in DailySalesRollup.FIGURES
+            },
+        })